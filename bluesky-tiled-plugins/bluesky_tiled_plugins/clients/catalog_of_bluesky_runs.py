@@ -10,7 +10,7 @@ from tiled.client.utils import handle_error
 from tiled.queries import Comparison, Eq, Like
 from tiled.utils import safe_json_dump
 
-from ..queries import RawMongo, ScanIDRange, TimeRange, _PartialUID, _ScanID
+from ..queries import EqAll, RawMongo, ScanIDRange, TimeRange, _PartialUID, _ScanID
 from .bluesky_run import BlueskyRunV2, BlueskyRunV3
 
 
@@ -193,6 +193,18 @@ class CatalogOfBlueskyRuns(Container):
             ge = Comparison("ge", "start.scan_id", query.start_id)
             lt = Comparison("lt", "start.scan_id", query.end_id)
             result = super().search(ge).search(lt)
+        elif isinstance(query, EqAll):
+            # Default to searching RunStart document.
+            values = {
+                (key if key.startswith(("start.", "stop.")) else f"start.{key}"): value
+                for key, value in query.values.items()
+            }
+            if self.is_sql:
+                # Apply the equivalent chain of Eq queries in one variation.
+                eqs = [Eq(key, value) for key, value in values.items()]
+                result = self.new_variation(queries=self._queries + eqs)
+            else:
+                result = super().search(EqAll(values))
         elif isinstance(query, dict):
             query = RawMongo(start=query)
             result = super().search(query)
@@ -1,9 +1,45 @@
+import bisect
 import copy
+import heapq
+import itertools
 import json
+import operator
+import tempfile
+import zipfile
 from collections import defaultdict
+from contextlib import closing
 
+import numpy
+import pyarrow
+import pyarrow.ipc
+import pyarrow.parquet
+from tiled.ndslice import NDSlice
+from tiled.utils import ensure_awaitable
 
-async def json_seq_exporter(mimetype, adapter, metadata, filter_for_access):
+# Number of rows of the internal tables read and converted to Event documents at once
+ROWS_PER_CHUNK = 1000
+
+# Suggested maximum number of events in the EventPages of the JSON-Seq exporter, when paging is enabled
+EVENT_PAGE_SIZE = 1000
+
+# Maximum number of rows read at once by the Arrow, Parquet, and HDF5 exports (the record batches of the Arrow and
+# Parquet exports); each batch of the Arrow and Parquet exports holds the rows of all array columns of a stream
+# (e.g. detector images) in memory at once
+ROWS_PER_BATCH = 10_000
+
+# Keys of the schema metadata in the Arrow and Parquet exports
+RUN_METADATA_KEY = b"bluesky.run"
+STREAM_NAME_KEY = b"bluesky.stream"
+DESCRIPTOR_KEY = b"bluesky.descriptor"
+
+# Target size in bytes of the chunks of the datasets in the HDF5 export (before compression)
+HDF5_CHUNK_BYTES = 1024**2
+
+# Target size in bytes of the slabs of array data (e.g. detector images) copied to the HDF5 export at once
+HDF5_SLAB_BYTES = 64 * 1024**2
+
+
+async def json_seq_exporter(mimetype, adapter, metadata, filter_for_access, *, page_size=None):
     """Export BlueskyRun as newline-delimited sequence of JSON documents.
 
     This callback is to be configured on the server-side to enable exporting
@@ -11,7 +47,8 @@ async def json_seq_exporter(mimetype, adapter, metadata, filter_for_access):
 
     The resulting stream yields strings, each of which is a JSON document
     representing one of the standard Bluesky documents: start, descriptor,
-    event, stream_resource, stream_datum, and stop, in the appropriate order.
+    event (or event_page), stream_resource, stream_datum, and stop, in the
+    appropriate order.
 
     For example:
 
@@ -19,35 +56,32 @@ async def json_seq_exporter(mimetype, adapter, metadata, filter_for_access):
     {"name": "start", "doc": {...}}
     {"name": "descriptor", "doc": {...}}
     {"name": "event", "doc": {...}}
+    ...
     {"name": "stream_resource", "doc": {...}}
     {"name": "stream_datum", "doc": {...}}
-    ...
     {"name": "stop", "doc": {...}}
     ```
-    """
-    for spec in adapter.specs:
-        if spec.name == "BlueskyRun" and spec.version.startswith("3."):
-            break
-    else:
-        raise ValueError("This exporter only works with BlueskyRun v3.x")
 
-    adapter = await filter_for_access(adapter)
+    By default, each row of the internal tables is emitted as an Event
+    document, followed by a single StreamDatum per data key at the end.
+    Paging is opt-in: with `page_size` set (e.g. to `EVENT_PAGE_SIZE`, with
+    `functools.partial` when registering the exporter), the rows are grouped
+    into EventPages of up to `page_size` rows, each preceded by StreamDatum
+    documents referencing the same range of rows of the external data of the
+    stream. Pages of different streams are ordered by the time of their first
+    event.
+    """
+    adapter, stream_names = await _lookup_streams(adapter, filter_for_access)
     yield json.dumps({"name": "start", "doc": metadata.get("start", {})})
-    result = []
+    sources = []  # Time-ordered iterators of descriptors and events, two per stream
+    resources = []  # Stream Resources and Stream Datums (for the entire streams)
 
     # Generate descriptors
-    stream_names = await adapter.keys_range(offset=0, limit=None)
-    if "streams" in stream_names:
-        # Check for backward compatibility with the old layout (with an intermediate "streams" node)
-        streams_adapter = await adapter.lookup_adapter(["streams"])
-        if "BlueskyEventStream" not in {s.name for s in streams_adapter.specs}:
-            adapter = streams_adapter
-            stream_names = await adapter.keys_range(offset=0, limit=None)
-
     for desc_name in stream_names:
         desc_node = await adapter.lookup_adapter([desc_name])
         desc_meta = desc_node.metadata()
         part_names = set(await desc_node.keys_range(offset=0, limit=None))  # Composite parts
+        descriptors = []
 
         # First (or the only) descriptor
         desc_doc = {k: v for k, v in desc_meta.items() if k not in {"_config_updates"}}
@@ -58,46 +92,34 @@ async def json_seq_exporter(mimetype, adapter, metadata, filter_for_access):
             if obj_name := val.get("object_name"):
                 desc_doc["object_keys"][obj_name].append(key)
 
-        result.append({"name": "descriptor", "doc": desc_doc})
+        descriptors.append({"name": "descriptor", "doc": desc_doc})
 
         # Process subsequent descriptors, if any
-        desc_time_uids = [{"uid": desc_doc["uid"], "time": desc_doc["time"]}]
         for upd in desc_meta.get("_config_updates", []):
             desc_doc = copy.deepcopy(desc_doc)
             desc_doc["uid"] = upd["uid"]
             desc_doc["time"] = upd["time"]
-            desc_time_uids.extend([{"uid": desc_doc["uid"], "time": desc_doc["time"]}])
             for obj_name, obj in upd.get("configuration", {}).items():
                 # This assumes that that the full configuration was present in the first descriptor
                 for key in obj["data"].keys():
                     desc_doc["configuration"][obj_name]["data"][key] = obj["data"][key]
                     desc_doc["configuration"][obj_name]["timestamps"][key] = obj["timestamps"][key]
 
-            result.append({"name": "descriptor", "doc": desc_doc})
-
-        # Generate events
-        if "internal" in part_names:
-            internal_node = await desc_node.lookup_adapter(["internal"])
-            df = await internal_node.read()
-            keys = [k for k in df.columns if k not in {"seq_num", "time"} and not k.startswith("ts_")]
-            for row in df.to_dict(orient="records"):
-                desc_uid = desc_time_uids[0]["uid"]  # same as desc_node.metadata()["uid"] if no updates
-                for _desc_uid_time in desc_time_uids[1:]:
-                    if _desc_uid_time["time"] <= row["time"]:
-                        desc_uid = _desc_uid_time["uid"]
-                event_doc = {"seq_num": row["seq_num"], "time": row["time"]}
-                event_doc["uid"] = f"event-{desc_uid}-{row['seq_num']}"  # can be anything (unique)
-                event_doc["descriptor"] = desc_uid
-                event_doc["data"] = {k: row[k].tolist() if hasattr(row[k], "__array__") else row[k] for k in keys}
-                event_doc["timestamps"] = {k: row[f"ts_{k}"] for k in keys}
-                result.append({"name": "event", "doc": event_doc})
+            descriptors.append({"name": "descriptor", "doc": desc_doc})
+
+        sources.append(_iterate([(desc["doc"]["time"], [desc]) for desc in descriptors]))
 
         # Generate Stream Resources and Datums
         desc_uid = desc_node.metadata()["uid"]
+        stream_resources = []
         for data_key in part_names.difference(("internal",)):
             # Loop over data_keys for external data only
             sres_uid = f"sr-{desc_uid}-{data_key}"  # can be anything (unique)
-            ds = (await desc_node.lookup_adapter([data_key])).data_sources[0]
+            data_sources = (await desc_node.lookup_adapter([data_key])).data_sources
+            if callable(data_sources):
+                # In recent versions of Tiled, the data sources (with their assets) are loaded on demand
+                data_sources = await data_sources(include_assets=True)
+            ds = data_sources[0]
             uri = ds.assets[0].data_uri
             for ast in ds.assets:
                 if ast.parameter in {"data_uris", "data_uri"}:
@@ -111,46 +133,628 @@ async def json_seq_exporter(mimetype, adapter, metadata, filter_for_access):
                 "parameters": ds.parameters,
                 "uri": uri,
             }
-            result.append({"name": "stream_resource", "doc": sres_doc})
 
-            # Generate a single stream_datum document for the entire stream
-            sdat_uid = f"sd-{desc_uid}-{data_key}-0"  # can be anything (unique)
+            # Number of datums (i.e. rows of the stream) in the external data
             total_shape = ds.structure.shape
             datum_shape = desc_node.metadata()["data_keys"][data_key]["shape"]
-
-            max_indx = (
-                total_shape[0] // datum_shape[0] - 1
-                if len(total_shape) == len(datum_shape)
-                else total_shape[0] - 1
+            num_datums = (
+                total_shape[0] // datum_shape[0] if len(total_shape) == len(datum_shape) else total_shape[0]
             )
-            sdat_doc = {
-                "uid": sdat_uid,
-                "stream_resource": sres_uid,
-                "descriptor": desc_uid,
-                "indices": {"start": 0, "stop": max_indx},
-                "seq_nums": {"start": 1, "stop": max_indx + 1},
-            }
-            result.append({"name": "stream_datum", "doc": sdat_doc})
-
-    # Make sure that the order of documents is (approximately) correct
-    result = sorted(
-        result,
-        key=lambda x: (
-            x["doc"].get("time", float("inf")),
-            {"stream_resource": 0, "stream_datum": 1}.get(x["name"]),
-        ),
-    )
+            stream_resources.append((sres_doc, num_datums))
 
-    # Combine events into event_pages
-    #     if modules_available("databroker"):
-    #         from databroker.mongo_normalized import batch_documents
-    #
-    #         result = [
-    #             {"name": x[0], "doc": x[1]}
-    #             for x in batch_documents([(y["name"], y["doc"]) for y in result], size=1000)
-    #         ]
+        # Generate events or event pages
+        internal_node = await desc_node.lookup_adapter(["internal"]) if "internal" in part_names else None
+        if page_size is None:
+            if internal_node is not None:
+                sources.append(_generate_events(internal_node, [d["doc"] for d in descriptors]))
 
-    for doc in result:
+            # Generate a single stream_datum document for the entire stream; emitted last
+            for sres_doc, num_datums in stream_resources:
+                sdat_doc = _stream_datum(sres_doc, desc_uid, 0, num_datums)
+                # For backward compatibility, the stop index and seq_num are inclusive here
+                sdat_doc["indices"]["stop"] -= 1
+                sdat_doc["seq_nums"]["stop"] -= 1
+                resources.append(
+                    ({"name": "stream_resource", "doc": sres_doc}, {"name": "stream_datum", "doc": sdat_doc})
+                )
+        else:
+            # Stream Resources are emitted right after the start document; Stream Datums along with the pages
+            for sres_doc, _ in stream_resources:
+                yield "\n" + json.dumps({"name": "stream_resource", "doc": sres_doc})
+            events = _generate_event_pages(
+                internal_node, [d["doc"] for d in descriptors], stream_resources, page_size=page_size
+            )
+            sources.append(events)
+
+    # Merge the descriptors and events from all streams in the order of time, emitting them as they are read;
+    # documents with equal time keep the order of the streams.
+    async for _, docs in _merge_by_time(sources, key=operator.itemgetter(0)):
+        for doc in docs:
+            yield "\n" + json.dumps(doc)
+    for doc in itertools.chain([sres for sres, _ in resources], [sdat for _, sdat in resources]):
         yield "\n" + json.dumps(doc)
 
     yield "\n" + json.dumps({"name": "stop", "doc": metadata.get("stop", {})})
+
+
+async def arrow_exporter(mimetype, adapter, metadata, filter_for_access, *, rows_per_batch=ROWS_PER_BATCH):
+    """Export BlueskyRun as a sequence of Arrow IPC streams, one table per event stream.
+
+    This callback is to be configured on the server-side to enable exporting
+    BlueskyRun objects in the Arrow IPC streaming format, e.g. with the
+    "application/vnd.apache.arrow.stream" mimetype.
+
+    The first IPC stream has no columns; its schema metadata holds the run
+    metadata (start and stop documents) as JSON under the "bluesky.run" key.
+    It is followed by one IPC stream per event stream, with the columns of the
+    internal table (data, timestamps, seq_num, and time) and of the array and
+    external data keys (as fixed-shape tensors); its schema metadata holds the
+    name of the stream and the descriptor (with its configuration updates).
+
+    The data are read from the adapters `rows_per_batch` rows at a time and
+    sent in record batches, without converting them to Python objects. Use
+    `read_arrow_export` to parse the result.
+    """
+    adapter, stream_names = await _lookup_streams(adapter, filter_for_access)
+    sink = _Sink()
+
+    with pyarrow.ipc.new_stream(sink, _run_schema(metadata)):
+        pass
+    yield sink.drain()
+
+    for desc_name in stream_names:
+        desc_node = await adapter.lookup_adapter([desc_name])
+        writer, schema = None, None
+        async for batch in _read_stream(desc_node, rows_per_batch):
+            if writer is None:
+                schema = batch.schema.with_metadata(_stream_metadata(desc_name, desc_node))
+                writer = pyarrow.ipc.new_stream(sink, schema)
+            writer.write_table(batch.cast(schema))
+            yield sink.drain()
+        if writer is not None:
+            writer.close()
+            yield sink.drain()
+
+
+async def parquet_exporter(mimetype, adapter, metadata, filter_for_access, *, rows_per_batch=ROWS_PER_BATCH):
+    """Export BlueskyRun as a zip archive of Parquet files, one per event stream.
+
+    This callback is to be configured on the server-side to enable exporting
+    BlueskyRun objects as Parquet, e.g. with the "application/zip" mimetype.
+
+    The archive contains "metadata.json", with the run metadata (start and stop
+    documents) and the descriptors of the streams, and a "<stream_name>.parquet"
+    file per event stream with the same columns (and schema metadata) as the
+    tables of `arrow_exporter`. The archive is streamed as it is written, one
+    record batch of up to `rows_per_batch` rows at a time.
+    """
+    adapter, stream_names = await _lookup_streams(adapter, filter_for_access)
+    sink = _Sink()
+    descriptors = {}
+
+    with zipfile.ZipFile(sink, mode="w", compression=zipfile.ZIP_STORED) as archive:
+        for desc_name in stream_names:
+            desc_node = await adapter.lookup_adapter([desc_name])
+            descriptors[desc_name] = desc_node.metadata()
+            writer, schema = None, None
+            async for batch in _read_stream(desc_node, rows_per_batch):
+                if writer is None:
+                    schema = batch.schema.with_metadata(_stream_metadata(desc_name, desc_node))
+                    file = archive.open(f"{desc_name}.parquet", mode="w", force_zip64=True)
+                    writer = pyarrow.parquet.ParquetWriter(file, schema)
+                writer.write_table(batch.cast(schema))
+                yield sink.drain()
+            if writer is not None:
+                writer.close()
+                file.close()
+        archive.writestr("metadata.json", json.dumps({**metadata, "descriptors": descriptors}))
+    yield sink.drain()
+
+
+def read_arrow_export(source):
+    """Parse the output of `arrow_exporter`.
+
+    Parameters
+    ----------
+        source : bytes or file-like object
+            The exported Arrow IPC streams.
+
+    Returns
+    -------
+        metadata : dict
+            The run metadata, with the start and stop documents.
+        tables : dict[str, pyarrow.Table]
+            The tables of the event streams by stream name; the descriptor of each stream is stored as JSON in the
+            "bluesky.descriptor" key of the schema metadata.
+    """
+    source = pyarrow.BufferReader(source) if isinstance(source, (bytes, bytearray, memoryview)) else source
+    metadata, tables = {}, {}
+    while True:
+        try:
+            reader = pyarrow.ipc.open_stream(source)
+        except pyarrow.ArrowInvalid:
+            break  # End of the input
+        table = reader.read_all()
+        schema_metadata = table.schema.metadata or {}
+        if RUN_METADATA_KEY in schema_metadata:
+            metadata = json.loads(schema_metadata[RUN_METADATA_KEY])
+        else:
+            tables[schema_metadata[STREAM_NAME_KEY].decode()] = table
+    return metadata, tables
+
+
+async def hdf5_exporter(mimetype, adapter, metadata, filter_for_access, *, rows_per_batch=ROWS_PER_BATCH):
+    """Export BlueskyRun as an HDF5 file.
+
+    This callback is to be configured on the server-side to enable exporting
+    BlueskyRun objects as HDF5, e.g. with the "application/x-hdf5" mimetype.
+    It requires h5py.
+
+    The file has the layout described in `HDF5RunWriter`. The internal tables
+    are copied `rows_per_batch` rows at a time and the array (internal or
+    external) data in slabs of whole chunks, so the memory used is bounded
+    regardless of the size of the run. The file is assembled in a temporary
+    file on the server and then streamed.
+    """
+    import h5py
+
+    adapter, stream_names = await _lookup_streams(adapter, filter_for_access)
+    with tempfile.TemporaryFile() as file:
+        with h5py.File(file, "w") as h5file:
+            writer = HDF5RunWriter(h5file)
+            writer.write_run(metadata.get("start", {}), metadata.get("stop", {}))
+            for desc_name in stream_names:
+                desc_node = await adapter.lookup_adapter([desc_name])
+                desc_meta = dict(desc_node.metadata())
+                writer.write_stream(desc_name, desc_meta, desc_meta.pop("_config_updates", []))
+
+                part_names = await desc_node.keys_range(offset=0, limit=None)
+                if "internal" in part_names:
+                    internal_node = await desc_node.lookup_adapter(["internal"])
+                    start = 0
+                    async for df in _read_rows(internal_node, rows_per_batch):
+                        for column in df.columns:
+                            writer.write(desc_name, column, df[column].to_numpy(), start)
+                        start += len(df)
+                for key in part_names:
+                    if key == "internal":
+                        continue
+                    node = await desc_node.lookup_adapter([key])
+                    structure = node.structure()
+                    dtype = structure.data_type.to_numpy_dtype()
+                    chunk_rows = structure.chunks[0][0] if structure.chunks and structure.chunks[0] else 1
+                    for start, stop in writer.slabs(structure.shape, dtype, chunk_rows):
+                        data = await node.read(NDSlice(slice(start, stop)))
+                        writer.write(desc_name, key, numpy.asarray(data), start)
+
+        file.seek(0)
+        while chunk := file.read(HDF5_CHUNK_BYTES):
+            yield chunk
+
+
+class HDF5RunWriter:
+    """Write the data of Bluesky runs to an HDF5 file, one column at a time.
+
+    This is used by `hdf5_exporter` on the server and by the `export` method of
+    the databroker v1 Broker on the client. The layout is NeXus-style:
+
+    ```
+    /<run uid>                      NXentry; attributes: start, stop (JSON)
+        /<stream name>              NXcollection; attributes: descriptor, configuration_updates (JSON)
+            time, seq_num           datasets, one row per event
+            /data/<data key>        datasets, one row per event
+            /timestamps/<data key>  datasets, one row per event
+    ```
+
+    The datasets are resizable, chunked (in chunks of about `HDF5_CHUNK_BYTES`
+    along the first dimension), and compressed; strings are stored as
+    variable-length UTF-8 strings.
+
+    Parameters
+    ----------
+        h5file : h5py.File or h5py.Group
+            The file (or group) to write to.
+        compression : str, optional
+            The compression filter of the datasets; "gzip" by default.
+        compression_opts : optional
+            The options of the compression filter, e.g. the gzip level.
+    """
+
+    def __init__(self, h5file, compression="gzip", compression_opts=4):
+        self._h5file = h5file
+        self._compression = compression
+        self._compression_opts = compression_opts
+        self._run_group = None
+
+    def write_run(self, start, stop=None):
+        """Create the group of a run; the following streams and data are written to it"""
+
+        self._run_group = self._h5file.create_group(start.get("uid", "run"))
+        self._run_group.attrs["NX_class"] = "NXentry"
+        self._run_group.attrs["start"] = json.dumps(start)
+        self._run_group.attrs["stop"] = json.dumps(stop or {})
+
+    def write_stream(self, stream_name, descriptor, configuration_updates=()):
+        """Create the group of a stream, with its (first) descriptor and the updates of its configuration"""
+
+        group = self._run_group.create_group(stream_name)
+        group.attrs["NX_class"] = "NXcollection"
+        group.attrs["descriptor"] = json.dumps(descriptor)
+        group.attrs["configuration_updates"] = json.dumps(list(configuration_updates))
+
+    def write(self, stream_name, key, data, offset=0):
+        """Write rows [offset, offset + len(data)) of a column of a stream, resizing its dataset as needed
+
+        Parameters
+        ----------
+            stream_name : str
+            key : str
+                The name of the column: a data key, "ts_<data key>" for its timestamps, "time", or "seq_num".
+            data : numpy.ndarray
+                The rows of the column; arrays of objects (e.g. lists or strings) are converted.
+            offset : int
+                The index of the first row.
+        """
+
+        if key in {"time", "seq_num"}:
+            path = key
+        elif key.startswith("ts_"):
+            path = f"timestamps/{key[3:]}"
+        else:
+            path = f"data/{key}"
+
+        data, dtype = _to_hdf5(data)
+        group = self._run_group[stream_name]
+        if path not in group:
+            row_shape = data.shape[1:]
+            row_nbytes = max(1, int(numpy.prod(row_shape)) * dtype.itemsize)
+            chunks = (max(1, HDF5_CHUNK_BYTES // row_nbytes), *row_shape) if all(row_shape) else None
+            group.create_dataset(
+                path,
+                shape=(0, *row_shape),
+                maxshape=(None, *row_shape),
+                dtype=dtype,
+                chunks=chunks,
+                compression=self._compression if chunks else None,
+                compression_opts=self._compression_opts if chunks else None,
+            )
+        dataset = group[path]
+        if offset + len(data) > dataset.shape[0]:
+            dataset.resize(offset + len(data), axis=0)
+        dataset[offset : offset + len(data)] = data
+
+    @staticmethod
+    def slabs(shape, dtype, chunk_rows=1):
+        """Ranges of rows of an array with the given shape and dtype to be copied at once
+
+        Each slab consists of whole chunks (of `chunk_rows` rows) of the source and has about `HDF5_SLAB_BYTES`.
+        """
+
+        row_nbytes = max(1, int(numpy.prod(shape[1:])) * numpy.dtype(dtype).itemsize)
+        chunk_rows = max(1, chunk_rows)
+        slab_rows = max(chunk_rows, HDF5_SLAB_BYTES // row_nbytes // chunk_rows * chunk_rows)
+        return [(start, min(start + slab_rows, shape[0])) for start in range(0, shape[0], slab_rows)]
+
+
+def _to_hdf5(data):
+    """Convert an array to a dtype supported by HDF5; return it with the dtype of its dataset"""
+
+    import h5py
+
+    if data.dtype.kind in "OU":
+        if data.dtype.kind == "O" and len(data) and not isinstance(data[0], str):
+            data = numpy.stack([numpy.asarray(value) for value in data])  # E.g. a column of lists
+            return data, data.dtype
+        return data.astype(object), h5py.string_dtype()
+    return data, data.dtype
+
+
+async def _lookup_streams(adapter, filter_for_access):
+    """Check the spec of a BlueskyRun and return the adapter of the container of its streams and their names"""
+
+    for spec in adapter.specs:
+        if spec.name == "BlueskyRun" and spec.version.startswith("3."):
+            break
+    else:
+        raise ValueError("This exporter only works with BlueskyRun v3.x")
+
+    adapter = await filter_for_access(adapter)
+    stream_names = await adapter.keys_range(offset=0, limit=None)
+    if "streams" in stream_names:
+        # Check for backward compatibility with the old layout (with an intermediate "streams" node)
+        streams_adapter = await adapter.lookup_adapter(["streams"])
+        if "BlueskyEventStream" not in {s.name for s in streams_adapter.specs}:
+            adapter = streams_adapter
+            stream_names = await adapter.keys_range(offset=0, limit=None)
+
+    return adapter, stream_names
+
+
+async def _read_stream(desc_node, rows_per_batch=ROWS_PER_BATCH):
+    """Read the data of a stream as pyarrow Tables of up to `rows_per_batch` rows
+
+    The columns of the internal table are followed by a column per array (internal or external) data key, read
+    for the same range of rows; arrays shorter than the table are padded with nulls.
+    """
+
+    part_names = await desc_node.keys_range(offset=0, limit=None)
+    arrays = {key: await desc_node.lookup_adapter([key]) for key in part_names if key != "internal"}
+
+    if "internal" in part_names:
+        internal_node = await desc_node.lookup_adapter(["internal"])
+        start = 0
+        async for df in _read_rows(internal_node, rows_per_batch):
+            batch = pyarrow.Table.from_pandas(df, preserve_index=False)
+            for key, column in (await _read_arrays(arrays, start, batch.num_rows)).items():
+                batch = batch.append_column(key, column)
+            yield batch
+            start += batch.num_rows
+    elif arrays:
+        num_rows = max(node.structure().shape[0] for node in arrays.values())
+        for start in range(0, num_rows, rows_per_batch):
+            yield pyarrow.table(await _read_arrays(arrays, start, min(rows_per_batch, num_rows - start)))
+
+
+async def _read_rows(internal_node, rows_per_batch):
+    """Read the internal table of a stream as DataFrames of up to `rows_per_batch` rows, in the order of the rows
+
+    Tables stored in SQL databases are queried one range of rows at a time, so that only a batch of rows is held
+    in memory. Other tables can only be read a whole partition at a time, which is then split into batches.
+    """
+
+    adapter = await internal_node.get_adapter() if hasattr(internal_node, "get_adapter") else internal_node
+    order_by = _sql_order_by(adapter)
+    for partition in range(internal_node.structure().npartitions):
+        if order_by is None:
+            df = await internal_node.read_partition(partition)
+            for offset in range(0, len(df), rows_per_batch):
+                yield df.iloc[offset : offset + rows_per_batch].reset_index(drop=True)
+            continue
+
+        offset = 0
+        while True:
+            table = await ensure_awaitable(_fetch_rows, adapter, partition, order_by, offset, rows_per_batch)
+            if table.num_rows:
+                yield table.to_pandas()
+            if table.num_rows < rows_per_batch:
+                break
+            offset += table.num_rows
+
+
+def _sql_order_by(adapter):
+    """Return the ORDER BY clause that fixes the order of the rows of a table in an SQL database, if possible
+
+    The rows are ordered as specified by the adapter or, for Bluesky event streams, by their sequence numbers;
+    None is returned if the adapter does not read from a database or the order of its rows is not defined.
+    """
+
+    try:
+        from tiled.adapters.sql import SQLAdapter
+    except ImportError:
+        return None
+    if not isinstance(adapter, SQLAdapter):
+        return None
+    order_by_args = adapter.order_by_args
+    if not order_by_args and "seq_num" in adapter.structure().columns:
+        order_by_args = [{"column": "seq_num", "direction": "asc"}]
+    if not order_by_args:
+        return None
+    return ", ".join(f'"{arg["column"].lower()}" {arg["direction"].upper()}' for arg in order_by_args)
+
+
+def _fetch_rows(adapter, partition, order_by, offset, limit):
+    """Query rows [offset, offset + limit) of a partition of a table stored in an SQL database
+
+    This mirrors the query of `SQLAdapter.read_partition`, with a range of rows, and returns a pyarrow Table.
+    """
+
+    schema = adapter.structure().arrow_schema_decoded
+    query = (
+        "SELECT " + ", ".join(f'"{name.lower()}"' for name in schema.names) + " "
+        f'FROM "{adapter.table_name}" '
+        f"WHERE _dataset_id={int(adapter.dataset_id)} AND _partition_id={int(partition)} "
+        f"ORDER BY {order_by} LIMIT {int(limit)} OFFSET {int(offset)}"
+    )
+    with closing(adapter.storage.connect()) as conn:
+        with conn.cursor() as cursor:
+            cursor.execute(query)
+            table = cursor.fetch_arrow_table()
+        conn.commit()
+
+    # Restore the original (not lower case) column names and data types, as stored in the structure
+    return table.rename_columns(schema.names).cast(schema)
+
+
+async def _read_arrays(arrays, start, num_rows):
+    """Read rows [start, start + num_rows) of the arrays as Arrow columns, padded with nulls if they are shorter"""
+
+    columns = {}
+    for key, node in arrays.items():
+        structure = node.structure()
+        shape, dtype = structure.shape, structure.data_type.to_numpy_dtype()
+        stop = min(start + num_rows, shape[0])
+        if stop > start:
+            column = pyarrow.chunked_array(
+                [_to_arrow(numpy.asarray(await node.read(NDSlice(slice(start, stop)))))]
+            )
+        else:
+            column = pyarrow.chunked_array([], type=_arrow_type(dtype, shape[1:]))
+        if len(column) < num_rows:
+            column = pyarrow.chunked_array([*column.chunks, pyarrow.nulls(num_rows - len(column), column.type)])
+        columns[key] = column
+    return columns
+
+
+def _arrow_type(dtype, shape):
+    value_type = pyarrow.from_numpy_dtype(dtype)
+    return pyarrow.fixed_shape_tensor(value_type, shape) if shape else value_type
+
+
+def _to_arrow(data):
+    if data.ndim == 1:
+        return pyarrow.array(data)
+    return pyarrow.FixedShapeTensorArray.from_numpy_ndarray(numpy.ascontiguousarray(data))
+
+
+def _run_schema(metadata):
+    return pyarrow.schema([], metadata={RUN_METADATA_KEY: json.dumps(dict(metadata))})
+
+
+def _stream_metadata(desc_name, desc_node):
+    return {STREAM_NAME_KEY: desc_name, DESCRIPTOR_KEY: json.dumps(dict(desc_node.metadata()))}
+
+
+class _Sink:
+    """Non-seekable file-like object collecting the bytes written to it until they are drained"""
+
+    def __init__(self):
+        self._chunks = []
+        self._position = 0
+
+    def write(self, data):
+        self._chunks.append(bytes(data))
+        self._position += len(data)
+        return len(data)
+
+    def tell(self):
+        return self._position
+
+    def flush(self):
+        pass
+
+    @property
+    def closed(self):
+        return False
+
+    def drain(self):
+        data = b"".join(self._chunks)
+        self._chunks.clear()
+        return data
+
+
+async def _iterate(items):
+    for item in items:
+        yield item
+
+
+async def _generate_events(internal_node, descriptors, rows_per_chunk=ROWS_PER_CHUNK):
+    """Generate Event documents from the internal table of a stream, reading `rows_per_chunk` rows at a time
+
+    Each Event refers to the latest descriptor (first one, or its update) recorded at or before its time.
+    """
+
+    desc_times = [desc["time"] for desc in descriptors[1:]]
+    keys = [
+        k for k in internal_node.structure().columns if k not in {"seq_num", "time"} and not k.startswith("ts_")
+    ]
+    async for df in _read_rows(internal_node, rows_per_chunk):
+        chunk = {col: _to_list(df[col]) for col in df.columns}
+        for i, (seq_num, time) in enumerate(zip(chunk["seq_num"], chunk["time"])):
+            desc_uid = descriptors[bisect.bisect_right(desc_times, time)]["uid"]
+            event_doc = {"seq_num": seq_num, "time": time}
+            event_doc["uid"] = f"event-{desc_uid}-{seq_num}"  # can be anything (unique)
+            event_doc["descriptor"] = desc_uid
+            event_doc["data"] = {k: chunk[k][i] for k in keys}
+            event_doc["timestamps"] = {k: chunk[f"ts_{k}"][i] for k in keys}
+            yield time, [{"name": "event", "doc": event_doc}]
+
+
+async def _generate_event_pages(internal_node, descriptors, stream_resources, page_size=EVENT_PAGE_SIZE):
+    """Generate EventPages, preceded by the StreamDatums for the same rows, from the internal table of a stream
+
+    The columns of each partition are converted to lists at once, a page at a time. A page is split where the
+    descriptor changes, so that all its events refer to the same descriptor. If the stream has no internal table,
+    only the StreamDatums are generated, in ranges of `page_size` rows, at the time of the first descriptor.
+    """
+
+    desc_times = [desc["time"] for desc in descriptors[1:]]
+    start = 0  # Index of the first row of the page in the stream
+    if internal_node is None:
+        num_rows = max((num_datums for _, num_datums in stream_resources), default=0)
+        for start in range(0, num_rows, page_size):
+            stop = min(start + page_size, num_rows)
+            yield descriptors[0]["time"], _stream_datums(stream_resources, descriptors[0]["uid"], start, stop)
+        return
+
+    for partition in range(internal_node.structure().npartitions):
+        df = await internal_node.read_partition(partition)
+        keys = [k for k in df.columns if k not in {"seq_num", "time"} and not k.startswith("ts_")]
+        times = df["time"].to_numpy()
+        # Index of the descriptor of each row; pages are split at the rows where it changes
+        desc_indices = numpy.searchsorted(desc_times, times, side="right")
+        splits = numpy.flatnonzero(numpy.diff(desc_indices)) + 1
+        for offset in range(0, len(df), page_size):
+            bounds = [offset, *splits[(splits > offset) & (splits < offset + page_size)].tolist()]
+            bounds.append(min(offset + page_size, len(df)))
+            for r0, r1 in zip(bounds[:-1], bounds[1:]):
+                desc_uid = descriptors[desc_indices[r0]]["uid"]
+                page = df.iloc[r0:r1]
+                seq_nums = page["seq_num"].tolist()
+                page_doc = {
+                    "descriptor": desc_uid,
+                    "uid": [f"event-{desc_uid}-{seq_num}" for seq_num in seq_nums],  # can be anything (unique)
+                    "seq_num": seq_nums,
+                    "time": page["time"].tolist(),
+                    "data": {k: _to_list(page[k]) for k in keys},
+                    "timestamps": {k: page[f"ts_{k}"].tolist() for k in keys},
+                    "filled": {},
+                }
+                docs = _stream_datums(stream_resources, desc_uid, start + r0, start + r1)
+                docs.append({"name": "event_page", "doc": page_doc})
+                yield page_doc["time"][0], docs
+        start += len(df)
+
+
+def _stream_datum(sres_doc, desc_uid, start, stop):
+    """Compose a StreamDatum document for the rows [start, stop) of the stream"""
+
+    return {
+        "uid": f"sd-{desc_uid}-{sres_doc['data_key']}-{start}",  # can be anything (unique)
+        "stream_resource": sres_doc["uid"],
+        "descriptor": desc_uid,
+        "indices": {"start": start, "stop": stop},
+        "seq_nums": {"start": start + 1, "stop": stop + 1},
+    }
+
+
+def _stream_datums(stream_resources, desc_uid, start, stop):
+    """StreamDatum documents for the rows [start, stop) of the stream, clipped to the length of external data"""
+
+    return [
+        {"name": "stream_datum", "doc": _stream_datum(sres_doc, desc_uid, start, min(stop, num_datums))}
+        for sres_doc, num_datums in stream_resources
+        if start < num_datums
+    ]
+
+
+def _to_list(column):
+    """Convert a column of a DataFrame to a list of JSON-serializable values"""
+
+    if column.dtype != object:
+        return column.tolist()
+    return [value.tolist() if hasattr(value, "__array__") else value for value in column]
+
+
+async def _merge_by_time(sources, key=lambda item: item["doc"]["time"]):
+    """K-way merge of asynchronous iterators of documents, each ordered by time, using a heap
+
+    Only the next document of each iterator is kept in memory. Ties are resolved by the order of the iterators.
+    The time of an item is given by the `key` function.
+    """
+
+    heap, counter = [], itertools.count()
+
+    async def _push(index, source):
+        try:
+            item = await source.__anext__()
+        except StopAsyncIteration:
+            return
+        heapq.heappush(heap, (key(item), index, next(counter), item, source))
+
+    for index, source in enumerate(sources):
+        await _push(index, source)
+
+    while heap:
+        _, index, _, item, source = heapq.heappop(heap)
+        yield item
+        await _push(index, source)
@@ -15,6 +15,7 @@ to support older clients querying against MongoDB-backed servers.
 """
 
 import enum
+import json
 import warnings
 from dataclasses import asdict, dataclass
 from typing import Optional
@@ -27,6 +28,7 @@ from tiled.queries import (  # noqa: F401
     Eq,
     FullText,
     In,
+    JSONSerializable,
     Key,
     NotEq,
     NotIn,
@@ -135,6 +137,37 @@ def PartialUID(*partial_uids):
     return _PartialUID(partial_uids)
 
 
+@register(name="eq_all")
+@dataclass
+class EqAll:
+    """
+    Query equality of several keys at once: the conjunction of one Eq per item.
+
+    This is applied as a single query, rather than as a chain of Eq queries.
+
+    Parameters
+    ----------
+    values : dict
+        Maps keys, e.g. "plan_name" or "start.sample.name", to values.
+
+    Examples
+    --------
+
+    Search for plan_name == "scan" and sample == "Au"
+
+    >>> c.search(EqAll({"plan_name": "scan", "sample": "Au"}))
+    """
+
+    values: JSONSerializable
+
+    def encode(self):
+        return {"values": json.dumps(self.values)}
+
+    @classmethod
+    def decode(cls, *, values):
+        return cls(values=json.loads(values))
+
+
 def RawMongo(start):
     """
     DEPRECATED
@@ -1,7 +1,11 @@
 import json
+import threading
+import time
 from datetime import datetime
 from pathlib import Path
-from typing import Optional
+from typing import BinaryIO, Optional
+
+from event_model import unpack_datum_page, unpack_event_page
 
 # NOTE: This code is duplicated in src/bluesky/callbacks/json_writer.py
 
@@ -44,23 +48,138 @@ class JSONWriter:
 class JSONLinesWriter:
     """Writer of Bluesky documents into a JSON Lines file
 
-    If the file already exists, new documents will be appended to it.
+    If the file already exists, new documents will be appended to it. The file is kept open with a buffered
+    handle while the run is being written; the buffer is flushed to disk when it is full, by a timer at most
+    `flush_interval` seconds after a document has been written, and after the Stop document, at which point the
+    file is closed. If writing a document fails, the documents written before it are flushed. The writer can be
+    used as a context manager, which closes the file on exit.
+
+    Parameters
+    ----------
+        dirname : str
+            The directory to write the file to.
+        filename : Optional[str]
+            The name of the file; if not specified, it is derived from the uid of the Start document (or the
+            current date if the first document is not a Start document).
+        flush_interval : float
+            Maximum time (in seconds) that written documents can be kept in the buffer before flushing it.
+        buffer_size : int
+            Size of the write buffer in bytes.
+        unpack_pages : bool
+            If True, EventPage and DatumPage documents are written as separate Event and Datum documents;
+            otherwise, they are written as received.
+        compression : Optional[str]
+            If "zstd", the output is compressed with Zstandard (requires the `zstandard` package) and the
+            extension ".zst" is added to the default filename. Each time the file is reopened, a new frame is
+            appended to it; concatenated frames are decompressed as a single stream.
     """
 
-    def __init__(self, dirname: str, filename: Optional[str] = None):
+    def __init__(
+        self,
+        dirname: str,
+        filename: Optional[str] = None,
+        *,
+        flush_interval: float = 1.0,
+        buffer_size: int = 1024**2,
+        unpack_pages: bool = False,
+        compression: Optional[str] = None,
+    ):
+        if compression not in (None, "zstd"):
+            raise ValueError(f"Unsupported compression {compression!r}; only 'zstd' is supported.")
         self.dirname = Path(dirname)
         self.filename = filename
+        self.flush_interval = flush_interval
+        self.buffer_size = buffer_size
+        self.unpack_pages = unpack_pages
+        self.compression = compression
+        self._file: Optional[BinaryIO] = None
+        self._last_flush = 0.0
+        self._timer: Optional[threading.Timer] = None  # Pending flush of the documents written
+        self._lock = threading.RLock()  # The buffer is flushed from the timer thread
+
+    def _open(self) -> BinaryIO:
+        file = open(self.dirname / self.filename, "ab", buffering=self.buffer_size)
+        if self.compression == "zstd":
+            try:
+                import zstandard
+            except ImportError as e:
+                file.close()
+                raise ImportError("Writing zstd-compressed JSON Lines requires the `zstandard` package.") from e
+            file = zstandard.ZstdCompressor().stream_writer(file, write_size=self.buffer_size)
+        self._last_flush = time.monotonic()
+        return file
+
+    def flush(self):
+        """Write the buffered documents to the file"""
+        with self._lock:
+            self._cancel_timer()
+            if self._file is not None:
+                if self.compression == "zstd":
+                    import zstandard
+
+                    self._file.flush(zstandard.FLUSH_BLOCK)  # Make the data written so far decompressible
+                else:
+                    self._file.flush()
+                self._last_flush = time.monotonic()
+
+    def close(self):
+        """Flush the buffer and close the file; it is reopened if more documents are received"""
+        with self._lock:
+            self._cancel_timer()
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc_info):
+        self.close()
+
+    def _cancel_timer(self):
+        if self._timer is not None:
+            self._timer.cancel()
+            self._timer = None
+
+    def _schedule_flush(self):
+        """Flush the buffer from a timer, unless it has been flushed recently or a flush is already scheduled"""
+        delay = self._last_flush + self.flush_interval - time.monotonic()
+        if delay <= 0:
+            self.flush()
+        elif self._timer is None:
+            self._timer = threading.Timer(delay, self.flush)
+            self._timer.daemon = True
+            self._timer.start()
 
     def __call__(self, name, doc):
+        with self._lock:
+            try:
+                self._write(name, doc)
+            except Exception:
+                self.flush()  # Keep the documents written so far
+                raise
+            if name == "stop":
+                self.close()
+            else:
+                self._schedule_flush()
+
+    def _write(self, name, doc):
         if not self.filename:
+            ext = ".jsonl.zst" if self.compression == "zstd" else ".jsonl"
             if name == "start":
                 # If the first document is a start document, use the uid to create a filename
-                self.filename = f"{doc['uid'].split('-')[0]}.jsonl"
+                self.filename = f"{doc['uid'].split('-')[0]}{ext}"
             else:
                 # If the first document is not a start document, use the current date
-                self.filename = f"{datetime.today().strftime('%Y-%m-%d')}.jsonl"
-        mode = "a" if (self.dirname / self.filename).exists() else "w"
+                self.filename = f"{datetime.today().strftime('%Y-%m-%d')}{ext}"
 
-        with open(self.dirname / self.filename, mode) as file:
-            json.dump({"name": name, "doc": doc}, file)
-            file.write("\n")
+        if self._file is None:
+            self._file = self._open()
+
+        if self.unpack_pages and name == "event_page":
+            items = [("event", _doc) for _doc in unpack_event_page(doc)]
+        elif self.unpack_pages and name == "datum_page":
+            items = [("datum", _doc) for _doc in unpack_datum_page(doc)]
+        else:
+            items = [(name, doc)]
+        self._file.write(b"".join(json.dumps({"name": n, "doc": d}).encode() + b"\n" for n, d in items))
@@ -0,0 +1,254 @@
+import bisect
+import contextvars
+import threading
+import time
+from collections import defaultdict
+from contextlib import contextmanager
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Optional
+
+import httpx
+
+# Upper bounds (in seconds) of the latency histogram buckets; the last, implicit, bucket is +Inf
+LATENCY_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# Prefix of the names of the metrics exported in the Prometheus text format
+PROMETHEUS_PREFIX = "bluesky_tiled_writer"
+
+# The metrics of the writer on whose behalf HTTP requests are sent in the current thread, if any
+_active_metrics: contextvars.ContextVar[Optional["WriterMetrics"]] = contextvars.ContextVar(
+    "active_metrics", default=None
+)
+_install_lock = threading.Lock()
+
+
+def _on_request(request: httpx.Request):
+    if (metrics := _active_metrics.get()) is not None:
+        request.extensions["writer_metrics"] = metrics
+        metrics._on_request(request)
+
+
+def _on_response(response: httpx.Response):
+    if (metrics := response.request.extensions.get("writer_metrics")) is not None:
+        metrics._on_response(response)
+
+
+class Histogram:
+    """Cumulative histogram of observed values with fixed bucket boundaries, as used by Prometheus"""
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self.buckets = buckets
+        self.counts = [0] * (len(buckets) + 1)  # The last bucket counts values above the largest boundary
+        self.count = 0
+        self.sum = 0.0
+        self.max = 0.0
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(self.buckets, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.max = max(self.max, value)
+
+    def quantile(self, q: float) -> float:
+        """Estimate a quantile as the upper boundary of the bucket it falls into"""
+        if not self.count:
+            return 0.0
+        rank, cumulative = q * self.count, 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            if cumulative >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def summary(self) -> dict[str, float]:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "mean": self.sum / self.count if self.count else 0.0,
+            "p50": self.quantile(0.5),
+            "p99": self.quantile(0.99),
+            "max": self.max,
+        }
+
+
+class WriterMetrics:
+    """Counters and latency histograms describing the work done by a TiledWriter
+
+    All methods are thread-safe and cheap (a lock and a few arithmetic operations per observation), so the metrics
+    can be collected in production. HTTP traffic is measured by event hooks installed on the httpx client of the
+    Tiled context with `install`; only the requests sent while the metrics are active (see `activate`) in the
+    sending thread are counted, so writers sharing a client do not count each other's requests.
+
+    Parameters
+    ----------
+        buckets : tuple[float, ...]
+            Upper bounds (in seconds) of the latency histogram buckets.
+    """
+
+    def __init__(self, buckets: tuple[float, ...] = LATENCY_BUCKETS):
+        self._buckets = buckets
+        self._lock = threading.Lock()
+        self._started = time.monotonic()
+        self.documents: dict[str, Histogram] = defaultdict(self._new_histogram)  # Processing time by doc name
+        self.stages: dict[str, Histogram] = defaultdict(self._new_histogram)  # Time spent in stages of writing
+        self.requests: dict[str, Histogram] = defaultdict(self._new_histogram)  # Latency by HTTP method
+        self.responses: dict[tuple[str, int], int] = defaultdict(int)  # Number of responses by method and status
+        self.rows: dict[str, int] = defaultdict(int)  # Number of rows written by kind of data
+        self.bytes_sent = 0
+        self.retryable_responses = 0  # Responses with status codes that make the Tiled client retry the request
+
+    def _new_histogram(self) -> Histogram:
+        return Histogram(self._buckets)
+
+    def observe_document(self, name: str, elapsed: float):
+        with self._lock:
+            self.documents[name].observe(elapsed)
+
+    def observe_stage(self, stage: str, elapsed: float):
+        with self._lock:
+            self.stages[stage].observe(elapsed)
+
+    @contextmanager
+    def time_stage(self, stage: str):
+        """Context manager measuring the time spent in a stage of writing, e.g. "table" or "consolidate" """
+        t0 = time.monotonic()
+        try:
+            yield
+        finally:
+            self.observe_stage(stage, time.monotonic() - t0)
+
+    def count_rows(self, kind: str, num_rows: int):
+        with self._lock:
+            self.rows[kind] += num_rows
+
+    def _on_request(self, request: httpx.Request):
+        request.extensions["metrics_t0"] = time.monotonic()
+
+    def _on_response(self, response: httpx.Response):
+        request = response.request
+        elapsed = time.monotonic() - request.extensions.get("metrics_t0", time.monotonic())
+        with self._lock:
+            self.requests[request.method].observe(elapsed)  # Time until the response headers are received
+            self.responses[(request.method, response.status_code)] += 1
+            self.bytes_sent += int(request.headers.get("content-length", 0))
+            if response.status_code == 429 or response.status_code >= 500:
+                self.retryable_responses += 1
+
+    @staticmethod
+    def install(http_client: httpx.Client):
+        """Register the event hooks measuring the HTTP requests sent by the client, unless already registered
+
+        The hooks are shared by all metrics and hold no reference to them: each request is counted by the metrics
+        active in the thread sending it, if any. Hence they are registered only once per client, and do not need
+        to be removed when a writer is discarded.
+        """
+        with _install_lock:
+            if _on_request not in http_client.event_hooks["request"]:
+                http_client.event_hooks["request"].append(_on_request)
+                http_client.event_hooks["response"].append(_on_response)
+
+    @contextmanager
+    def activate(self):
+        """Context manager counting the HTTP requests sent in the current thread in these metrics"""
+        token = _active_metrics.set(self)
+        try:
+            yield
+        finally:
+            _active_metrics.reset(token)
+
+    def stats(self, queue_depth: Optional[int] = None) -> dict[str, Any]:
+        """Return a snapshot of the metrics as a JSON-serializable dictionary"""
+
+        with self._lock:
+            uptime = time.monotonic() - self._started
+            return {
+                "uptime": uptime,
+                "documents": {
+                    name: {**hist.summary(), "rate": hist.count / uptime if uptime else 0.0}
+                    for name, hist in self.documents.items()
+                },
+                "stages": {stage: hist.summary() for stage, hist in self.stages.items()},
+                "rows": dict(self.rows),
+                "requests": {
+                    "latency": {method: hist.summary() for method, hist in self.requests.items()},
+                    "responses": {f"{method} {status}": num for (method, status), num in self.responses.items()},
+                    "bytes_sent": self.bytes_sent,
+                    "retryable_responses": self.retryable_responses,
+                },
+                **({"queue_depth": queue_depth} if queue_depth is not None else {}),
+            }
+
+    def to_prometheus(self, queue_depth: Optional[int] = None) -> str:
+        """Format the metrics in the Prometheus text exposition format"""
+
+        lines: list[str] = []
+
+        def _histogram(name: str, help: str, label: str, hists: dict[str, Histogram]):
+            lines.extend([f"# HELP {name} {help}", f"# TYPE {name} histogram"])
+            for value, hist in hists.items():
+                cumulative = 0
+                for bound, count in zip((*hist.buckets, "+Inf"), hist.counts):
+                    cumulative += count
+                    lines.append(f'{name}_bucket{{{label}="{value}",le="{bound}"}} {cumulative}')
+                lines.append(f'{name}_sum{{{label}="{value}"}} {hist.sum}')
+                lines.append(f'{name}_count{{{label}="{value}"}} {hist.count}')
+
+        prefix = PROMETHEUS_PREFIX
+        with self._lock:
+            _histogram(f"{prefix}_document_seconds", "Time spent processing documents.", "name", self.documents)
+            _histogram(f"{prefix}_stage_seconds", "Time spent in stages of writing.", "stage", self.stages)
+            _histogram(f"{prefix}_request_seconds", "Latency of HTTP requests to Tiled.", "method", self.requests)
+            lines.extend(
+                [f"# HELP {prefix}_rows_total Rows of data written.", f"# TYPE {prefix}_rows_total counter"]
+            )
+            lines.extend(f'{prefix}_rows_total{{kind="{kind}"}} {num}' for kind, num in self.rows.items())
+            lines.extend(
+                [f"# HELP {prefix}_responses_total HTTP responses.", f"# TYPE {prefix}_responses_total counter"]
+            )
+            lines.extend(
+                f'{prefix}_responses_total{{method="{method}",status="{status}"}} {num}'
+                for (method, status), num in self.responses.items()
+            )
+            lines.extend(
+                [
+                    f"# HELP {prefix}_sent_bytes_total Bytes of request bodies sent.",
+                    f"# TYPE {prefix}_sent_bytes_total counter",
+                    f"{prefix}_sent_bytes_total {self.bytes_sent}",
+                    f"# HELP {prefix}_retryable_responses_total Responses that cause a retry.",
+                    f"# TYPE {prefix}_retryable_responses_total counter",
+                    f"{prefix}_retryable_responses_total {self.retryable_responses}",
+                ]
+            )
+        if queue_depth is not None:
+            lines.extend(
+                [
+                    f"# HELP {prefix}_queue_depth Documents waiting to be written.",
+                    f"# TYPE {prefix}_queue_depth gauge",
+                    f"{prefix}_queue_depth {queue_depth}",
+                ]
+            )
+
+        return "\n".join(lines) + "\n"
+
+
+def serve_prometheus(render: Callable[[], str], port: int, addr: str = "127.0.0.1") -> ThreadingHTTPServer:
+    """Serve the text returned by `render()` at /metrics in a daemon thread; stop it with `shutdown()`"""
+
+    class MetricsHandler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            if self.path.split("?")[0] not in {"/", "/metrics"}:
+                self.send_error(404)
+                return
+            body = render().encode()
+            self.send_response(200)
+            self.send_header("Content-Type", "text/plain; version=0.0.4; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass  # Do not log every scrape to stderr
+
+    server = ThreadingHTTPServer((addr, port), MetricsHandler)
+    threading.Thread(target=server.serve_forever, name="TiledWriterMetrics", daemon=True).start()
+    return server
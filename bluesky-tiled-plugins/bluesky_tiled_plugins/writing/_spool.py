@@ -0,0 +1,129 @@
+import json
+import logging
+import os
+import threading
+from collections import defaultdict
+from collections.abc import Iterator
+from pathlib import Path
+from typing import BinaryIO
+
+from event_model.documents import DocumentType
+from tiled.utils import safe_json_dump
+
+logger = logging.getLogger(__name__)
+
+
+class DocumentSpool:
+    """Write-ahead spool of Bluesky documents on local disk
+
+    Every document is appended to a JSON Lines segment file of its run, `<run uid>.jsonl`, before it is
+    dispatched for writing. To limit the cost of disk synchronization, the segment is fsync'ed every
+    `fsync_interval` documents and always after the Stop document. Once the run has been written completely,
+    its segment is acknowledged and deleted; segments that remain in the directory (e.g. after a crash) can be
+    read back with `read_segment` and replayed.
+
+    Documents that can not be attributed to a single run (e.g. legacy Resources without a `run_start`) are
+    appended to the segments of all currently open runs, similarly to `event_model.RunRouter`. If no run is
+    open, they are kept in the `ORPHAN_SEGMENT` segment, which is never acknowledged or replayed.
+
+    Parameters
+    ----------
+        directory : str
+            The directory to keep the segment files in; it is created if it does not exist.
+        fsync_interval : int
+            The number of documents appended to a segment between calls to `os.fsync`.
+    """
+
+    ORPHAN_SEGMENT = "orphans"
+
+    def __init__(self, directory: str, fsync_interval: int = 100):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+        self._fsync_interval = fsync_interval
+        self._files: dict[str, BinaryIO] = {}  # Open segment files by run uid
+        self._num_unsynced: dict[str, int] = defaultdict(int)
+        self._run_by_descriptor: dict[str, str] = {}
+        self._run_by_resource: dict[str, str] = {}
+        self._lock = threading.Lock()  # Runs may be acknowledged from other threads
+
+    def _run_uids(self, name: str, doc: DocumentType) -> list[str]:
+        """Determine the uid(s) of the run that the document belongs to"""
+
+        run_uid = None
+        if name == "start":
+            run_uid = doc["uid"]
+        elif name in {"descriptor", "stop", "resource", "stream_resource"}:
+            run_uid = doc.get("run_start")
+            if run_uid and name == "descriptor":
+                self._run_by_descriptor[doc["uid"]] = run_uid
+            elif run_uid and name in {"resource", "stream_resource"}:
+                self._run_by_resource[doc["uid"]] = run_uid
+        elif name in {"event", "event_page", "stream_datum"}:
+            run_uid = self._run_by_descriptor.get(doc["descriptor"])
+        elif name in {"datum", "datum_page"}:
+            run_uid = self._run_by_resource.get(doc["resource"])
+
+        if run_uid:
+            return [run_uid]
+        if open_runs := [uid for uid in self._files if uid != self.ORPHAN_SEGMENT]:
+            return open_runs
+        logger.warning(f"A {name} document does not belong to any open run; spooling it as an orphan.")
+        return [self.ORPHAN_SEGMENT]
+
+    def append(self, name: str, doc: DocumentType):
+        """Append a document to the segment of its run and fsync it, if due"""
+
+        line = safe_json_dump({"name": name, "doc": doc}) + b"\n"
+        with self._lock:
+            for run_uid in self._run_uids(name, doc):
+                if not (file := self._files.get(run_uid)):
+                    file = self._files[run_uid] = open(self.directory / f"{run_uid}.jsonl", "ab")
+                file.write(line)
+                self._num_unsynced[run_uid] += 1
+                if (name == "stop") or (self._num_unsynced[run_uid] >= self._fsync_interval):
+                    file.flush()
+                    os.fsync(file.fileno())
+                    self._num_unsynced[run_uid] = 0
+
+    def acknowledge(self, run_uid: str):
+        """Delete the segment of a run that has been written completely"""
+
+        with self._lock:
+            if file := self._files.pop(run_uid, None):
+                file.close()
+            self._num_unsynced.pop(run_uid, None)
+            self._run_by_descriptor = {k: v for k, v in self._run_by_descriptor.items() if v != run_uid}
+            self._run_by_resource = {k: v for k, v in self._run_by_resource.items() if v != run_uid}
+            (self.directory / f"{run_uid}.jsonl").unlink(missing_ok=True)
+
+    def segments(self) -> list[Path]:
+        """List the segment files that are not currently being written to, oldest first"""
+
+        with self._lock:
+            open_paths = {Path(file.name) for file in self._files.values()}
+        paths = [p for p in self.directory.glob("*.jsonl") if p not in open_paths]
+        return sorted(paths, key=lambda p: p.stat().st_mtime)
+
+    @staticmethod
+    def read_segment(path: Path) -> Iterator[tuple[str, DocumentType]]:
+        """Read the documents from a segment file; an incomplete last line (e.g. after a crash) is skipped"""
+
+        with open(path, "rb") as file:
+            for line in file:
+                try:
+                    item = json.loads(line)
+                except json.JSONDecodeError:
+                    logger.warning(f"Skipping a corrupted or incomplete record in the spool segment {path}")
+                    continue
+                yield item["name"], item["doc"]
+
+    def close(self):
+        """Synchronize and close all open segment files; the segments are kept on disk"""
+
+        with self._lock:
+            for file in self._files.values():
+                file.flush()
+                os.fsync(file.fileno())
+                file.close()
+            self._files.clear()
+            self._num_unsynced.clear()
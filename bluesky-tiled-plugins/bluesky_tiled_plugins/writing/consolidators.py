@@ -1,9 +1,14 @@
+import bisect
 import collections
+import collections.abc
 import dataclasses
+import itertools
 import os
+import random
 import re
 import warnings
-from typing import Literal, Union, cast
+from collections.abc import Iterator
+from typing import Literal, Optional, Union, cast
 
 import numpy as np
 from event_model.documents import EventDescriptor, StreamDatum, StreamResource
@@ -11,6 +16,7 @@ from tiled.mimetypes import DEFAULT_ADAPTERS_BY_MIMETYPE
 from tiled.structures.array import ArrayStructure, BuiltinDtype, StructDtype
 from tiled.structures.core import StructureFamily
 from tiled.structures.data_source import Asset, DataSource, Management
+from tiled.utils import path_from_uri
 
 
 @dataclasses.dataclass
@@ -50,6 +56,101 @@ class Patch:
         return cls(shape=combined_shape, offset=combined_offset)
 
 
+def _list_summands(A: int, b: int) -> tuple[int, ...]:
+    # Generate a tuple with repeated b summing up to A; append the remainder if necessary
+    # e.g. _list_summands(13, 3) = (3, 3, 3, 3, 1)
+    return (b,) * (A // b) + ((A % b,) if A % b > 0 else ())
+
+
+class SeqNumsToIndicesMap(collections.abc.Mapping):
+    """Run-length encoded mapping of seq_nums to indices of rows in a Data Source
+
+    StreamDatum documents declare contiguous ranges of seq_nums that correspond to contiguous ranges of indices.
+    Instead of storing an entry per row, the mapping keeps a sorted list of runs, (seq_num_start, index_start,
+    length), so that appending a new range is O(1) (consecutive ranges are merged into a single run) and looking
+    up an index by its seq_num is O(log n) in the number of runs.
+
+    Updating the mapping with seq_nums that have already been mapped overrides the previous values, as with dicts.
+    """
+
+    def __init__(self):
+        self._seq_starts: list[int] = []
+        self._idx_starts: list[int] = []
+        self._lengths: list[int] = []
+        self._len: int = 0
+
+    def __getitem__(self, seq_num: int) -> int:
+        i = bisect.bisect_right(self._seq_starts, seq_num) - 1
+        if i >= 0 and seq_num < self._seq_starts[i] + self._lengths[i]:
+            return self._idx_starts[i] + seq_num - self._seq_starts[i]
+        raise KeyError(seq_num)
+
+    def __iter__(self) -> Iterator[int]:
+        for seq_start, length in zip(self._seq_starts, self._lengths):
+            yield from range(seq_start, seq_start + length)
+
+    def __len__(self) -> int:
+        return self._len
+
+    def __repr__(self) -> str:
+        return f"{type(self).__name__}({self.runs()})"
+
+    def runs(self) -> list[tuple[range, range]]:
+        """Return the list of contiguous (seq_nums, indices) ranges"""
+        return [
+            (range(seq_start, seq_start + length), range(idx_start, idx_start + length))
+            for seq_start, idx_start, length in zip(self._seq_starts, self._idx_starts, self._lengths)
+        ]
+
+    def update(self, seq_nums: range, indices: range):
+        """Map a contiguous range of seq_nums onto a contiguous range of indices"""
+
+        if len(seq_nums) != len(indices):
+            raise ValueError(f"Length mismatch between seq_nums, {seq_nums}, and indices, {indices}.")
+        if len(seq_nums) == 0:
+            return
+        start, stop, idx_start = seq_nums.start, seq_nums.stop, indices.start
+
+        # Fast path: the new range follows all existing ones (the most common case)
+        if not self._seq_starts or start >= self._seq_starts[-1] + self._lengths[-1]:
+            if (
+                self._seq_starts
+                and start == self._seq_starts[-1] + self._lengths[-1]
+                and idx_start == self._idx_starts[-1] + self._lengths[-1]
+            ):
+                self._lengths[-1] += stop - start
+            else:
+                self._seq_starts.append(start)
+                self._idx_starts.append(idx_start)
+                self._lengths.append(stop - start)
+            self._len += stop - start
+            return
+
+        # General case: cut out any overlapping parts of existing runs and insert the new run in order
+        lo = max(bisect.bisect_right(self._seq_starts, start) - 1, 0)
+        hi = bisect.bisect_left(self._seq_starts, stop)
+        runs = []
+        for s, x, n in zip(self._seq_starts[lo:hi], self._idx_starts[lo:hi], self._lengths[lo:hi]):
+            if s < start:
+                runs.append((s, x, min(n, start - s)))
+            if s + n > stop:
+                runs.append((stop, x + stop - s, s + n - stop))
+            self._len -= max(min(s + n, stop) - max(s, start), 0)
+        runs.append((start, idx_start, stop - start))
+        self._len += stop - start
+
+        # Merge adjacent runs, if they are contiguous in both seq_nums and indices
+        merged: list[tuple[int, int, int]] = []
+        for s, x, n in sorted(runs):
+            if merged and merged[-1][0] + merged[-1][2] == s and merged[-1][1] + merged[-1][2] == x:
+                merged[-1] = (merged[-1][0], merged[-1][1], merged[-1][2] + n)
+            else:
+                merged.append((s, x, n))
+        self._seq_starts[lo:hi] = [s for s, _, _ in merged]
+        self._idx_starts[lo:hi] = [x for _, x, _ in merged]
+        self._lengths[lo:hi] = [n for _, _, n in merged]
+
+
 class ConsolidatorBase:
     """Consolidator of StreamDatums
 
@@ -97,7 +198,7 @@ class ConsolidatorBase:
 
         self.data_key = stream_resource["data_key"]
         self.uri = stream_resource["uri"]
-        self.assets: list[Asset] = [Asset(data_uri=self.uri, is_directory=False, parameter="data_uris", num=0)]
+        self._assets: list[Asset] = [Asset(data_uri=self.uri, is_directory=False, parameter="data_uris", num=0)]
         self._sres_parameters = stream_resource["parameters"]
 
         # Find datum shape and machine dtype
@@ -136,7 +237,8 @@ class ConsolidatorBase:
         self.join_chunks = self._sres_parameters.get("join_chunks", self.join_chunks)
 
         self._num_rows: int = 0  # Number of rows in the Data Source (all rows, includung skips)
-        self._seqnums_to_indices_map: dict[int, int] = {}
+        self._seqnums_to_indices_map = SeqNumsToIndicesMap()
+        self._leading_chunks_cache: tuple[tuple[int, ...], int, tuple[int, ...]] = ((), 0, ())
 
         # Set the dimension names if provided
         self.dims: tuple[str, ...] = tuple(data_desc.get("dims", ()))
@@ -147,6 +249,16 @@ class ConsolidatorBase:
             raise ValueError(f"A data source of {sres['mimetype']} type can not be handled by {cls.__name__}.")
         return sres["mimetype"]
 
+    @property
+    def assets(self) -> list[Asset]:
+        """List of Assets (files) that constitute the data source"""
+        return self._assets
+
+    @property
+    def data_uris(self) -> list[str]:
+        """List of uris of all Assets, in the order expected by the Adapter"""
+        return [asset.data_uri for asset in self.assets]
+
     @property
     def shape(self) -> tuple[int, ...]:
         """Native shape of the data stored in assets
@@ -181,29 +293,24 @@ class ConsolidatorBase:
         Chunking along the trailing dimensions is always preserved as in the original (single) array.
         """
 
-        def list_summands(A: int, b: int, repeat: int = 1) -> tuple[int, ...]:
-            # Generate a list with repeated b summing up to A; append the remainder if necessary
-            # e.g. list_summands(13, 3) = [3, 3, 3, 3, 1]
-            # if `repeat = n`, n > 1, copy and repeat the entire result n times
-            return tuple([b] * (A // b) + ([A % b] if A % b > 0 else [])) * repeat or (0,)
-
         # If chunk shape is less than or equal to the total shape dimensions, chunk each specified dimension
         # starting from the leading dimension
         if len(self.chunk_shape) <= len(self.shape):
-            if (
-                self.join_method == "stack"
-                or (self.join_method == "concat" and self.join_chunks)
-                or len(self.chunk_shape) == 0
-            ):
-                result = tuple(
-                    list_summands(ddim, cdim)
-                    for ddim, cdim in zip(self.shape[: len(self.chunk_shape)], self.chunk_shape)
+            if len(self.chunk_shape) == 0:
+                result: tuple[tuple[int, ...], ...] = ()
+            elif self.join_method == "stack" or (self.join_method == "concat" and self.join_chunks):
+                result = (
+                    self._leading_chunks(self.shape[0], self.chunk_shape[0]),
+                    *[
+                        _list_summands(ddim, cdim) or (0,)
+                        for ddim, cdim in zip(self.shape[1 : len(self.chunk_shape)], self.chunk_shape[1:])  # noqa
+                    ],
                 )
             else:
                 result = (
-                    list_summands(self.datum_shape[0], self.chunk_shape[0], repeat=self._num_rows),
+                    self._leading_chunks(self.datum_shape[0], self.chunk_shape[0], repeat=self._num_rows),
                     *[
-                        list_summands(ddim, cdim)
+                        _list_summands(ddim, cdim) or (0,)
                         for ddim, cdim in zip(self.shape[1 : len(self.chunk_shape)], self.chunk_shape[1:])  # noqa
                     ],
                 )
@@ -216,6 +323,32 @@ class ConsolidatorBase:
                 f"{self.shape}."
             )
 
+    def _leading_chunks(self, size: int, chunk: int, repeat: Optional[int] = None) -> tuple[int, ...]:
+        """Chunk sizes along the leading dimension, updated incrementally as new rows are added
+
+        If `repeat` is None, `size` elements are split into chunks of `chunk` elements (the last one may be
+        smaller); otherwise, the chunking of `size` elements is repeated `repeat` times. The result of the previous
+        call is cached and extended when only the number of elements (or repeats) has grown since then.
+        """
+        key = (chunk,) if repeat is None else (size, chunk)
+        count = size if repeat is None else repeat
+        cached_key, cached_count, cached = self._leading_chunks_cache
+
+        if cached_key == key and cached_count == count:
+            result = cached
+        elif cached_key == key and 0 < cached_count < count:
+            if repeat is None:
+                # Drop the last incomplete chunk, if any, and append the new ones
+                num_full = cached_count // chunk
+                result = cached[:num_full] + _list_summands(count - num_full * chunk, chunk)
+            else:
+                result = cached + _list_summands(size, chunk) * (count - cached_count)
+        else:
+            result = _list_summands(size, chunk) * (1 if repeat is None else repeat)
+
+        self._leading_chunks_cache = (key, count, result)
+        return result or (0,)
+
     @property
     def has_skips(self) -> bool:
         """Indicates whether any rows should be skipped when mapping their indices to frame numbers
@@ -261,22 +394,25 @@ class ConsolidatorBase:
         self._num_rows += doc["indices"]["stop"] - doc["indices"]["start"]
         new_seqnums = range(doc["seq_nums"]["start"], doc["seq_nums"]["stop"])
         new_indices = range(doc["indices"]["start"], doc["indices"]["stop"])
-        self._seqnums_to_indices_map.update(dict(zip(new_seqnums, new_indices)))
+        self._seqnums_to_indices_map.update(new_seqnums, new_indices)
         return Patch(
             offset=(old_shape[0], *[0 for _ in self.shape[1:]]),
             shape=(self.shape[0] - old_shape[0], *self.shape[1:]),
         )
 
-    def get_data_source(self) -> DataSource:
+    def get_data_source(self, skip_assets: int = 0) -> DataSource:
         """Return a DataSource object reflecting the current state of the streamed dataset.
 
         The returned DataSource is conceptually similar (and can be an instance of) tiled.structures.DataSource. In
         general, it describes associated Assets (filepaths, mimetype) along with their internal data structure
         (array shape, chunks, additional parameters) and should contain all information necessary to read the file.
+
+        Tiled adds the Assets of an updated DataSource to the ones already registered, so `skip_assets` can be set
+        to the number of registered Assets to include only the new ones.
         """
         return DataSource(
             mimetype=self.mimetype,
-            assets=self.assets,
+            assets=self.assets[skip_assets:],
             structure_family=StructureFamily.array,
             structure=self.structure(),
             parameters=self.adapter_parameters(),
@@ -306,13 +442,30 @@ class ConsolidatorBase:
 
         raise NotImplementedError("This method is not implemented in the base Consolidator class.")
 
-    def validate(self, fix_errors=False) -> list[str]:
-        """Validate the Consolidator's state against the expected structure"""
+    def _structure_from_files(self, sample_size: Optional[int] = None) -> ArrayStructure:
+        """Determine the actual structure of the data by opening the files with the Adapter
 
-        # Initialize adapter from uris and determine the structure
+        The base implementation opens all assets at once and ignores `sample_size`; subclasses that reference
+        many files may open only a sample of them.
+        """
         adapter_class = DEFAULT_ADAPTERS_BY_MIMETYPE[self.mimetype]
-        uris = [asset.data_uri for asset in self.assets]
-        structure = adapter_class.from_uris(*uris, **self.adapter_parameters()).structure()
+        return adapter_class.from_uris(*self.data_uris, **self.adapter_parameters()).structure()
+
+    def validate(self, fix_errors=False, sample_size: Optional[int] = None) -> list[str]:
+        """Validate the Consolidator's state against the expected structure
+
+        Parameters
+        ----------
+        fix_errors : bool
+            If True, update the Consolidator's state to match the actual structure of the data and issue a warning;
+            otherwise, raise a ValueError on any mismatch.
+        sample_size : Optional[int]
+            If set, consolidators that reference multiple files may open only the first, the last, and up to
+            `sample_size` randomly chosen files; the remaining ones are only checked for existence and size.
+        """
+
+        # Initialize adapter from uris and determine the structure
+        structure = self._structure_from_files(sample_size=sample_size)
         notes = []
 
         if self.shape != structure.shape:
@@ -438,9 +591,9 @@ class HDF5Consolidator(ConsolidatorBase):
             raise ValueError("All StreamResource documents must have the same chunk shape.")
 
         asset = Asset(
-            data_uri=stream_resource["uri"], is_directory=False, parameter="data_uris", num=len(self.assets)
+            data_uri=stream_resource["uri"], is_directory=False, parameter="data_uris", num=len(self._assets)
         )
-        self.assets.append(asset)
+        self._assets.append(asset)
 
 
 class MultipartRelatedConsolidator(ConsolidatorBase):
@@ -449,8 +602,9 @@ class MultipartRelatedConsolidator(ConsolidatorBase):
     ):
         super().__init__(stream_resource, descriptor)
         self.permitted_extensions: set[str] = permitted_extensions
-        self.assets.clear()  # Assets will be populated based on datum indices
-        self.data_uris: list[str] = []
+        self._assets.clear()  # Assets are generated lazily from the template and the ranges of file indices
+        self._data_uris: list[str] = []  # Uris of the files expanded so far, in the order of self._assets
+        self._file_ranges: list[range] = []  # Contiguous ranges of file indices, in the order of consumption
         self.chunk_shape = self.chunk_shape or (1,)  # I.e. number of frames per file (tiff, jpeg, etc.)
         if self.join_method == "concat":
             assert self.datum_shape[0] % self.chunk_shape[0] == 0, (
@@ -516,6 +670,88 @@ class MultipartRelatedConsolidator(ConsolidatorBase):
         else:
             return self.uri
 
+    def get_datum_uris(self, indices: range) -> Iterator[str]:
+        """Lazily generate full uris for a contiguous range of file indices in the sequence."""
+
+        if self.template:
+            assert os.path.splitext(self.template)[1] in self.permitted_extensions
+            template = self.uri + self.template
+            return (template.format(indx) for indx in indices)
+        else:
+            return itertools.repeat(self.uri, len(indices))
+
+    @property
+    def num_files(self) -> int:
+        """Total number of files (Assets) referenced by the consumed StreamDatums"""
+        return sum(len(rng) for rng in self._file_ranges)
+
+    def _expand_file_ranges(self):
+        """Extend the lists of uris and Assets with the files consumed since they were last expanded"""
+
+        skip = len(self._data_uris)
+        for rng in self._file_ranges:
+            if skip >= len(rng):
+                skip -= len(rng)
+                continue
+            for uri in self.get_datum_uris(rng[skip:]):
+                self._data_uris.append(uri)
+                self._assets.append(
+                    Asset(data_uri=uri, is_directory=False, parameter="data_uris", num=len(self._assets) + 1)
+                )
+            skip = 0
+
+    @property
+    def data_uris(self) -> list[str]:
+        self._expand_file_ranges()
+        return self._data_uris
+
+    @property
+    def assets(self) -> list[Asset]:
+        """List of Assets (files) expanded from the filename template and the consumed ranges of file indices
+
+        The Assets are materialized on demand, e.g. when a DataSource is requested, and only the files consumed
+        since the previous request are expanded.
+        """
+        self._expand_file_ranges()
+        return self._assets
+
+    def _structure_from_files(self, sample_size: Optional[int] = None) -> ArrayStructure:
+        """Determine the actual structure of the data from a sample of files
+
+        If `sample_size` is set and there are more files than the sample would include, only the first, the last,
+        and `sample_size` randomly chosen files are opened with the Adapter; the rest are checked with a cheap
+        `stat()` call to confirm that they exist and are not empty. All sampled files must have the same
+        structure, which is then extrapolated to the full sequence.
+        """
+
+        uris = self.data_uris
+        if (sample_size is None) or (len(uris) <= sample_size + 2):
+            return super()._structure_from_files()
+
+        for uri in uris:
+            if os.stat(path := path_from_uri(uri)).st_size == 0:
+                raise ValueError(f"File {path} is empty.")
+
+        adapter_class = DEFAULT_ADAPTERS_BY_MIMETYPE[self.mimetype]
+        sampled = [0, *sorted(random.sample(range(1, len(uris) - 1), sample_size)), len(uris) - 1]
+        structures = [adapter_class.from_uris(uris[i], **self.adapter_parameters()).structure() for i in sampled]
+        single = structures[0]
+        for i, st in zip(sampled[1:], structures[1:]):
+            if (st.shape, st.chunks, st.data_type) != (single.shape, single.chunks, single.data_type):
+                raise ValueError(
+                    f"Files {uris[0]} and {uris[i]} have inconsistent structure: "
+                    f"shape {single.shape} != {st.shape}, chunks {single.chunks} != {st.chunks}, "
+                    f"or dtype {single.data_type} != {st.data_type}."
+                )
+
+        # Extrapolate the structure of a single file to the entire sequence along the leftmost dimension
+        return ArrayStructure(
+            data_type=single.data_type,
+            shape=(single.shape[0] * len(uris), *single.shape[1:]),
+            chunks=(single.chunks[0] * len(uris), *single.chunks[1:]),
+            dims=single.dims,
+        )
+
     def consume_stream_datum(self, doc: StreamDatum):
         """Determine the number and names of files from indices of datums and the number of files per datum.
 
@@ -527,21 +763,20 @@ class MultipartRelatedConsolidator(ConsolidatorBase):
 
         If `join_method == "stack"`, we assume that each datum becomes its own index in the new leftmost dimension
         of the resulting dataset, and hence corresponds to a single file.
+
+        Only the range of file indices is recorded; consecutive ranges are merged together.
         """
 
+        if self.template:
+            assert os.path.splitext(self.template)[1] in self.permitted_extensions
+
         files_per_datum = self.datum_shape[0] // self.chunk_shape[0] if self.join_method == "concat" else 1
         first_file_indx = doc["indices"]["start"] * files_per_datum
         last_file_indx = doc["indices"]["stop"] * files_per_datum
-        for indx in range(first_file_indx, last_file_indx):
-            new_datum_uri = self.get_datum_uri(indx)
-            new_asset = Asset(
-                data_uri=new_datum_uri,
-                is_directory=False,
-                parameter="data_uris",
-                num=len(self.assets) + 1,
-            )
-            self.assets.append(new_asset)
-            self.data_uris.append(new_datum_uri)
+        if self._file_ranges and self._file_ranges[-1].stop == first_file_indx:
+            self._file_ranges[-1] = range(self._file_ranges[-1].start, last_file_indx)
+        elif last_file_indx > first_file_indx:
+            self._file_ranges.append(range(first_file_indx, last_file_indx))
 
         return super().consume_stream_datum(doc)
 
@@ -1,9 +1,17 @@
+import contextvars
 import copy
 import itertools
+import json
 import logging
+import shutil
+import tempfile
+import threading
+import time
 from collections import defaultdict, deque, namedtuple
+from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
-from typing import Any, Callable, Optional, Union, cast
+from typing import Any, BinaryIO, Callable, Optional, Union, cast
 from warnings import warn
 
 import numpy
@@ -37,12 +45,15 @@ from tiled.client.base import BaseClient
 from tiled.client.container import Container
 from tiled.client.dataframe import DataFrameClient
 from tiled.client.utils import handle_error
+from tiled.structures.array import ArrayStructure, BuiltinDtype
 from tiled.structures.core import Spec
 from tiled.utils import safe_json_dump
 
 from ..utils import truncate_json_overflow
 from ._dispatcher import Dispatcher
 from ._json_writer import JSONLinesWriter
+from ._metrics import WriterMetrics, serve_prometheus
+from ._spool import DocumentSpool
 from .consolidators import ConsolidatorBase, DataSource, Patch, StructureFamily, consolidator_factory
 
 # Aggregate the Event table rows and StreamDatums in batches before writing to Tiled
@@ -52,6 +63,29 @@ BATCH_SIZE = 10000
 # as zarr. Set to 0 to write all internal arrays as zarr, and -1 to write all internal arrays to tabular storage.
 MAX_ARRAY_SIZE = 16
 
+# Target size (in bytes) of the chunks of internal arrays written as zarr; the arrays are preallocated and grown
+# by whole chunks, so that each batch of Events is written into chunk-aligned blocks
+INTERNAL_CHUNK_SIZE = 8 * 1024**2
+
+# Maximum size (in bytes) of the storage reserved up front for an internal array written as zarr, based on the
+# `num_points` hint from the Start document; the storage is grown by doubling beyond that
+MAX_PREALLOCATED_SIZE = 256 * 1024**2
+
+# Maximum number of threads used to validate StreamResource nodes concurrently when a run is stopped
+MAX_VALIDATION_WORKERS = 8
+
+# Maximum number of documents queued for writing (across all runs) when runs are written concurrently
+MAX_PENDING_DOCUMENTS = 100_000
+
+# Number of documents per run kept in memory for a possible backup before spilling them to disk
+BACKUP_BUFFER_SIZE = 10_000
+
+# Number of documents in each segment file of a buffer spilled to disk
+SEGMENT_SIZE = 10_000
+
+# Number of documents appended to a spool segment between disk synchronizations
+SPOOL_FSYNC_INTERVAL = 100
+
 # Disallow using reserved words as data_keys identifiers
 # Related: https://github.com/bluesky/event-model/pull/223
 RESERVED_DATA_KEYS = ["time", "seq_num"]
@@ -126,19 +160,140 @@ ExternalEventDataReference = namedtuple(
 )
 
 
+class _SpillingBuffer:
+    """Append-only buffer of (name, doc) pairs that spills to disk beyond a memory threshold.
+
+    Up to `max_in_memory` items are kept in memory; once this is exceeded, all subsequent items are appended to
+    JSON Lines segment files (of at most `segment_size` documents each) in a temporary subdirectory of
+    `directory`. Iterating over the buffer yields the items in the order they were appended, streaming them from
+    disk. Clearing the buffer deletes the segment files.
+
+    If `directory` is None, the buffer behaves as a bounded deque: the oldest items are discarded once
+    `max_in_memory` is exceeded.
+    """
+
+    def __init__(self, max_in_memory: int, directory: Optional[str] = None, segment_size: int = SEGMENT_SIZE):
+        self._memory: deque[tuple[str, DocumentType]] = deque(maxlen=None if directory else max_in_memory)
+        self._max_in_memory = max_in_memory
+        self._directory = directory
+        self._segment_size = segment_size
+        self._spill_dir: Optional[Path] = None
+        self._segments: list[Path] = []
+        self._file: Optional[BinaryIO] = None
+        self._num_in_segment = 0
+        self._num_on_disk = 0
+
+    def __len__(self) -> int:
+        return len(self._memory) + self._num_on_disk
+
+    def append(self, item: tuple[str, DocumentType]):
+        if (self._directory is None) or (not self._segments and len(self._memory) < self._max_in_memory):
+            self._memory.append(item)
+            return
+
+        if (self._file is None) or (self._num_in_segment >= self._segment_size):
+            self._open_new_segment()
+        name, doc = item
+        self._file.write(safe_json_dump({"name": name, "doc": doc}) + b"\n")
+        self._num_in_segment += 1
+        self._num_on_disk += 1
+
+    def _open_new_segment(self):
+        if self._file is not None:
+            self._file.close()
+        if self._spill_dir is None:
+            self._spill_dir = Path(tempfile.mkdtemp(prefix=".buffer-", dir=self._directory))
+        self._segments.append(self._spill_dir / f"{len(self._segments):06d}.jsonl")
+        self._file = open(self._segments[-1], "ab")
+        self._num_in_segment = 0
+
+    def __iter__(self) -> Iterator[tuple[str, DocumentType]]:
+        yield from self._memory
+        if self._file is not None:
+            self._file.flush()
+        for segment in self._segments:
+            with open(segment, "rb") as file:
+                for line in file:
+                    item = json.loads(line)
+                    yield item["name"], item["doc"]
+
+    def clear(self):
+        """Discard all buffered items and delete the segment files, if any"""
+        self._memory.clear()
+        if self._file is not None:
+            self._file.close()
+            self._file = None
+        if self._spill_dir is not None:
+            shutil.rmtree(self._spill_dir, ignore_errors=True)
+            self._spill_dir = None
+        self._segments.clear()
+        self._num_in_segment = self._num_on_disk = 0
+
+
+class _Timed:
+    """Callback that passes the time spent processing each document to `observe(label or name, elapsed)`"""
+
+    def __init__(self, callback: Callable, observe: Callable[[str, float], None], label: Optional[str] = None):
+        self.callback = callback
+        self.observe = observe
+        self.label = label
+
+    def __call__(self, name: str, doc: DocumentType):
+        t0 = time.monotonic()
+        try:
+            self.callback(name, doc)
+        finally:
+            self.observe(self.label or name, time.monotonic() - t0)
+
+
+class _WithMetrics:
+    """Callback that counts the HTTP requests sent while processing each document in `metrics`"""
+
+    def __init__(self, callback: Callable, metrics: WriterMetrics):
+        self.callback = callback
+        self.metrics = metrics
+
+    def __call__(self, name: str, doc: DocumentType):
+        with self.metrics.activate():
+            self.callback(name, doc)
+
+
+class _AcknowledgeOnStop:
+    """Callback that calls `acknowledge(run_uid)` after the Stop document has been processed without errors"""
+
+    def __init__(self, callback: Callable, acknowledge: Callable[[str], None]):
+        self.callback = callback
+        self.acknowledge = acknowledge
+
+    def __call__(self, name: str, doc: DocumentType):
+        self.callback(name, doc)
+        if name == "stop":
+            self.acknowledge(doc["run_start"])
+
+
 class _ConditionalBackup:
     """Callback that tries to call the primary callback and, if it fails, flushes the buffer to backup callbacks.
 
     Once an error has been encountererd in the primary callback, all subsequent documents would be sent to the
     backup callbacks as well.
 
+    The buffer keeps up to `maxlen` documents in memory; if `spill_directory` is specified, further documents
+    are spilled to disk there (see `_SpillingBuffer`), otherwise the oldest documents are discarded. The buffer
+    is cleared once the Stop document has been processed successfully.
+
     This callback is intended to be used with a `RunRouter` and process documents from a single Bluesky run.
     """
 
-    def __init__(self, primary_callback: Callable, backup_callbacks: list[Callable], maxlen: int = 1_000_000):
+    def __init__(
+        self,
+        primary_callback: Callable,
+        backup_callbacks: list[Callable],
+        maxlen: int = 1_000_000,
+        spill_directory: Optional[str] = None,
+    ):
         self.primary_callback = primary_callback
         self.backup_callbacks = backup_callbacks
-        self._buffer: deque[tuple[str, DocumentType]] = deque(maxlen=maxlen)
+        self._buffer = _SpillingBuffer(maxlen, directory=spill_directory)
         self._push_to_backup = False
 
     def __call__(self, name: str, doc: DocumentType):
@@ -164,6 +319,87 @@ class _ConditionalBackup:
                             f"Backup callback {bcb.__class__.__name__} failed with error: {e}", stacklevel=2
                         )
             self._buffer.clear()
+        elif name == "stop":
+            self._buffer.clear()  # The run has been written successfully; the backup is no longer needed
+
+
+class _RunLane:
+    """Callback that processes documents of a single Bluesky run on a thread pool shared with other runs.
+
+    Documents are queued and handed to the wrapped callback by at most one worker thread at a time, so their
+    order within the run is preserved, while documents from other runs are processed concurrently in their own
+    lanes. To keep the workers fair, a lane gives up its thread after processing the documents that were queued
+    when it was scheduled, and is re-submitted to the pool if more documents have arrived since.
+
+    The total number of queued documents (across all lanes) is bounded by `semaphore`; the caller blocks when
+    the limit is reached. If the wrapped callback raises, the error is kept in `error` and the remaining
+    documents of the run are discarded. The error is raised (once) to the caller by the next call for the run;
+    the call with the Stop document waits for the run to be written, so that an error is raised by then at the
+    latest.
+    """
+
+    def __init__(self, callback: Callable, executor: ThreadPoolExecutor, semaphore: threading.Semaphore):
+        self.callback = callback
+        self.error: Optional[Exception] = None
+        self.error_raised = False  # True once the error has been raised to the caller
+        self.stopped = False  # True once the Stop document has been processed
+        self._executor = executor
+        self._semaphore = semaphore
+        self._queue: deque[tuple[str, DocumentType]] = deque()
+        self._lock = threading.Lock()
+        self._scheduled = False
+        self._idle = threading.Event()
+        self._idle.set()
+
+    def __call__(self, name: str, doc: DocumentType):
+        self._semaphore.acquire()
+        with self._lock:
+            self._queue.append((name, doc))
+            if not self._scheduled:
+                self._scheduled = True
+                self._idle.clear()
+                self._executor.submit(self._drain)
+        if name == "stop":
+            self.join()
+        self.raise_error()
+
+    def raise_error(self):
+        """Raise the error of the run, if any, unless it has already been raised"""
+        if self.error is not None and not self.error_raised:
+            self.error_raised = True
+            raise self.error
+
+    def _drain(self):
+        with self._lock:
+            num_docs = len(self._queue)
+        for _ in range(num_docs):
+            with self._lock:
+                name, doc = self._queue.popleft()
+            try:
+                if self.error is None:
+                    self.callback(name, doc)
+            except Exception as e:
+                logger.exception(f"Writing of a {name} document failed; the rest of the run will be discarded.")
+                self.error = e
+            finally:
+                self.stopped = self.stopped or (name == "stop")
+                self._semaphore.release()
+
+        with self._lock:
+            if self._queue:
+                self._executor.submit(self._drain)  # Let other lanes use the worker before continuing
+            else:
+                self._scheduled = False
+                self._idle.set()
+
+    def join(self, timeout: Optional[float] = None) -> bool:
+        """Wait until all queued documents have been processed; return False if timed out"""
+        return self._idle.wait(timeout)
+
+    @property
+    def num_pending(self) -> int:
+        """Number of documents waiting to be processed"""
+        return len(self._queue)
 
 
 class RunNormalizer(DocumentRouter):
@@ -527,22 +763,49 @@ class _RunWriter(DocumentRouter):
     ----------
         client : BaseClient
             The Tiled client to use for writing the data.
+        batch_size : int
+            The number of Events or StreamDatums to collect before writing them to Tiled.
+        max_array_size : int
+            Maximum size of internal arrays to write to tabular storage; larger arrays are written as zarr.
+        validation_sample_size : Optional[int]
+            If set, multi-file external data is validated at stop by opening only the first, the last, and this
+            many randomly chosen files; other files are only checked for existence and size.
+        max_validation_workers : int
+            Maximum number of threads used to validate external data sources concurrently at stop.
+        metrics : Optional[WriterMetrics]
+            The object collecting the metrics of writing, e.g. shared by all runs written by a `TiledWriter`.
     """
 
-    def __init__(self, client: BaseClient, batch_size: int = BATCH_SIZE, max_array_size: int = MAX_ARRAY_SIZE):
+    def __init__(
+        self,
+        client: BaseClient,
+        batch_size: int = BATCH_SIZE,
+        max_array_size: int = MAX_ARRAY_SIZE,
+        validation_sample_size: Optional[int] = None,
+        max_validation_workers: int = MAX_VALIDATION_WORKERS,
+        metrics: Optional[WriterMetrics] = None,
+    ):
         self.client = client
+        self._metrics = metrics or WriterMetrics()
         self.root_node: Union[None, Container] = None
         self._desc_nodes: dict[str, Container] = {}  # references to the descriptor nodes by their uid's and names
         self._sres_nodes: dict[str, BaseClient] = {}
         self._internal_tables: dict[str, DataFrameClient] = {}  # references to the internal tables by desc_names
         self._internal_arrays: dict[str, ArrayClient] = {}  # refs to the internal arrays by desc_name/data_key
+        self._internal_array_extents: dict[str, dict[str, Any]] = {}  # lengths, capacity and chunks of arrays
+        self._expected_length: Optional[int] = None  # Expected number of Events in the primary stream
         self._stream_resource_cache: dict[str, StreamResource] = {}
         self._consolidators: dict[str, ConsolidatorBase] = {}
+        self._num_registered_assets: dict[ConsolidatorBase, int] = {}  # Number of Assets already sent to Tiled
         self._internal_data_cache: dict[str, list[dict[str, Any]]] = defaultdict(list)
         self._external_data_cache: dict[str, StreamDatum] = {}  # sres_uid : (concatenated) StreamDatum
         self._int_array_keys: dict[str, set[str]] = defaultdict(set)  # data_keys with array data by desc_name
+        self._config_updates: dict[str, list[dict[str, Any]]] = defaultdict(list)  # Pending, by desc_name
+        self._num_config_updates: dict[str, int] = defaultdict(int)  # Number of config updates already written
         self._batch_size: int = batch_size
         self._max_array_size: int = max_array_size  # Max size of arrays to write to tabular storage
+        self._validation_sample_size: Optional[int] = validation_sample_size
+        self._max_validation_workers: int = max_validation_workers
         self.data_keys: dict[str, DataKey] = {}
         self.access_tags: Optional[list[str]] = None
 
@@ -550,22 +813,20 @@ class _RunWriter(DocumentRouter):
         """Write the internal data table to Tiled and clear the cache."""
 
         desc_name = desc_node.item["id"]  # Name of the descriptor (stream)
+        self._write_config_updates(desc_name)  # Make the configuration available along with the data
+
         # 1. Write internal array data, if any; remove it from the tabular data
         for key in self._int_array_keys[desc_name]:
-            array = numpy.array([row.pop(key) for row in data_cache if key in row])
-            if not (arr_client := self._internal_arrays.get(f"{desc_name}/{key}")):
-                # Create a new "internal" array data node and write the initial piece of data
-                metadata = truncate_json_overflow(self.data_keys.get(key, {}))
-                dims = ("time",) + tuple(f"dim_{i}" for i in range(1, array.ndim))
-                arr_client = desc_node.write_array(
-                    array, key=key, metadata=metadata, dims=dims, access_tags=self.access_tags
-                )
-                self._internal_arrays[f"{desc_name}/{key}"] = arr_client
-            else:
-                arr_client.patch(array, offset=arr_client.shape[:1], extend=True)
+            with self._metrics.time_stage("array"):
+                array = numpy.array([row.pop(key) for row in data_cache if key in row])
+                if len(array) > 0:
+                    self._write_internal_array(array, key=key, desc_node=desc_node)
+                    self._metrics.count_rows("array", len(array))
 
         # 2. Write internal tabular data; all data_keys for arrays have been removed from data_cache on step 1
-        if not (table := pyarrow.Table.from_pylist(data_cache)):
+        with self._metrics.time_stage("table"):
+            table = pyarrow.Table.from_pylist(data_cache)
+        if not table:
             return  # Nothing to write
 
         if not (df_client := self._internal_tables.get(desc_name)):
@@ -586,20 +847,137 @@ class _RunWriter(DocumentRouter):
             self._internal_tables[desc_name] = df_client
 
         df_client.append_partition(0, table)
+        self._metrics.count_rows("table", table.num_rows)
+
+    def _write_internal_array(self, array: numpy.ndarray, key: str, desc_node: Container):
+        """Append a batch of internal array data to its zarr-backed node in Tiled
+
+        The zarr storage of the node is preallocated along the first (time) dimension, using `num_points` from
+        the Start document (up to MAX_PREALLOCATED_SIZE bytes) as a hint for the primary stream, and its capacity
+        is doubled whenever it is exhausted. The chunks hold about INTERNAL_CHUNK_SIZE bytes each, independently of
+        the batch size. Data are written in chunk-aligned blocks (rewriting the partially filled chunk at the end,
+        which is kept in memory), so that, unlike patching with `extend=True`, the writes never resize the storage.
+
+        The shape advertised by the node is kept equal to the number of rows written: it is updated before the
+        blocks of each batch are written and restored if writing them fails. Only while the storage is being grown
+        does Tiled briefly advertise its full capacity.
+        """
+
+        desc_name = desc_node.item["id"]
+        if not (arr_client := self._internal_arrays.get(f"{desc_name}/{key}")):
+            # Create a new "internal" array data node with the reserved capacity
+            row_size = max(array[0].nbytes, 1)
+            chunk = max(INTERNAL_CHUNK_SIZE // row_size, 1)
+            hint = (
+                min(self._expected_length or 0, MAX_PREALLOCATED_SIZE // row_size) if desc_name == "primary" else 0
+            )
+            capacity = -(-max(len(array), hint) // chunk) * chunk  # Round up to a whole number of chunks
+            structure = ArrayStructure(
+                shape=(capacity, *array.shape[1:]),
+                chunks=((chunk,) * (capacity // chunk), *((n,) for n in array.shape[1:])),
+                dims=("time",) + tuple(f"dim_{i}" for i in range(1, array.ndim)),
+                data_type=BuiltinDtype.from_numpy_dtype(array.dtype),
+            )
+            arr_client = desc_node.new(
+                key=key,
+                structure_family=StructureFamily.array,
+                data_sources=[DataSource(structure=structure, structure_family=StructureFamily.array)],
+                metadata=truncate_json_overflow(self.data_keys.get(key, {})),
+                specs=[],
+                access_tags=self.access_tags,
+            )
+            self._internal_arrays[f"{desc_name}/{key}"] = arr_client
+            self._internal_array_extents[f"{desc_name}/{key}"] = {
+                "length": 0,
+                "advertised": capacity,
+                "capacity": capacity,
+                "chunk": chunk,
+                "tail": array[:0].copy(),
+                "data_source": arr_client.data_sources()[0],
+            }
+
+        extent = self._internal_array_extents[f"{desc_name}/{key}"]
+        length, chunk, tail = extent["length"], extent["chunk"], extent["tail"]
+        if array.dtype != arr_client.dtype:
+            raise ValueError(
+                f"Data for '{key}' has dtype {array.dtype} which does not match the dtype {arr_client.dtype} of "
+                "the previously written data."
+            )
+
+        # Reserve more capacity, if needed, by writing a single row at the new end of the storage
+        new_length = length + len(array)
+        if new_length > extent["capacity"]:
+            capacity = -(-max(new_length, 2 * extent["capacity"]) // chunk) * chunk
+            last_row = numpy.zeros((1, *array.shape[1:]), dtype=array.dtype)
+            arr_client.patch(last_row, offset=(capacity - 1,), extend=True)
+            extent["capacity"] = extent["advertised"] = capacity
+
+        # Write the new rows, together with those of the partially filled chunk at the end, as whole blocks
+        self._set_internal_array_length(f"{desc_name}/{key}", new_length)
+        try:
+            data = numpy.concatenate([tail, array]) if len(tail) else array
+            first_block = (length - len(tail)) // chunk
+            for pos in range(0, len(data), chunk):
+                block = (first_block + pos // chunk,) + (0,) * (array.ndim - 1)
+                arr_client.write_block(data[pos : pos + chunk], block=block)
+            extent["length"] = new_length
+            extent["tail"] = data[len(data) - new_length % chunk :].copy()
+        finally:
+            if extent["length"] != new_length:
+                self._set_internal_array_length(f"{desc_name}/{key}", extent["length"])
+
+    def _set_internal_array_length(self, full_key: str, length: int):
+        """Set the shape advertised by a zarr-backed internal array node to `length` rows; the storage is kept"""
+
+        extent = self._internal_array_extents[full_key]
+        data_source, chunk = extent["data_source"], extent["chunk"]
+        chunks = [list(dim) for dim in data_source.structure["chunks"]]
+        chunks[0] = [chunk] * (length // chunk) + ([length % chunk] if length % chunk else [])
+        shape = [length, *data_source.structure["shape"][1:]]
+        data_source.structure = {**data_source.structure, "shape": shape, "chunks": chunks}
+        self._update_data_source_for_node(self._internal_arrays[full_key], data_source)
+        extent["advertised"] = length
+
+    def _trim_internal_arrays(self):
+        """Set the shape of the internal arrays to the length of the data actually written, where it differs"""
+
+        for full_key, extent in self._internal_array_extents.items():
+            if extent["advertised"] != extent["length"]:
+                self._set_internal_array_length(full_key, extent["length"])
+
+    def _write_config_updates(self, desc_name: str):
+        """Append the pending configuration updates to the `_config_updates` metadata of the stream node
+
+        The updates are sent as a single JSON Patch with "add" operations, so the size of each request does not
+        depend on the number of updates written before.
+        """
+
+        if not (updates := self._config_updates.pop(desc_name, [])):
+            return
+
+        metadata_patch = []
+        if self._num_config_updates[desc_name] == 0:
+            metadata_patch.append({"op": "add", "path": "/_config_updates", "value": []})
+        metadata_patch.extend({"op": "add", "path": "/_config_updates/-", "value": upd} for upd in updates)
+        self._desc_nodes[desc_name].patch_metadata(metadata_patch=metadata_patch, drop_revision=True)
+        self._num_config_updates[desc_name] += len(updates)
 
     def _update_consolidator(self, doc: StreamDatum):
         """Register the external data from StreamDatum in the Consolidator"""
 
-        sres_uid, desc_uid = doc["stream_resource"], doc["descriptor"]
-        sres_node, consolidator = self.get_sres_node(sres_uid, desc_uid)
-        patch = consolidator.consume_stream_datum(doc)
+        with self._metrics.time_stage("consolidate"):
+            sres_uid, desc_uid = doc["stream_resource"], doc["descriptor"]
+            sres_node, consolidator = self.get_sres_node(sres_uid, desc_uid)
+            patch = consolidator.consume_stream_datum(doc)
+        self._metrics.count_rows("external", doc["indices"]["stop"] - doc["indices"]["start"])
         return sres_node, consolidator, patch
 
     def _update_data_source_for_node(
         self, node: BaseClient, data_source: DataSource, patch: Optional[Patch] = None
     ):
         """Update DataSource of the node in Tiled corresponding to the StreamResource"""
-        data_source.id = node.data_sources()[0].id  # ID of the existing DataSource record
+        if data_source.id is None:
+            data_source.id = node.data_sources()[0].id  # ID of the existing DataSource record
         handle_error(
             node.context.http_client.put(
                 node.uri.replace("/metadata/", "/data_source/", 1),
@@ -613,15 +991,36 @@ class _RunWriter(DocumentRouter):
             )
         ).json()
 
+    def _update_data_source(self, node: BaseClient, consolidator: ConsolidatorBase, patch: Optional[Patch] = None):
+        """Update the DataSource of the node from the Consolidator, sending only the Assets new to Tiled"""
+
+        num_registered = self._num_registered_assets.get(consolidator, 0)
+        data_source = consolidator.get_data_source(skip_assets=num_registered)
+        self._update_data_source_for_node(node, data_source, patch)
+        self._num_registered_assets[consolidator] = num_registered + len(data_source.assets)
+
     def _write_external_data(self, doc: StreamDatum):
         """Register (or update) the external data from StreamDatum in Tiled"""
 
         sres_node, consolidator, patch = self._update_consolidator(doc)
-        self._update_data_source_for_node(sres_node, consolidator.get_data_source(), patch)
+        self._update_data_source(sres_node, consolidator, patch)
+
+    def _validate_consolidator(
+        self, consolidator: ConsolidatorBase
+    ) -> tuple[list[str], Optional[Exception], float]:
+        """Validate (and fix) a consolidator; return the notes, the error (if any), and the elapsed time in s"""
+
+        t0 = time.monotonic()
+        try:
+            notes, error = consolidator.validate(fix_errors=True, sample_size=self._validation_sample_size), None
+        except Exception as e:
+            notes, error = [], e
+        return notes, error, time.monotonic() - t0
 
     def start(self, doc: RunStart):
         doc = copy.copy(doc)
         self.access_tags = doc.pop("tiled_access_tags", None)  # type: ignore
+        self._expected_length = doc.get("num_points")
         self.root_node = self.client.create_container(
             key=doc["uid"],
             metadata={"start": truncate_json_overflow(dict(doc))},
@@ -633,11 +1032,17 @@ class _RunWriter(DocumentRouter):
         if self.root_node is None:
             raise RuntimeError("RunWriter is not properly initialized: no Start document has been recorded.")
 
-        # Write the cached internal data
-        for desc_name, data_cache in self._internal_data_cache.items():
-            if data_cache:
-                self._write_internal_data(data_cache, desc_node=self._desc_nodes[desc_name])
-                data_cache.clear()
+        # Write the cached internal data and configuration updates; make sure that the shapes of the internal
+        # arrays match the data written, even if the run cannot be finalized
+        try:
+            for desc_name, data_cache in self._internal_data_cache.items():
+                if data_cache:
+                    self._write_internal_data(data_cache, desc_node=self._desc_nodes[desc_name])
+                    data_cache.clear()
+            for desc_name in list(self._config_updates.keys()):
+                self._write_config_updates(desc_name)
+        finally:
+            self._trim_internal_arrays()
 
         # Write the cached StreamDatums data.
         # Only update the data_source _once_ per each StreamResource node, even if consuming multiple StreamDatums.
@@ -647,25 +1052,38 @@ class _RunWriter(DocumentRouter):
             updated_node_and_cons[(sres_node, consolidator)].append(patch)
         for (sres_node, consolidator), patches in updated_node_and_cons.items():
             final_patch = Patch.combine_patches(patches)
-            self._update_data_source_for_node(sres_node, consolidator.get_data_source(), patch=final_patch)
+            self._update_data_source(sres_node, consolidator, patch=final_patch)
 
         # Validate structure for some StreamResource nodes, select unique pairs of (sres_node, consolidator)
+        # Validation of different consolidators is independent and I/O-bound, so it is run concurrently.
         notes = []
         node_and_cons = {
-            (sres_node, self._consolidators[sres_uid]) for sres_uid, sres_node in self._sres_nodes.items()
+            (sres_node, self._consolidators[sres_uid])
+            for sres_uid, sres_node in self._sres_nodes.items()
+            if self._consolidators[sres_uid]._sres_parameters.get("_validate", False)
         }
-        for sres_node, consolidator in node_and_cons:
-            if consolidator._sres_parameters.get("_validate", False):
+        if node_and_cons:
+            with ThreadPoolExecutor(max_workers=min(self._max_validation_workers, len(node_and_cons))) as pool:
+                # Run in a copy of the context, so that the requests are counted in the active metrics
+                futures = {
+                    (sres_node, consolidator): pool.submit(
+                        contextvars.copy_context().run, self._validate_consolidator, consolidator
+                    )
+                    for sres_node, consolidator in node_and_cons
+                }
+            for (sres_node, consolidator), future in futures.items():
                 title = f"Validation of data key '{sres_node.item['id']}'"
-                try:
-                    _notes = consolidator.validate(fix_errors=True)
-                    notes.extend([title + ": " + note for note in _notes])
-                except Exception as e:
-                    msg = f"{type(e).__name__}: " + str(e).replace("\n", " ").replace("\r", "").strip()
+                _notes, error, elapsed = future.result()
+                logger.info(f"{title} completed in {elapsed:.3f} s")
+                self._metrics.observe_stage("validate", elapsed)
+                if error is not None:
+                    msg = f"{type(error).__name__}: " + str(error).replace("\n", " ").replace("\r", "").strip()
                     msg = title + f" failed with error: {msg}"
                     warn(msg, stacklevel=2)
                     notes.append(msg)
-                self._update_data_source_for_node(sres_node, consolidator.get_data_source())
+                else:
+                    notes.extend([title + ": " + note for note in _notes])
+                self._update_data_source(sres_node, consolidator)
 
         # Write the stop document to the metadata
         for key in self._internal_arrays.keys():
@@ -702,13 +1120,14 @@ class _RunWriter(DocumentRouter):
             # Rare Case: This new descriptor likely updates stream configs mid-experiment
             # We assume tha the full descriptor has been already received, so we don't need to store everything
             # but only the uid, timestamp, and also data and timestamps in configuration (without conf specs).
+            # The updates are written in batches, together with the Event data or when the run is stopped.
             desc_node = self._desc_nodes[desc_name]
-            updates = desc_node.metadata.get("_config_updates", []) + [{"uid": doc["uid"], "time": doc["time"]}]
+            update = {"uid": doc["uid"], "time": doc["time"]}
             if conf_meta := doc.get("configuration"):
-                updates[-1].update({"configuration": conf_meta})
-            # Update the metadata with the new configuration
-            metadata = {"_config_updates": truncate_json_overflow(updates)}
-            desc_node.update_metadata(metadata=metadata, drop_revision=True)
+                update["configuration"] = conf_meta
+            self._config_updates[desc_name].append(truncate_json_overflow(update))
+            if len(self._config_updates[desc_name]) >= self._batch_size:
+                self._write_config_updates(desc_name)
 
         self._desc_nodes[doc["uid"]] = self._desc_nodes[desc_name] = desc_node  # Keep a reference to the node
 
@@ -765,14 +1184,16 @@ class _RunWriter(DocumentRouter):
                 consolidator.update_from_stream_resource(sres_doc)
             else:
                 consolidator = consolidator_factory(sres_doc, desc_node.metadata)
+                data_source = consolidator.get_data_source()
                 sres_node = desc_node.new(
                     key=consolidator.data_key,
                     structure_family=StructureFamily.array,
-                    data_sources=[consolidator.get_data_source()],
+                    data_sources=[data_source],
                     metadata={},
                     specs=[],
                     access_tags=self.access_tags,
                 )
+                self._num_registered_assets[consolidator] = len(data_source.assets)
 
             self._consolidators[sres_uid] = self._consolidators[full_data_key] = consolidator
             self._sres_nodes[sres_uid] = self._sres_nodes[full_data_key] = sres_node
@@ -836,12 +1257,50 @@ class TiledWriter:
             If specified, this directory will be used to back up runs that fail to be written
             to Tiled. All documents for the entire Bluesky Run will be written in JSONLines format,
             allowing for recovery in case of errors during the writing process.
+        backup_buffer_size : int
+            The number of documents per run kept in memory until the run is written successfully, so that
+            they can be backed up if writing fails; further documents are temporarily spilled to disk in
+            `backup_directory`. This argument is ignored if `backup_directory` is not specified.
         batch_size : int
             The number of Events or StreamDatums collect before writing them to Tiled.
             This is useful for reducing the number of write operations and improving performance when
             writing large amounts of data (e.g. database migration). For streaming applications,
             it is recommended to set this parameter to <= 1, so that each Event or StreamDatum is written
             to Tiled immediately after they are received.
+        max_array_size : int
+            Maximum size of internal arrays from Event documents to write to tabular storage; larger arrays
+            are written as zarr.
+        validation_sample_size : Optional[int]
+            If specified, external data sources consisting of many files (e.g. TIFF sequences) that request
+            validation are validated by opening only the first, the last, and `validation_sample_size` randomly
+            chosen files; the remaining files are only checked for existence and non-zero size. By default,
+            all files are opened.
+        max_validation_workers : int
+            Maximum number of threads used to validate external data sources concurrently when a run stops.
+        max_workers : int
+            If positive, documents are written in background threads: each run gets its own lane, which
+            preserves the order of documents within the run, and up to `max_workers` runs are written
+            concurrently through the shared client (whose HTTP connections are pooled). This speeds up
+            ingestion of interleaved documents from multiple runs, e.g. when replaying them from a message
+            queue. An error is then raised by the next call with a document of the failed run, by the call with
+            its Stop document at the latest (which waits for the run to be written), or by `flush()`, rather than
+            by the call that received the failing document. By default (0), documents are written synchronously
+            in the caller's thread.
+        max_pending : int
+            Maximum number of documents queued for writing across all runs when `max_workers` is positive;
+            the caller blocks until some documents are processed when this limit is reached.
+        spool_directory : Optional[str]
+            If specified, every document is first appended to a local write-ahead spool in this directory
+            (one JSON Lines segment per run) and only then dispatched for writing; the segment of a run is
+            deleted once the run has been written completely. Runs left in the spool, e.g. if the process
+            crashed or the server was unreachable, can be written later with `replay_spool()`.
+        spool_fsync_interval : int
+            The number of documents appended to a spool segment between disk synchronizations; segments are
+            always synchronized after the Stop document.
+
+    The writer collects metrics of its throughput and latency (processing time per document type, time spent in
+    the stages of writing, rows written, and the HTTP requests sent to Tiled); they are available with `stats()`,
+    in the Prometheus text format with `metrics_text()`, or over HTTP with `serve_metrics()`.
     """
 
     def __init__(
@@ -852,33 +1311,193 @@ class TiledWriter:
         patches: Optional[dict[str, Callable]] = None,
         spec_to_mimetype: Optional[dict[str, str]] = None,
         backup_directory: Optional[str] = None,
+        backup_buffer_size: int = BACKUP_BUFFER_SIZE,
         batch_size: int = BATCH_SIZE,
         max_array_size: int = MAX_ARRAY_SIZE,
+        validation_sample_size: Optional[int] = None,
+        max_validation_workers: int = MAX_VALIDATION_WORKERS,
+        max_workers: int = 0,
+        max_pending: int = MAX_PENDING_DOCUMENTS,
+        spool_directory: Optional[str] = None,
+        spool_fsync_interval: int = SPOOL_FSYNC_INTERVAL,
     ):
         self.client = client.include_data_sources()
         self.patches = patches or {}
         self.spec_to_mimetype = spec_to_mimetype or {}
         self.backup_directory = backup_directory
+        self._backup_buffer_size = backup_buffer_size
         self._normalizer = normalizer
         self._run_router = RunRouter([self._factory])
         self._batch_size = batch_size
         self._max_array_size = max_array_size
+        self._validation_sample_size = validation_sample_size
+        self._max_validation_workers = max_validation_workers
+        self._lanes: dict[str, _RunLane] = {}  # Lanes for concurrent writing of runs, by the run uid
+        self._executor: Optional[ThreadPoolExecutor] = None
+        if max_workers > 0:
+            self._executor = ThreadPoolExecutor(max_workers=max_workers, thread_name_prefix="TiledWriter")
+            self._pending = threading.BoundedSemaphore(max_pending)
+        self._spool: Optional[DocumentSpool] = None
+        if spool_directory:
+            self._spool = DocumentSpool(spool_directory, fsync_interval=spool_fsync_interval)
+        self._metrics = WriterMetrics()
+        WriterMetrics.install(self.client.context.http_client)
+        self._metrics_server = None
 
     def _factory(self, name, doc):
         """Factory method to create a callback for writing a single run into Tiled."""
-        cb = run_writer = _RunWriter(self.client, batch_size=self._batch_size, max_array_size=self._max_array_size)
+        cb = run_writer = _RunWriter(
+            self.client,
+            batch_size=self._batch_size,
+            max_array_size=self._max_array_size,
+            validation_sample_size=self._validation_sample_size,
+            max_validation_workers=self._max_validation_workers,
+            metrics=self._metrics,
+        )
 
         if self._normalizer:
             # If normalize is True, create a RunNormalizer callback to update documents to the latest schema
+            # Time the writing separately; the remainder of the processing time is spent on normalization.
             cb = self._normalizer(patches=self.patches, spec_to_mimetype=self.spec_to_mimetype)
-            cb.subscribe(run_writer)
+            cb.subscribe(_Timed(run_writer, self._metrics.observe_stage, label="write"))
+        cb = _Timed(cb, self._metrics.observe_document)
+
+        if self._spool is not None:
+            # Acknowledge the spooled documents once the entire run has been written successfully
+            cb = _AcknowledgeOnStop(cb, self._spool.acknowledge)
 
         if self.backup_directory:
             # If backup_directory is specified, create a conditional backup callback writing documents to JSONLines
-            cb = _ConditionalBackup(cb, [JSONLinesWriter(self.backup_directory)])
+            cb = _ConditionalBackup(
+                cb,
+                [JSONLinesWriter(self.backup_directory)],
+                maxlen=self._backup_buffer_size,
+                spill_directory=self.backup_directory,
+            )
+        cb = _WithMetrics(cb, self._metrics)
+
+        if self._executor is not None:
+            # Process the documents of this run in its own lane on the shared thread pool
+            self._lanes = {
+                uid: lane
+                for uid, lane in self._lanes.items()
+                if not (lane.stopped and lane.join(0) and (lane.error is None or lane.error_raised))
+            }
+            cb = self._lanes[doc["uid"]] = _RunLane(cb, self._executor, self._pending)
 
         return [cb], []
 
+    def flush(self, timeout: Optional[float] = None):
+        """Wait until all documents received so far have been written to Tiled
+
+        This is only relevant when the writer has been initialized with `max_workers > 0`. If writing of any
+        run has failed, and the error has not been raised yet by a call with a document of that run, the first
+        such error is raised.
+
+        Parameters
+        ----------
+        timeout : Optional[float]
+            Maximum time (in seconds) to wait for each run; raises TimeoutError if exceeded.
+        """
+        lanes, errors = list(self._lanes.items()), []
+        for uid, lane in lanes:
+            if not lane.join(timeout):
+                raise TimeoutError(f"Writing of run {uid} has not completed in {timeout} s.")
+            if lane.error is not None and not lane.error_raised:
+                errors.append(lane)
+            if lane.stopped or (lane.error is not None):
+                self._lanes.pop(uid, None)
+        if errors:
+            errors[0].raise_error()
+
+    def close(self):
+        """Write all pending documents and release the worker threads"""
+        try:
+            self.flush()
+        finally:
+            if self._executor is not None:
+                self._executor.shutdown(wait=True)
+            if self._spool is not None:
+                self._spool.close()
+            if self._metrics_server is not None:
+                self._metrics_server.shutdown()
+                self._metrics_server = None
+
+    def stats(self) -> dict[str, Any]:
+        """Return a snapshot of the metrics of writing as a dictionary
+
+        The dictionary includes the number, rate and processing time of documents by type, the time spent in the
+        stages of writing ("write", "table", "array", "consolidate", "validate"), the number of rows written,
+        the latency and the number of HTTP requests with the size of their bodies, and the number of documents
+        waiting to be written when runs are written concurrently.
+        """
+        return self._metrics.stats(queue_depth=self._queue_depth())
+
+    def metrics_text(self) -> str:
+        """Return the metrics of writing in the Prometheus text exposition format"""
+        return self._metrics.to_prometheus(queue_depth=self._queue_depth())
+
+    def serve_metrics(self, port: int, addr: str = "127.0.0.1"):
+        """Expose the metrics in the Prometheus text format over HTTP, in a background thread
+
+        Parameters
+        ----------
+        port : int
+            The port to listen on; if 0, an available port is chosen and can be found in `server_address` of the
+            returned server.
+        addr : str
+            The address to bind to.
+        """
+        if self._metrics_server is None:
+            self._metrics_server = serve_prometheus(self.metrics_text, port=port, addr=addr)
+        return self._metrics_server
+
+    def _queue_depth(self) -> Optional[int]:
+        if self._executor is None:
+            return None
+        return sum(lane.num_pending for lane in list(self._lanes.values()))
+
+    def replay_spool(self) -> list[str]:
+        """Write the runs left in the spool directory to Tiled, e.g. after a crash or a server outage
+
+        Replaying is idempotent: runs that have already been written completely are only removed from the
+        spool, while partially written runs are deleted from Tiled and written again from the spooled documents.
+        Segments of runs that are still incomplete (without a Stop document) are kept in the spool after being
+        replayed. This method should be called before new documents are received.
+
+        Returns
+        -------
+        list[str]
+            The uids of the runs that have been replayed.
+        """
+
+        if self._spool is None:
+            raise RuntimeError("TiledWriter has been initialized without a spool_directory.")
+
+        replayed = []
+        for path in self._spool.segments():
+            run_uid = path.stem
+            if run_uid == DocumentSpool.ORPHAN_SEGMENT:
+                logger.warning(f"Documents not attributed to any run are kept in the spool at {path}.")
+                continue
+            if run_uid in self.client:
+                if "stop" in self.client[run_uid].metadata:
+                    logger.info(f"Run {run_uid} has already been written; removing it from the spool.")
+                    self._spool.acknowledge(run_uid)
+                    continue
+                logger.info(f"Deleting the partially written run {run_uid} before replaying it.")
+                self.client.delete_contents(run_uid, recursive=True, external_only=False)
+
+            logger.info(f"Replaying run {run_uid} from the spool.")
+            for name, doc in self._spool.read_segment(path):
+                self._run_router(name, doc)  # Bypass the spool: the documents are already there
+            replayed.append(run_uid)
+
+        if self._executor is not None:
+            self.flush()
+
+        return replayed
+
     @classmethod
     def from_uri(
         cls,
@@ -924,4 +1543,6 @@ class TiledWriter:
         )
 
     def __call__(self, name, doc):
+        if self._spool is not None:
+            self._spool.append(name, doc)
         self._run_router(name, doc)
@@ -1,7 +1,12 @@
 from math import ceil
 
 import pytest
-from bluesky_tiled_plugins.writing.consolidators import HDF5Consolidator, Patch, consolidator_factory
+from bluesky_tiled_plugins.writing.consolidators import (
+    HDF5Consolidator,
+    Patch,
+    SeqNumsToIndicesMap,
+    consolidator_factory,
+)
 
 
 @pytest.fixture
@@ -516,3 +521,102 @@ def test_combine_patches(patches, expected_shape, expected_offset):
     combined = Patch.combine_patches(patches)
     assert combined.shape == expected_shape
     assert combined.offset == expected_offset
+
+
+@pytest.mark.parametrize("image_format", supported_image_seq_formats)
+def test_image_seq_assets_from_ranges(
+    descriptor, image_seq_stream_resource_factory, stream_datum_factory, image_format
+):
+    stream_resource = image_seq_stream_resource_factory(
+        image_format=image_format, data_key="test_7_imgs", chunk_shape=(1,)
+    )
+    cons = consolidator_factory(stream_resource, descriptor)
+    for i in range(5):
+        cons.consume_stream_datum(stream_datum_factory("test_7_imgs", i, i, i + 1))
+
+    # Consecutive StreamDatums are merged into a single range of file indices
+    assert cons._file_ranges == [range(0, 35)]
+    assert cons.num_files == 35
+
+    expected_uris = [f"{cons.uri}img_{i:06d}.{image_format}" for i in range(35)]
+    assert cons.data_uris == expected_uris
+    assert [asset.data_uri for asset in cons.assets] == expected_uris
+    assert [asset.num for asset in cons.assets] == list(range(1, 36))
+    assert list(cons.get_datum_uris(range(3, 5))) == expected_uris[3:5]
+    assert [asset.data_uri for asset in cons.get_data_source().assets] == expected_uris
+
+    # The lists are extended with the files of new StreamDatums, and only the new Assets can be requested
+    assets = cons.assets
+    cons.consume_stream_datum(stream_datum_factory("test_7_imgs", 5, 5, 6))
+    assert cons.assets is assets
+    assert cons.data_uris[-1] == f"{cons.uri}img_{41:06d}.{image_format}"
+    new_assets = cons.get_data_source(skip_assets=35).assets
+    assert [asset.num for asset in new_assets] == list(range(36, 43))
+
+
+@pytest.mark.parametrize(
+    "updates, expected_runs",
+    [
+        # Consecutive ranges are merged into a single run
+        ([(1, 3, 0), (3, 6, 2), (6, 7, 5)], [(range(1, 7), range(0, 6))]),
+        # Skipped seq_nums start a new run
+        ([(1, 3, 0), (5, 6, 2)], [(range(1, 3), range(0, 2)), (range(5, 6), range(2, 3))]),
+        # Out-of-order ranges are inserted in order
+        ([(5, 6, 2), (1, 3, 0)], [(range(1, 3), range(0, 2)), (range(5, 6), range(2, 3))]),
+        # Overlapping ranges override the existing values
+        (
+            [(1, 11, 0), (4, 6, 20)],
+            [(range(1, 4), range(0, 3)), (range(4, 6), range(20, 22)), (range(6, 11), range(5, 10))],
+        ),
+    ],
+)
+def test_seqnums_to_indices_map(updates, expected_runs):
+    mapping = SeqNumsToIndicesMap()
+    reference = {}
+    for seq_start, seq_stop, idx_start in updates:
+        seq_nums, indices = range(seq_start, seq_stop), range(idx_start, idx_start + seq_stop - seq_start)
+        mapping.update(seq_nums, indices)
+        reference.update(dict(zip(seq_nums, indices)))
+
+    assert mapping.runs() == expected_runs
+    assert dict(mapping) == dict(sorted(reference.items()))
+    assert len(mapping) == len(reference)
+    assert all(mapping[k] == v for k, v in reference.items())
+    with pytest.raises(KeyError):
+        mapping[max(reference) + 1]
+
+
+@pytest.mark.parametrize("join_chunks", [True, False])
+def test_chunks_updated_incrementally(descriptor, csv_stream_resource_factory, stream_datum_factory, join_chunks):
+    stream_resource = csv_stream_resource_factory(data_key="test_7_arrs", chunk_shape=(3,))
+    cons = consolidator_factory(stream_resource, descriptor)
+    cons.join_chunks = join_chunks
+    for i in range(10):
+        cons.consume_stream_datum(stream_datum_factory("test_7_arrs", i, i, i + 1))
+        expected = (3,) * (7 * (i + 1) // 3) + ((7 * (i + 1) % 3,) if 7 * (i + 1) % 3 else ())
+        expected = expected if join_chunks else (3, 3, 1) * (i + 1)
+        assert cons.chunks == (expected, (3,))
+
+
+@pytest.mark.parametrize("sample_size", [None, 1, 3])
+def test_sampled_validation_of_image_seq(descriptor, stream_datum_factory, tmp_path, sample_size):
+    tifffile = pytest.importorskip("tifffile")
+    np = pytest.importorskip("numpy")
+    for i in range(10):
+        tifffile.imwrite(tmp_path / f"img_{i:06d}.tif", np.zeros((10, 15), dtype="float64"))
+    stream_resource = {
+        "data_key": "test_img",
+        "mimetype": "multipart/related;type=image/tiff",
+        "uri": f"file://localhost/{str(tmp_path).lstrip('/')}/",
+        "parameters": {"chunk_shape": (1,), "template": "img_{:06d}.tif"},
+        "uid": "stream-resource-uid-test_img",
+    }
+    cons = consolidator_factory(stream_resource, descriptor)
+    cons.consume_stream_datum(stream_datum_factory("test_img", 0, 0, 10))
+    assert cons.validate(sample_size=sample_size) == []
+
+    # In the sampled mode, missing files are detected without opening them
+    if sample_size is not None:
+        (tmp_path / "img_000004.tif").unlink()
+        with pytest.raises(FileNotFoundError):
+            cons.validate(sample_size=sample_size)
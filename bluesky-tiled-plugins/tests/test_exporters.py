@@ -0,0 +1,312 @@
+import asyncio
+import copy
+import functools
+import io
+import json
+import types
+import zipfile
+
+import numpy
+import pandas
+import pyarrow.parquet
+import pytest
+from bluesky_tiled_plugins import TiledWriter, exporters
+from bluesky_tiled_plugins.exporters import (
+    HDF5RunWriter,
+    _generate_event_pages,
+    _generate_events,
+    _merge_by_time,
+    arrow_exporter,
+    hdf5_exporter,
+    json_seq_exporter,
+    parquet_exporter,
+    read_arrow_export,
+)
+from event_model import compose_run
+
+
+@pytest.fixture(scope="module")
+def client(tmp_path_factory):
+    tiled_catalog = pytest.importorskip("tiled.catalog")
+    tc = pytest.importorskip("tiled.client")
+    tsa = pytest.importorskip("tiled.server.app")
+    from tiled.media_type_registration import default_serialization_registry
+
+    serialization_registry = copy.copy(default_serialization_registry)
+    serialization_registry.register(
+        "BlueskyRun", "application/json-seq", functools.partial(json_seq_exporter, page_size=2)
+    )
+    serialization_registry.register(
+        "BlueskyRun", "application/x-json-seq-events", functools.partial(json_seq_exporter, page_size=None)
+    )
+    serialization_registry.register("BlueskyRun", "application/x-json-seq-default", json_seq_exporter)
+    # Read the tables in several batches of rows
+    serialization_registry.register(
+        "BlueskyRun", "application/vnd.apache.arrow.stream", functools.partial(arrow_exporter, rows_per_batch=3)
+    )
+    serialization_registry.register(
+        "BlueskyRun", "application/zip", functools.partial(parquet_exporter, rows_per_batch=3)
+    )
+    serialization_registry.register(
+        "BlueskyRun", "application/x-hdf5", functools.partial(hdf5_exporter, rows_per_batch=3)
+    )
+    tmp_path = tmp_path_factory.mktemp("tiled_catalog")
+    catalog = tiled_catalog.in_memory(
+        writable_storage={"filesystem": str(tmp_path), "sql": f"duckdb:///{tmp_path}/test.db"},
+    )
+    with tc.Context.from_app(tsa.build_app(catalog, serialization_registry=serialization_registry)) as context:
+        yield tc.from_context(context)
+
+
+@pytest.fixture
+def fetched_rows(monkeypatch):
+    "Numbers of rows of the internal tables fetched from the database by each query of the exporters"
+    fetch_rows = exporters._fetch_rows
+    num_rows = []
+
+    def spy(*args, **kwargs):
+        table = fetch_rows(*args, **kwargs)
+        num_rows.append(table.num_rows)
+        return table
+
+    monkeypatch.setattr(exporters, "_fetch_rows", spy)
+    return num_rows
+
+
+def export(client, uid, format="application/json-seq"):
+    response = client.context.http_client.get(
+        f"{client.context.api_uri}node/full/{uid}", params={"format": format}
+    )
+    response.raise_for_status()
+    if "json-seq" not in format:
+        return response.content
+    return [json.loads(line) for line in response.text.splitlines() if line.strip()]
+
+
+@pytest.fixture(scope="module")
+def run_with_arrays(client):
+    run_bundle = compose_run()
+    tw = TiledWriter(client, batch_size=3, max_array_size=0)  # Write the images to a separate array node
+    tw("start", run_bundle.start_doc)
+    data_keys = {
+        "x": {"source": "", "dtype": "number", "shape": []},
+        "img": {"source": "", "dtype": "array", "dtype_numpy": "<u2", "shape": [2, 3]},
+    }
+    primary = run_bundle.compose_descriptor(name="primary", data_keys=data_keys)
+    tw("descriptor", primary.descriptor_doc)
+    for i in range(7):
+        data = {"x": i * 0.5, "img": numpy.full((2, 3), i, dtype="<u2").tolist()}
+        tw("event", primary.compose_event(data=data, timestamps=dict.fromkeys(data, 0.0), seq_num=i + 1))
+    tw("stop", run_bundle.compose_stop())
+    return run_bundle.start_doc["uid"]
+
+
+def test_merge_by_time():
+    async def source(*times):
+        for t in times:
+            yield {"name": "event", "doc": {"time": t, "source": times}}
+
+    async def merge():
+        return [item async for item in _merge_by_time([source(1, 4, 5), source(), source(2, 3, 4), source(0)])]
+
+    result = asyncio.run(merge())
+    assert [item["doc"]["time"] for item in result] == [0, 1, 2, 3, 4, 4, 5]
+    assert result[4]["doc"]["source"] == (1, 4, 5)  # Ties are resolved by the order of sources
+
+
+@pytest.fixture(scope="module")
+def run_with_two_streams(client):
+    run_bundle = compose_run()
+    documents = [("start", run_bundle.start_doc)]
+    data_keys = {"x": {"source": "", "dtype": "number", "shape": []}}
+    primary = run_bundle.compose_descriptor(name="primary", data_keys=data_keys)
+    baseline = run_bundle.compose_descriptor(name="baseline", data_keys=data_keys)
+    documents += [("descriptor", primary.descriptor_doc), ("descriptor", baseline.descriptor_doc)]
+    t0 = max(primary.descriptor_doc["time"], baseline.descriptor_doc["time"])
+    for i in range(5):
+        documents.append(("event", primary.compose_event(data={"x": i}, timestamps={"x": t0}, seq_num=i + 1)))
+        documents[-1][1]["time"] = t0 + 2 * i + 1
+    for i in range(2):
+        documents.append(("event", baseline.compose_event(data={"x": -i}, timestamps={"x": t0}, seq_num=i + 1)))
+        documents[-1][1]["time"] = t0 + 8 * i
+    documents.append(("stop", run_bundle.compose_stop()))
+
+    tw = TiledWriter(client, batch_size=2)
+    for name, doc in documents:
+        tw(name, doc)
+    return run_bundle.start_doc["uid"]
+
+
+def test_json_seq_exporter_interleaves_streams(client, run_with_two_streams):
+    exported = export(client, run_with_two_streams, "application/x-json-seq-events")
+    names = [item["name"] for item in exported]
+    assert names[0] == "start"
+    assert names[-1] == "stop"
+    assert names.count("descriptor") == 2
+    assert names.count("event") == 7
+
+    events = [item["doc"] for item in exported if item["name"] == "event"]
+    assert [ev["time"] for ev in events] == sorted(ev["time"] for ev in events)
+    assert [ev["data"]["x"] for ev in events] == [0, 0, 1, 2, 3, -1, 4]
+
+
+def test_json_seq_exporter_emits_events_by_default(client, run_with_two_streams):
+    exported = export(client, run_with_two_streams, "application/x-json-seq-default")
+    assert exported == export(client, run_with_two_streams, "application/x-json-seq-events")
+    assert "event_page" not in [item["name"] for item in exported]
+
+
+def test_json_seq_exporter_event_pages(client, run_with_two_streams):
+    exported = export(client, run_with_two_streams)
+    assert [item["name"] for item in exported].count("event") == 0
+    pages = [item["doc"] for item in exported if item["name"] == "event_page"]
+    assert [len(page["seq_num"]) for page in pages] == [2, 2, 2, 1]  # One page of baseline, three of primary
+    assert [page["time"][0] for page in pages] == sorted(page["time"][0] for page in pages)
+    assert [page["data"]["x"] for page in pages] == [[0, -1], [0, 1], [2, 3], [4]]
+    assert pages[1]["seq_num"] == [1, 2]
+    assert pages[1]["timestamps"]["x"] == [pages[0]["timestamps"]["x"][0]] * 2
+
+
+def test_json_seq_exporter_splits_pages_by_descriptor(client):
+    run_bundle = compose_run()
+    data_keys = {"x": {"source": "", "dtype": "number", "shape": []}}
+    conf = {"dev": {"data": {"gain": 1}, "timestamps": {"gain": 0.0}, "data_keys": {"gain": {**data_keys["x"]}}}}
+    primary = run_bundle.compose_descriptor(name="primary", data_keys=data_keys, configuration=conf)
+    conf["dev"]["data"]["gain"] = 2
+    updated = run_bundle.compose_descriptor(name="primary", data_keys=data_keys, configuration=conf)
+    t0 = updated.descriptor_doc["time"]
+    updated.descriptor_doc["time"] = t0 + 0.5  # Applies from the second event
+
+    tw = TiledWriter(client, batch_size=10)
+    tw("start", run_bundle.start_doc)
+    tw("descriptor", primary.descriptor_doc)
+    for i in range(1):
+        tw("event", {**primary.compose_event(data={"x": i}, timestamps={"x": t0}, seq_num=i + 1), "time": t0 + i})
+    tw("descriptor", updated.descriptor_doc)
+    for i in range(1, 4):
+        tw("event", {**updated.compose_event(data={"x": i}, timestamps={"x": t0}, seq_num=i + 1), "time": t0 + i})
+    tw("stop", run_bundle.compose_stop())
+
+    exported = export(client, run_bundle.start_doc["uid"])
+    pages = [item["doc"] for item in exported if item["name"] == "event_page"]
+    descriptors = [item["doc"] for item in exported if item["name"] == "descriptor"]
+    assert len(descriptors) == 2
+    assert [page["data"]["x"] for page in pages] == [[0], [1], [2, 3]]  # The first page is split
+    assert [page["descriptor"] for page in pages] == [descriptors[0]["uid"]] + [descriptors[1]["uid"]] * 2
+
+
+def test_generate_events_in_chunks():
+    table = pandas.DataFrame(
+        {
+            "seq_num": [1, 2, 3],
+            "time": [1.0, 2.0, 3.0],
+            "x": [0.5, 1.5, 2.5],
+            "img": [numpy.full(2, i) for i in range(3)],
+            "ts_x": [0.0] * 3,
+            "ts_img": [0.0] * 3,
+        }
+    )
+
+    class InternalNode:
+        # A table that can only be read a whole partition at a time
+        def structure(self):
+            return types.SimpleNamespace(columns=list(table.columns), npartitions=1)
+
+        async def read_partition(self, partition):
+            return table
+
+    descriptors = [{"uid": "desc", "time": 0.0}, {"uid": "desc-update", "time": 2.5}]
+
+    async def generate():
+        return [item async for item in _generate_events(InternalNode(), descriptors, rows_per_chunk=2)]
+
+    items = asyncio.run(generate())
+    events = [docs[0]["doc"] for _, docs in items]
+    assert [time for time, _ in items] == [1.0, 2.0, 3.0]
+    assert [ev["seq_num"] for ev in events] == [1, 2, 3]
+    assert [ev["data"] for ev in events] == [{"x": 0.5 + i, "img": [i, i]} for i in range(3)]
+    assert [ev["descriptor"] for ev in events] == ["desc", "desc", "desc-update"]
+    assert events[2]["timestamps"] == {"x": 0.0, "img": 0.0}
+
+
+def test_stream_datums_without_internal_data():
+    descriptor = {"uid": "desc", "time": 1.0}
+    stream_resources = [({"uid": "sr-a", "data_key": "a"}, 5), ({"uid": "sr-b", "data_key": "b"}, 3)]
+
+    async def generate():
+        return [item async for item in _generate_event_pages(None, [descriptor], stream_resources, page_size=2)]
+
+    items = asyncio.run(generate())
+    assert all(time == 1.0 for time, _ in items)
+    ranges = [(doc["doc"]["stream_resource"], doc["doc"]["indices"]) for _, docs in items for doc in docs]
+    assert ranges == [
+        ("sr-a", {"start": 0, "stop": 2}),
+        ("sr-b", {"start": 0, "stop": 2}),
+        ("sr-a", {"start": 2, "stop": 4}),
+        ("sr-b", {"start": 2, "stop": 3}),
+        ("sr-a", {"start": 4, "stop": 5}),
+    ]
+
+
+def test_arrow_exporter(client, run_with_arrays, fetched_rows):
+    metadata, tables = read_arrow_export(export(client, run_with_arrays, "application/vnd.apache.arrow.stream"))
+    assert fetched_rows == [3, 3, 1]  # The rows are fetched from the database one batch at a time
+    assert metadata["start"]["uid"] == run_with_arrays
+    assert "stop" in metadata
+    assert list(tables) == ["primary"]
+
+    table = tables["primary"]
+    assert table.num_rows == 7
+    assert table["x"].to_pylist() == [i * 0.5 for i in range(7)]
+    assert table["seq_num"].to_pylist() == list(range(1, 8))
+    images = table["img"].combine_chunks().to_numpy_ndarray()
+    assert images.shape == (7, 2, 3)
+    assert images.dtype == client[run_with_arrays]["primary"]["img"].dtype  # The stored dtype is kept
+    assert (images[:, 1, 2] == numpy.arange(7)).all()
+    descriptor = json.loads(table.schema.metadata[b"bluesky.descriptor"])
+    assert set(descriptor["data_keys"]) == {"x", "img"}
+
+
+def test_parquet_exporter(client, run_with_arrays):
+    archive = zipfile.ZipFile(io.BytesIO(export(client, run_with_arrays, "application/zip")))
+    assert sorted(archive.namelist()) == ["metadata.json", "primary.parquet"]
+    metadata = json.loads(archive.read("metadata.json"))
+    assert metadata["start"]["uid"] == run_with_arrays
+    assert set(metadata["descriptors"]["primary"]["data_keys"]) == {"x", "img"}
+
+    table = pyarrow.parquet.read_table(io.BytesIO(archive.read("primary.parquet")))
+    assert table["x"].to_pylist() == [i * 0.5 for i in range(7)]
+    images = table["img"].combine_chunks().to_numpy_ndarray()
+    assert (images[:, 0, 0] == numpy.arange(7)).all()
+
+
+def test_hdf5_exporter(client, run_with_arrays, tmp_path, fetched_rows):
+    h5py = pytest.importorskip("h5py")
+    path = tmp_path / "run.h5"
+    path.write_bytes(export(client, run_with_arrays, "application/x-hdf5"))
+    assert fetched_rows == [3, 3, 1]  # The rows are fetched from the database one batch at a time
+
+    with h5py.File(path, "r") as file:
+        assert list(file) == [run_with_arrays]
+        run = file[run_with_arrays]
+        assert json.loads(run.attrs["start"])["uid"] == run_with_arrays
+        assert "uid" in json.loads(run.attrs["stop"])
+        stream = run["primary"]
+        assert set(json.loads(stream.attrs["descriptor"])["data_keys"]) == {"x", "img"}
+        assert set(stream["data"]) == {"x", "img"}
+        assert set(stream["timestamps"]) == {"x", "img"}
+        assert list(stream["seq_num"]) == list(range(1, 8))
+        assert list(stream["data/x"]) == [i * 0.5 for i in range(7)]
+        images = stream["data/img"]
+        assert images.shape == (7, 2, 3)
+        assert images.compression == "gzip"
+        assert (images[:, 1, 2] == numpy.arange(7)).all()
+
+
+def test_hdf5_slabs():
+    # Slabs consist of whole chunks of about HDF5_SLAB_BYTES
+    assert HDF5RunWriter.slabs((10,), "f8", chunk_rows=4) == [(0, 10)]
+    frame_rows = HDF5RunWriter.slabs((1000, 1024, 1024), "u2", chunk_rows=5)
+    assert frame_rows[:2] == [(0, 30), (30, 60)]
+    assert frame_rows[-1] == (990, 1000)
+    assert HDF5RunWriter.slabs((3, 8192, 8192), "f8", chunk_rows=1) == [(0, 1), (1, 2), (2, 3)]
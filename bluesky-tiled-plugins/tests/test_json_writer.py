@@ -1,5 +1,6 @@
 import json
 import os
+import time
 
 import pytest
 from bluesky_tiled_plugins.writing._json_writer import JSONLinesWriter, JSONWriter
@@ -40,3 +41,74 @@ def test_custom_filename(tmpdir, writer_class, extension):
     doc = {"uid": "value"}
     writer("start", doc)
     assert os.path.exists(os.path.join(tmpdir, f"custom.{extension}"))
+
+
+def test_jsonl_writer_buffered(tmpdir):
+    writer = JSONLinesWriter(tmpdir, flush_interval=3600)
+    writer("start", {"uid": "abc"})
+    writer("event", {"seq_num": 1, "data": {"x": 1}})
+    filename = os.path.join(tmpdir, "abc.jsonl")
+    assert read_jsonl_file(filename) == []  # Documents are kept in the buffer
+
+    writer.flush()
+    assert len(read_jsonl_file(filename)) == 2
+
+    writer("stop", {"exit_status": "success"})
+    assert writer._file is None  # The file is closed after the Stop document
+    assert [item["name"] for item in read_jsonl_file(filename)] == ["start", "event", "stop"]
+
+
+def test_jsonl_writer_flushes_from_timer(tmpdir):
+    writer = JSONLinesWriter(tmpdir, flush_interval=0.2)
+    writer("start", {"uid": "abc"})
+    writer("event", {"seq_num": 1, "data": {"x": 1}})
+    filename = os.path.join(tmpdir, "abc.jsonl")
+    assert read_jsonl_file(filename) == []
+
+    time.sleep(1)  # No more documents are written, but the buffer is flushed
+    assert len(read_jsonl_file(filename)) == 2
+    writer.close()
+
+
+def test_jsonl_writer_flushes_on_error(tmpdir):
+    with JSONLinesWriter(tmpdir, flush_interval=3600) as writer:
+        writer("start", {"uid": "abc"})
+        with pytest.raises(TypeError):
+            writer("event", {"seq_num": 1, "data": {"x": object()}})
+        assert len(read_jsonl_file(os.path.join(tmpdir, "abc.jsonl"))) == 1
+        writer("event", {"seq_num": 2, "data": {"x": 2}})
+    assert writer._file is None
+    assert [item["doc"].get("seq_num") for item in read_jsonl_file(os.path.join(tmpdir, "abc.jsonl"))] == [None, 2]
+
+
+@pytest.mark.parametrize("unpack_pages", [True, False])
+def test_jsonl_writer_pages(tmpdir, unpack_pages):
+    writer = JSONLinesWriter(tmpdir, unpack_pages=unpack_pages)
+    event_page = {
+        "descriptor": "d",
+        "uid": ["e1", "e2"],
+        "seq_num": [1, 2],
+        "time": [0.0, 1.0],
+        "data": {"x": [1, 2]},
+        "timestamps": {"x": [0.0, 1.0]},
+        "filled": {},
+    }
+    writer("start", {"uid": "abc"})
+    writer("event_page", event_page)
+    writer("stop", {"exit_status": "success"})
+
+    names = [item["name"] for item in read_jsonl_file(os.path.join(tmpdir, "abc.jsonl"))]
+    assert names == (["start", "event", "event", "stop"] if unpack_pages else ["start", "event_page", "stop"])
+
+
+def test_jsonl_writer_zstd(tmpdir):
+    zstandard = pytest.importorskip("zstandard")
+
+    for uid in ("first", "second"):
+        writer = JSONLinesWriter(tmpdir, filename="docs.jsonl.zst", compression="zstd")
+        writer("start", {"uid": uid})
+        writer("stop", {"exit_status": "success"})
+
+    with open(os.path.join(tmpdir, "docs.jsonl.zst"), "rb") as f:
+        lines = zstandard.ZstdDecompressor().stream_reader(f, read_across_frames=True).read().splitlines()
+    assert [json.loads(line)["doc"].get("uid") for line in lines] == ["first", None, "second", None]
@@ -1,10 +1,16 @@
+import itertools
 import json
 import os
+import threading
+import time
 import uuid
+from collections import defaultdict
 from collections.abc import Iterator
+from concurrent.futures import ThreadPoolExecutor
 from pathlib import Path
 from typing import Optional, Union, cast
 from urllib.parse import parse_qs, urlparse
+from urllib.request import urlopen
 
 import bluesky.plan_stubs as bps
 import bluesky.plans as bp
@@ -23,10 +29,14 @@ from bluesky.protocols import (
     WritesStreamAssets,
 )
 from bluesky_tiled_plugins import TiledWriter
+from bluesky_tiled_plugins.writing._spool import DocumentSpool
+from bluesky_tiled_plugins.writing.tiled_writer import _RunLane, _RunWriter
+from event_model import compose_run
 from event_model.documents.event_descriptor import DataKey
 from event_model.documents.stream_datum import StreamDatum
 from event_model.documents.stream_resource import StreamResource
 from tiled.client import record_history
+from tiled.client.array import ArrayClient
 
 rng = np.random.default_rng(12345)
 
@@ -300,6 +310,44 @@ def test_stream_datum_readable_counts(RE, client, tmp_path):
     assert stream[keys[2]].read() is not None
 
 
+def test_stream_datum_sends_only_new_assets(RE, client, tmp_path, monkeypatch):
+    sent_assets = defaultdict(list)
+    update_data_source = _RunWriter._update_data_source_for_node
+
+    def spy(self, node, data_source, patch=None):
+        sent_assets[node.item["id"]].append([asset.data_uri for asset in data_source.assets])
+        return update_data_source(self, node, data_source, patch)
+
+    monkeypatch.setattr(_RunWriter, "_update_data_source_for_node", spy)
+    det = StreamDatumReadableCollectable(name="det", root=str(tmp_path))
+    RE(bp.count([det], 3), TiledWriter(client, batch_size=1))
+    stream = client.values().last()["primary"]
+
+    tiff_key = next(key for key in stream.base.keys() if key.endswith("sd3"))
+    updates = sent_assets[tiff_key]
+    assert [len(assets) for assets in updates] == [1, 1, 1, 0]  # One new file per event, none after validation
+    all_sent = [uri for assets in updates for uri in assets]
+    assert len(all_sent) == len(set(all_sent)) == 3
+    registered = stream[tiff_key].data_sources()[0].assets
+    assert sorted(asset.data_uri for asset in registered) == sorted(all_sent)
+    assert stream[tiff_key].read().shape == (3, 10, 5, 7, 4)
+
+
+@pytest.mark.parametrize("validation_sample_size", [None, 0, 2, 20])
+def test_stream_datum_readable_sampled_validation(RE, client, tmp_path, validation_sample_size):
+    tw = TiledWriter(client, validation_sample_size=validation_sample_size, max_validation_workers=2)
+    det = StreamDatumReadableCollectable(name="det", root=str(tmp_path))
+    RE(bp.count([det], 10), tw)
+    run = client.values().last()
+    stream = run["primary"]
+    keys = sorted(set(stream.base.keys()).difference({"internal"}))
+
+    assert stream[keys[0]].shape == (10,)
+    assert stream[keys[2]].shape == (10, 10, 5, 7, 4)
+    assert stream[keys[2]].read() is not None
+    assert not any("failed" in note for note in run.metadata.get("notes", []))
+
+
 def test_stream_datum_readable_with_two_detectors(RE, client, tmp_path):
     det1 = StreamDatumReadableCollectable(name="det1", root=str(tmp_path))
     det2 = StreamDatumReadableCollectable(name="det2", root=str(tmp_path))
@@ -382,6 +430,123 @@ def test_with_correct_sample_runs(client, batch_size, external_assets_folder, fn
         assert stream.read() is not None
 
 
+def test_concurrent_interleaved_runs(client, external_assets_folder):
+    # NOTE: The in-memory test catalog can not serve concurrent writes, so only one worker is used here;
+    # concurrency across lanes is tested separately in test_run_lanes_preserve_order.
+    tw = TiledWriter(client, max_workers=1, max_pending=5)
+    fnames = ["internal_events", "external_assets", "external_assets_legacy", "internal_events"]
+    runs = [list(render_templated_documents(fname + ".json", external_assets_folder)) for fname in fnames]
+    uids = [run[0]["doc"]["uid"] for run in runs]
+
+    # Interleave the documents from all runs, preserving their order within each run
+    for items in itertools.zip_longest(*runs):
+        for item in items:
+            if item is not None:
+                tw(**item)
+    tw.close()
+
+    for uid in uids:
+        run = client[uid]
+        assert "stop" in run.metadata
+        for stream in run.values():
+            assert stream.read() is not None
+
+
+def test_run_lanes_preserve_order():
+    executor = ThreadPoolExecutor(max_workers=4)
+    semaphore = threading.BoundedSemaphore(10)
+    received = defaultdict(list)
+    threads = defaultdict(set)
+
+    def callback_factory(run):
+        def callback(name, doc):
+            time.sleep(0.001)
+            received[run].append(doc["i"])
+            threads[run].add(threading.get_ident())
+
+        return callback
+
+    lanes = {run: _RunLane(callback_factory(run), executor, semaphore) for run in range(6)}
+    for i in range(50):
+        for lane in lanes.values():
+            lane("event", {"i": i})
+    for lane in lanes.values():
+        assert lane.join(timeout=10)
+    executor.shutdown()
+
+    for run in lanes:
+        assert received[run] == list(range(50))
+    assert len(set().union(*threads.values())) > 1
+
+
+def test_concurrent_writing_errors(client, monkeypatch):
+    def patched_event(name, doc):
+        raise RuntimeError("This is a test error")
+
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer._RunWriter.event", patched_event)
+    tw = TiledWriter(client, max_workers=2)
+    items = list(render_templated_documents("internal_events.json", ""))
+    with pytest.raises(RuntimeError, match="test error"):
+        for item in items:  # Raised by the Stop document at the latest
+            tw(**item)
+    assert item["name"] != "start"
+    tw.flush()  # The error has been raised once
+    tw.close()
+
+
+def test_concurrent_interleaved_runs_with_errors(client, monkeypatch):
+    # The writing itself is replaced, since the in-memory test catalog can not serve concurrent writes
+    received = defaultdict(list)
+
+    def patched_call(self, name, doc):
+        time.sleep(0.001)
+        run_uid = doc["uid"] if name == "start" else doc.get("run_start", self._run_uid)
+        self._run_uid = run_uid
+        seq_num = doc["seq_num"][0] if name == "event_page" else None  # The router sends Events as pages
+        received[run_uid].append((name, seq_num))
+        if run_uid == failing_uid and seq_num == 3:
+            raise RuntimeError("This is a test error")
+
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer._RunWriter.__call__", patched_call)
+    tw = TiledWriter(client, normalizer=None, max_workers=4)
+    runs, expected = [], {}
+    for _ in range(4):
+        run_bundle = compose_run()
+        desc_bundle = run_bundle.compose_descriptor(
+            name="primary", data_keys={"x": {"source": "", "dtype": "number", "shape": []}}
+        )
+        docs = [("start", run_bundle.start_doc), ("descriptor", desc_bundle.descriptor_doc)]
+        docs += [
+            ("event", desc_bundle.compose_event(data={"x": i}, timestamps={"x": 0.0}, seq_num=i + 1))
+            for i in range(20)
+        ]
+        docs.append(("stop", run_bundle.compose_stop()))
+        runs.append(docs)
+        expected[run_bundle.start_doc["uid"]] = [
+            (name + "_page" if name == "event" else name, doc.get("seq_num")) for name, doc in docs
+        ]
+    failing_uid = runs[1][0][1]["uid"]
+
+    errors = []
+    for items in zip(*runs):
+        for run_index, (name, doc) in enumerate(items):
+            try:
+                tw(name, doc)
+            except RuntimeError as err:
+                errors.append((run_index, err))
+    tw.close()
+
+    # The error is raised once, by a later document of the failed run (by its Stop document at the latest)
+    assert len(errors) == 1
+    assert errors[0][0] == 1
+    # The other runs are written completely and in order; the failed one up to the failing document
+    for uid, docs in expected.items():
+        if uid == failing_uid:
+            assert received[uid] == docs[:5]
+        else:
+            assert received[uid] == docs
+
+
 def test_dims_names(client, external_assets_folder):
     tw = TiledWriter(client)
 
@@ -633,6 +798,93 @@ def test_json_backup(client, tmpdir, monkeypatch):
     assert lines[6]["name"] == "stop"
 
 
+def test_json_backup_spilled_to_disk(client, tmpdir, monkeypatch):
+    def patched_stop(name, doc):
+        raise RuntimeError("This is a test error to check the backup functionality")
+
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer._RunWriter.stop", patched_stop)
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer.SEGMENT_SIZE", 2)
+
+    tw = TiledWriter(client, backup_directory=str(tmpdir), backup_buffer_size=2)
+    for item in render_templated_documents("internal_events.json", ""):
+        if item["name"] == "start":
+            uid = item["doc"]["uid"]
+        tw(**item)
+
+    # All documents, including those spilled to disk, are backed up in order; the spilled segments are removed
+    with open(tmpdir / f"{uid[:8]}.jsonl") as f:
+        lines = [json.loads(line) for line in f if line.strip()]
+    expected_names = [item["name"] for item in render_templated_documents("internal_events.json", "")]
+    assert [line["name"].replace("event_page", "event") for line in lines] == expected_names
+    assert not list(Path(tmpdir).glob(".buffer-*"))
+
+
+def test_backup_buffer_removed_after_clean_stop(client, tmpdir):
+    tw = TiledWriter(client, backup_directory=str(tmpdir), backup_buffer_size=1)
+    for item in render_templated_documents("internal_events.json", ""):
+        if item["name"] == "event":
+            assert list(Path(tmpdir).glob(".buffer-*"))  # The buffer has been spilled to disk
+        tw(**item)
+
+    assert not list(Path(tmpdir).iterdir())  # No backup files and no buffer segments remain
+
+
+def test_spool_removed_after_clean_stop(client, tmpdir):
+    tw = TiledWriter(client, spool_directory=str(tmpdir), spool_fsync_interval=2)
+    for item in render_templated_documents("internal_events.json", ""):
+        if item["name"] == "start":
+            uid = item["doc"]["uid"]
+        tw(**item)
+        if item["name"] != "stop":
+            assert Path(tmpdir).joinpath(f"{uid}.jsonl").exists()
+
+    assert not list(Path(tmpdir).iterdir())
+    assert "stop" in client[uid].metadata
+
+
+@pytest.mark.parametrize("partially_written", [True, False])
+def test_spool_replay(client, tmpdir, partially_written):
+    documents = list(render_templated_documents("internal_events.json", ""))
+    uid = documents[0]["doc"]["uid"]
+
+    # Simulate a crash before the Stop document has been written to Tiled
+    tw = TiledWriter(client, spool_directory=str(tmpdir))
+    for item in documents[:-1] if partially_written else []:
+        tw(**item)
+    tw.close()
+    with open(Path(tmpdir) / f"{uid}.jsonl", "ab") as f:
+        for item in documents if not partially_written else documents[-1:]:
+            f.write(json.dumps(item).encode() + b"\n")
+        f.write(b'{"name": "stop", "do')  # Incomplete record
+
+    if partially_written:
+        assert uid in client
+        assert "stop" not in client[uid].metadata
+
+    tw = TiledWriter(client, spool_directory=str(tmpdir))
+    assert tw.replay_spool() == [uid]
+    assert "stop" in client[uid].metadata
+    assert client[uid]["primary"].read() is not None
+    assert not list(Path(tmpdir).iterdir())
+
+    # Replaying again is a no-op
+    assert tw.replay_spool() == []
+
+
+def test_spool_keeps_orphan_documents(client, tmpdir):
+    spool = DocumentSpool(str(tmpdir))
+    datum = {"datum_id": "unknown/0", "resource": "unknown", "datum_kwargs": {}}
+    spool.append("datum", datum)  # No run is open to attribute the document to
+    spool.close()
+
+    orphans = Path(tmpdir) / f"{DocumentSpool.ORPHAN_SEGMENT}.jsonl"
+    assert list(DocumentSpool.read_segment(orphans)) == [("datum", datum)]
+
+    tw = TiledWriter(client, spool_directory=str(tmpdir))
+    assert tw.replay_spool() == []
+    assert orphans.exists()
+
+
 @pytest.mark.parametrize(
     "max_array_size, expected_scheme", [(0, "file"), (4, "file"), (16, "duckdb"), (-1, "duckdb")]
 )
@@ -663,3 +915,192 @@ def test_internal_arrays_written_as_zarr(client, max_array_size, expected_scheme
         assert "long" not in run["primary"].base
         assert "long" in internal_table.columns
         assert run["primary"]["long"].data_sources() is None
+
+
+@pytest.mark.parametrize("num_points", [None, 3, 7, 100, 10**15])
+@pytest.mark.parametrize("chunk_size", [3 * 40, 8 * 1024**2])
+def test_internal_arrays_preallocated(client, monkeypatch, num_points, chunk_size):
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer.INTERNAL_CHUNK_SIZE", chunk_size)
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer.MAX_PREALLOCATED_SIZE", 1000 * 40)
+    tw = TiledWriter(client, batch_size=4, max_array_size=0)
+
+    run_bundle = compose_run(metadata={"num_points": num_points} if num_points else {})
+    tw("start", run_bundle.start_doc)
+    data_keys = {"wave": {"source": "", "dtype": "array", "shape": [5], "dtype_numpy": "<f8"}}
+    desc_bundle = run_bundle.compose_descriptor(name="primary", data_keys=data_keys)
+    tw("descriptor", desc_bundle.descriptor_doc)
+    waves = rng.random((11, 5))
+    for i, wave in enumerate(waves):
+        tw(
+            "event",
+            desc_bundle.compose_event(data={"wave": wave}, timestamps={"wave": time.time()}, seq_num=i + 1),
+        )
+        if (i + 1) % 4 == 0:
+            arr_client = client[run_bundle.start_doc["uid"]]["primary"].base["wave"]
+            assert arr_client.shape == (i + 1, 5)  # Only the rows written so far are advertised
+            assert np.array_equal(arr_client.read(), waves[: i + 1])
+    tw("stop", run_bundle.compose_stop())
+
+    arr_client = client[run_bundle.start_doc["uid"]]["primary"].base["wave"]
+    assert arr_client.shape == (11, 5)
+    assert sum(arr_client.chunks[0]) == 11
+    assert np.array_equal(arr_client.read(), waves)
+
+
+@pytest.mark.parametrize("batch_size", [1, 4])
+def test_internal_array_chunks_do_not_depend_on_batch_size(client, monkeypatch, batch_size):
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer.INTERNAL_CHUNK_SIZE", 3 * 40)
+    tw = TiledWriter(client, batch_size=batch_size, max_array_size=0)
+
+    run_bundle = compose_run(metadata={"num_points": 7})
+    tw("start", run_bundle.start_doc)
+    data_keys = {"wave": {"source": "", "dtype": "array", "shape": [5], "dtype_numpy": "<f8"}}
+    desc_bundle = run_bundle.compose_descriptor(name="primary", data_keys=data_keys)
+    tw("descriptor", desc_bundle.descriptor_doc)
+    waves = rng.random((7, 5))
+    for i, wave in enumerate(waves):
+        tw(
+            "event",
+            desc_bundle.compose_event(data={"wave": wave}, timestamps={"wave": time.time()}, seq_num=i + 1),
+        )
+    arr_client = client[run_bundle.start_doc["uid"]]["primary"].base["wave"]
+    assert arr_client.chunks[0] == (
+        (3, 3, 1) if batch_size == 1 else (3, 1)
+    )  # Rows of 40 bytes in 120-byte chunks
+    tw("stop", run_bundle.compose_stop())
+    arr_client = client[run_bundle.start_doc["uid"]]["primary"].base["wave"]
+    assert arr_client.chunks[0] == (3, 3, 1)
+    assert np.array_equal(arr_client.read(), waves)
+
+
+def test_internal_arrays_of_unstopped_run(client, monkeypatch):
+    # If the writer dies before the Stop document, the arrays advertise only the rows that have been written
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer.INTERNAL_CHUNK_SIZE", 3 * 40)
+    tw = TiledWriter(client, batch_size=4, max_array_size=0)
+
+    run_bundle = compose_run(metadata={"num_points": 10})
+    tw("start", run_bundle.start_doc)
+    data_keys = {"wave": {"source": "", "dtype": "array", "shape": [5], "dtype_numpy": "<f8"}}
+    desc_bundle = run_bundle.compose_descriptor(name="primary", data_keys=data_keys)
+    tw("descriptor", desc_bundle.descriptor_doc)
+    waves = rng.random((6, 5)) + 1
+    for i, wave in enumerate(waves):
+        tw(
+            "event",
+            desc_bundle.compose_event(data={"wave": wave}, timestamps={"wave": time.time()}, seq_num=i + 1),
+        )
+    del tw  # No Stop document; the last 2 Events were never flushed
+
+    stream = client[run_bundle.start_doc["uid"]]["primary"].base
+    assert stream["wave"].shape == (4, 5)
+    assert len(stream["internal"].read()) == 4
+    assert np.array_equal(stream["wave"].read(), waves[:4])
+
+
+def test_internal_array_shape_restored_if_writing_fails(client, monkeypatch):
+    monkeypatch.setattr("bluesky_tiled_plugins.writing.tiled_writer.INTERNAL_CHUNK_SIZE", 3 * 40)
+    tw = TiledWriter(client, batch_size=2, max_array_size=0)
+
+    run_bundle = compose_run(metadata={"num_points": 10})
+    tw("start", run_bundle.start_doc)
+    data_keys = {"wave": {"source": "", "dtype": "array", "shape": [5], "dtype_numpy": "<f8"}}
+    desc_bundle = run_bundle.compose_descriptor(name="primary", data_keys=data_keys)
+    tw("descriptor", desc_bundle.descriptor_doc)
+    waves = rng.random((4, 5))
+    for i, wave in enumerate(waves[:2]):
+        tw(
+            "event",
+            desc_bundle.compose_event(data={"wave": wave}, timestamps={"wave": time.time()}, seq_num=i + 1),
+        )
+
+    def failing_write_block(self, *args, **kwargs):
+        raise RuntimeError("Storage is unavailable")
+
+    monkeypatch.setattr(ArrayClient, "write_block", failing_write_block)
+    tw("event", desc_bundle.compose_event(data={"wave": waves[2]}, timestamps={"wave": time.time()}, seq_num=3))
+    with pytest.raises(RuntimeError, match="Storage is unavailable"):
+        tw(
+            "event",
+            desc_bundle.compose_event(data={"wave": waves[3]}, timestamps={"wave": time.time()}, seq_num=4),
+        )
+
+    arr_client = client[run_bundle.start_doc["uid"]]["primary"].base["wave"]
+    assert arr_client.shape == (2, 5)  # The rows that could not be written are not advertised
+    assert np.array_equal(arr_client.read(), waves[:2])
+
+
+@pytest.mark.parametrize("batch_size", [1, 2, 100])
+def test_config_updates_written_in_batches(client, batch_size):
+    tw = TiledWriter(client, batch_size=batch_size)
+
+    run_bundle = compose_run()
+    tw("start", run_bundle.start_doc)
+    data_keys = {"det": {"source": "", "dtype": "number", "shape": []}}
+    for i in range(5):
+        configuration = {"det": {"data": {"gain": i}, "timestamps": {"gain": time.time()}, "data_keys": {}}}
+        desc_bundle = run_bundle.compose_descriptor(
+            name="primary", data_keys=data_keys, configuration=configuration, object_keys={"det": ["det"]}
+        )
+        tw("descriptor", desc_bundle.descriptor_doc)
+        tw("event", desc_bundle.compose_event(data={"det": i}, timestamps={"det": time.time()}, seq_num=i + 1))
+    tw("stop", run_bundle.compose_stop())
+
+    stream = client[run_bundle.start_doc["uid"]]["primary"]
+    updates = stream.metadata["_config_updates"]
+    assert [upd["configuration"]["det"]["data"]["gain"] for upd in updates] == [1, 2, 3, 4]
+    assert stream.metadata["configuration"]["det"]["data"]["gain"] == 0
+
+
+def test_writer_stats(client, external_assets_folder):
+    tw = TiledWriter(client, batch_size=2)
+    for item in render_templated_documents("external_assets.json", external_assets_folder):
+        tw(**item)
+    for item in render_templated_documents("internal_events.json", ""):
+        tw(**item)
+
+    stats = tw.stats()
+    assert stats["documents"]["start"]["count"] == 2
+    assert stats["documents"]["event_page"]["count"] == 6  # Events are routed as single-event pages
+    assert stats["documents"]["event_page"]["rate"] > 0
+    assert {"write", "table", "consolidate"}.issubset(stats["stages"].keys())
+    assert stats["rows"]["table"] == 6  # Three Events in each run
+    assert stats["rows"]["external"] > 0
+    assert stats["requests"]["latency"]["POST"]["count"] > 0
+    assert stats["requests"]["bytes_sent"] > 0
+    assert "queue_depth" not in stats
+
+    text = tw.metrics_text()
+    assert 'bluesky_tiled_writer_document_seconds_count{name="event_page"} 6' in text
+    assert 'bluesky_tiled_writer_rows_total{kind="table"} 6' in text
+
+    server = tw.serve_metrics(port=0)
+    with urlopen(f"http://127.0.0.1:{server.server_address[1]}/metrics") as response:
+        assert "bluesky_tiled_writer_sent_bytes_total" in response.read().decode()
+
+    tw.close()
+    num_requests = tw.stats()["requests"]["latency"]["POST"]["count"]
+    client.create_container()  # Requests not sent on behalf of the writer are not counted
+    assert tw.stats()["requests"]["latency"]["POST"]["count"] == num_requests
+
+
+def test_writer_stats_shared_client(client):
+    http_client = client.context.http_client
+    tw1 = TiledWriter(client)
+    num_hooks = len(http_client.event_hooks["request"]), len(http_client.event_hooks["response"])
+    tw2 = TiledWriter(client)
+    TiledWriter(client).close()
+    # The hooks are shared by all writers
+    assert (len(http_client.event_hooks["request"]), len(http_client.event_hooks["response"])) == num_hooks
+
+    for item in render_templated_documents("internal_events.json", ""):
+        tw1(**item)
+    stats1, stats2 = tw1.stats(), tw2.stats()
+    assert stats1["requests"]["latency"]["POST"]["count"] > 0
+    assert stats2["requests"]["latency"] == {}
+    assert stats2["requests"]["bytes_sent"] == 0
+
+    num_requests = stats1["requests"]["latency"]["POST"]["count"]
+    for item in render_templated_documents("internal_events.json", ""):  # Rendered with new uids
+        tw2(**item)
+    assert tw1.stats()["requests"]["latency"]["POST"]["count"] == num_requests
+    assert tw2.stats()["requests"]["latency"]["POST"]["count"] == num_requests
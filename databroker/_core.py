@@ -954,12 +954,12 @@ class BrokerES(object):
 
         Parameters
         ----------
-        name : {'start', 'descriptor', 'event', 'stop'}
+        name : {'start', 'descriptor', 'event', 'event_page', 'stop'}
             Document type
         doc : dict
             Document
         """
-        if name in {'event', 'bulk_events', 'descriptor'}:
+        if name in {'event', 'event_page', 'bulk_events', 'descriptor'}:
             return self.event_source_for_insert.insert(name, doc)
         # We are transitioning from ophyd objects inserting directly into a
         # Registry to ophyd objects passing documents to the RunEngine which in
@@ -1921,8 +1921,10 @@ class BrokerES(object):
 
         for k in fill_keys:
             reg = registry_map[k]
-            # TODO someday we will have bulk retrieve on assets.Registry
-            table[k] = [reg.retrieve(value) for value in table[k]]
+            if hasattr(reg, 'bulk_retrieve'):
+                table[k] = list(reg.bulk_retrieve(table[k]))
+            else:
+                table[k] = [reg.retrieve(value) for value in table[k]]
 
         return table
 
@@ -1,16 +1,40 @@
+import bisect
+import threading
+from collections import OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+
+import numpy
 from pims import FramesSequence, Frame
 
+# Number of chunks read ahead, in the background, of the chunk of the last frame accessed
+PREFETCH_CHUNKS = 2
+
+# Maximum total size in bytes of the decoded chunks kept in memory
+CACHE_SIZE = 512 * 1024**2
+
 
 class Images(FramesSequence):
-    def __init__(self, data_array):
+    def __init__(self, data_array, prefetch=PREFETCH_CHUNKS, cache_size=CACHE_SIZE):
         """
         This class is deprecated.
 
         Load images from a detector for given Header(s).
 
+        The frames are read one chunk (of the underlying dask array) at a time.
+        Decoded chunks are kept in a least-recently-used cache of bounded size
+        and, while frames are accessed, the next chunks are read ahead in a
+        background thread, so that iterating over the frames does not wait for
+        each chunk to be fetched.
+
         Parameters
         ----------
-        data_array : xarray.DataArray
+        data_array : xarray.DataArray or list of xarray.DataArray
+            The images, e.g. one array per header; the frames are concatenated
+            along the first dimension.
+        prefetch : int, optional
+            Number of chunks read ahead; 0 disables prefetching.
+        cache_size : int, optional
+            Maximum total size in bytes of the chunks kept in memory.
 
         Example
         -------
@@ -21,10 +45,34 @@ class Images(FramesSequence):
         """
         # warn("Images and get_images are deprecated. Use Header.data(), "
         #      "Header.xarray() or Header.xarray_dask() instead.", stacklevel=3)
-        self._data_array = data_array
-        self._dtype = data_array.dtype
-        self._shape = data_array.shape[1:]
-        self._len = len(data_array)
+        if not isinstance(data_array, (list, tuple)):
+            data_array = [data_array]
+        self._data_arrays = data_array
+        self._dtype = data_array[0].dtype
+        self._shape = data_array[0].shape[1:]
+        self._prefetch = prefetch
+        self._cache_size = cache_size
+
+        # Boundaries of the chunks along the first dimension: (start, stop) in the
+        # concatenated frames, and the array and offset they are read from.
+        self._chunks = []
+        start = 0
+        for array in data_array:
+            chunks = getattr(array.data, "chunks", None)
+            offset = 0
+            for size in (chunks[0] if chunks else (len(array),)):
+                if size:
+                    self._chunks.append((start, start + size, array, offset))
+                    start += size
+                    offset += size
+        self._starts = [chunk[0] for chunk in self._chunks]
+        self._len = start
+
+        self._cache = OrderedDict()  # Decoded chunks by index, in the order of use
+        self._cache_nbytes = 0
+        self._pending = {}  # Futures of the chunks being prefetched, by index
+        self._lock = threading.Lock()
+        self._executor = None
 
     @property
     def pixel_type(self):
@@ -38,5 +86,81 @@ class Images(FramesSequence):
         return self._len
 
     def get_frame(self, i):
-        img = self._data_array[i]
-        return Frame(img.data, frame_no=i)
+        index = bisect.bisect_right(self._starts, i) - 1
+        chunk = self._get_chunk(index)
+        self._schedule_prefetch(index)
+        return Frame(chunk[i - self._chunks[index][0]], frame_no=i)
+
+    def cache_info(self):
+        "Return the number of chunks and bytes in the cache, and the number of chunks being prefetched."
+        with self._lock:
+            return {
+                "chunks": len(self._cache),
+                "nbytes": self._cache_nbytes,
+                "pending": len(self._pending),
+            }
+
+    def close(self):
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+        with self._lock:
+            self._cache.clear()
+            self._cache_nbytes = 0
+            self._pending.clear()
+        super().close()
+
+    def _read_chunk(self, index):
+        _, _, array, offset = self._chunks[index]
+        stop = offset + self._chunks[index][1] - self._chunks[index][0]
+        return numpy.asarray(array[offset:stop].data)
+
+    def _get_chunk(self, index):
+        with self._lock:
+            if index in self._cache:
+                self._cache.move_to_end(index)
+                return self._cache[index]
+            future = self._pending.get(index)
+        # Wait for the chunk being prefetched, if any, or read it now; if the
+        # prefetch failed, read it again so that the error (if any) is raised here.
+        chunk = None
+        if future is not None:
+            try:
+                chunk = future.result()
+            except Exception:
+                pass
+        if chunk is None:
+            chunk = self._read_chunk(index)
+        self._store(index, chunk)
+        return chunk
+
+    def _store(self, index, chunk):
+        with self._lock:
+            self._pending.pop(index, None)
+            if index in self._cache:
+                return
+            self._cache[index] = chunk
+            self._cache_nbytes += chunk.nbytes
+            # Evict the least recently used chunks, but always keep the latest one.
+            while self._cache_nbytes > self._cache_size and len(self._cache) > 1:
+                _, evicted = self._cache.popitem(last=False)
+                self._cache_nbytes -= evicted.nbytes
+
+    def _prefetch_chunk(self, index):
+        try:
+            chunk = self._read_chunk(index)
+            self._store(index, chunk)
+            return chunk
+        finally:
+            with self._lock:
+                self._pending.pop(index, None)
+
+    def _schedule_prefetch(self, index):
+        if not self._prefetch:
+            return
+        with self._lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=1, thread_name_prefix="Images-prefetch")
+            for ahead in range(index + 1, min(index + 1 + self._prefetch, len(self._chunks))):
+                if ahead not in self._cache and ahead not in self._pending:
+                    self._pending[ahead] = self._executor.submit(self._prefetch_chunk, ahead)
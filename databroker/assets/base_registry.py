@@ -7,10 +7,9 @@ import logging
 import os.path
 import shutil
 import os
-import boltons.cacheutils
 from . import core
 import warnings
-from ..utils import ensure_path_exists
+from ..utils import ensure_path_exists, BoundedCache
 import json
 from .utils import _ChainMap
 from .handlers_base import DuplicateHandler
@@ -126,6 +125,15 @@ class BaseRegistryRO(object):
     # optional configuration, mostly for documentation
     OPT_CONFIG = ()
 
+    # ## Cache bounds
+    # Default bounds of the caches, which can be overridden by the
+    # 'datum_cache_size', 'datum_cache_bytes', 'resource_cache_size' and
+    # 'handler_cache_size' configuration keys.
+    DATUM_CACHE_SIZE = 1000000
+    DATUM_CACHE_BYTES = 256 * 1024**2
+    RESOURCE_CACHE_SIZE = 128
+    HANDLER_CACHE_SIZE = 128
+
     @property
     def config(self):
         return self._config
@@ -163,6 +171,19 @@ class BaseRegistryRO(object):
         self._handler_cache.clear()
         self._resource_cache.clear()
 
+    def cache_info(self):
+        """Return the statistics of the datum, resource and handler caches
+
+        Returns
+        -------
+        info : dict
+            Maps 'datum', 'resource' and 'handler' to the hits, misses,
+            evictions and size of the corresponding cache.
+        """
+        return {'datum': self._datum_cache.cache_info(),
+                'resource': self._resource_cache.cache_info(),
+                'handler': self._handler_cache.cache_info()}
+
     # ## INIT
     def __init__(self, config, handler_reg=None, root_map=None):
         # set up configuration + version
@@ -184,9 +205,18 @@ class BaseRegistryRO(object):
                 raise RuntimeError('did not find resource {!r}'.format(k))
             return ret
 
-        self._datum_cache = boltons.cacheutils.LRU(max_size=1000000)
-        self._handler_cache = boltons.cacheutils.LRU()
-        self._resource_cache = boltons.cacheutils.LRU(on_miss=_r_on_miss)
+        self._datum_cache = BoundedCache(
+            max_size=config.get('datum_cache_size', self.DATUM_CACHE_SIZE),
+            max_bytes=config.get('datum_cache_bytes',
+                                 self.DATUM_CACHE_BYTES))
+        # Handlers hold open files, so they are bounded in number only.
+        self._handler_cache = BoundedCache(
+            max_size=config.get('handler_cache_size',
+                                self.HANDLER_CACHE_SIZE))
+        self._resource_cache = BoundedCache(
+            max_size=config.get('resource_cache_size',
+                                self.RESOURCE_CACHE_SIZE),
+            on_miss=_r_on_miss)
 
         # copy the class level known spec to an instance attribute
         self.known_spec = dict(self.KNOWN_SPEC)
@@ -213,6 +243,26 @@ class BaseRegistryRO(object):
                                   self._datum_cache, self.get_spec_handler,
                                   logger)
 
+    def bulk_retrieve(self, datum_ids):
+        """Retrieve the data of many datums at once
+
+        The datums are grouped by resource. Handlers which implement
+        ``bulk_call(datum_kwargs_list)`` are called once per resource and may
+        return a stacked array; other handlers are called once per datum.
+
+        Parameters
+        ----------
+        datum_ids : iterable of str
+
+        Returns
+        -------
+        values : list
+            The data, in the order of `datum_ids`
+        """
+        return self._api.bulk_retrieve(self._datum_col, list(datum_ids),
+                                       self._datum_cache,
+                                       self.get_spec_handler, logger)
+
     def get_datum(self, datum_id):
         warnings.warn('get_datum is deprecated, use retrieve instead',
                       stacklevel=2)
@@ -23,7 +23,7 @@ from .sqlite import (ResourceCollection,
                      RegistryDatabase)
 from .core import (resource_given_uid, insert_resource,
                    update_resource, get_resource_history,
-                   doc_or_uid_to_uid, get_file_list)
+                   doc_or_uid_to_uid, get_file_list, call_handlers)
 from ..headersource.hdf5 import append
 from ..utils import ensure_path_exists as makedirs
 
@@ -87,12 +87,7 @@ def bulk_register_datum_table(datum_col,
     return ['{}/{}'.format(resource_uid, d) for d in d_ids]
 
 
-def retrieve(col, datum_id, datum_cache, get_spec_handler, logger):
-    if '/' not in datum_id:
-        raise DatumNotFound
-    r_uid, _, d_uid = datum_id.partition('/')
-    d_uid = int(d_uid)
-    handler = get_spec_handler(r_uid)
+def _get_datum_table(col, r_uid, datum_cache):
     try:
         df = datum_cache[r_uid]
     except:
@@ -101,10 +96,32 @@ def retrieve(col, datum_id, datum_cache, get_spec_handler, logger):
             df = pd.DataFrame({k: fin[k][:] for k in fin})
             df = df.set_index('datum_id')
         datum_cache[r_uid] = df
+    return df
+
+
+def retrieve(col, datum_id, datum_cache, get_spec_handler, logger):
+    if '/' not in datum_id:
+        raise DatumNotFound
+    r_uid, _, d_uid = datum_id.partition('/')
+    d_uid = int(d_uid)
+    handler = get_spec_handler(r_uid)
+    df = _get_datum_table(col, r_uid, datum_cache)
 
     return handler(**dict(df.loc[d_uid]))
 
 
+def bulk_retrieve(col, datum_ids, datum_cache, get_spec_handler, logger):
+    datums = []
+    for datum_id in datum_ids:
+        if '/' not in datum_id:
+            raise DatumNotFound
+        r_uid, _, d_uid = datum_id.partition('/')
+        df = _get_datum_table(col, r_uid, datum_cache)
+        datums.append({'resource': r_uid,
+                       'datum_kwargs': dict(df.loc[int(d_uid)])})
+    return call_handlers(datums, get_spec_handler)
+
+
 def get_datum_by_res_gen(datum_col, resource_uid):
     path, fname = make_file_name(datum_col, resource_uid)
     fpath = Path(path) / Path(fname)
@@ -193,6 +210,7 @@ api = SimpleNamespace(
     bulk_register_datum_table=bulk_register_datum_table,
     resource_given_uid=resource_given_uid,
     retrieve=retrieve,
+    bulk_retrieve=bulk_retrieve,
     update_resource=update_resource,
     DatumNotFound=DatumNotFound,
     get_resource_history=get_resource_history,
@@ -208,13 +226,13 @@ class RegistryRO(BaseRegistryRO):
 
     _API_MAP = {1: api}
     REQ_CONFIG = ('dbpath',)
+    # we are going to be caching dataframes so be
+    # smaller!
+    DATUM_CACHE_SIZE = 100
 
     def __init__(self, config):
         super(RegistryRO, self).__init__(config)
         makedirs(self.config['dbpath'], exist_ok=True)
-        # we are going to be caching dataframes so be
-        # smaller!
-        self._datum_cache.max_size = 100
         self.__resource_col = None
         self.__db = None
         self.__resource_update_col = None
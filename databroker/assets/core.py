@@ -88,6 +88,51 @@ def retrieve(col, datum_id, datum_cache, get_spec_handler, logger):
     return handler(**datum['datum_kwargs'])
 
 
+def bulk_retrieve(col, datum_ids, datum_cache, get_spec_handler, logger):
+    # The first lookup of a datum caches all the datums of its resource, so
+    # this costs one query per resource rather than one per datum.
+    datums = [_get_datum_from_datum_id(col, datum_id, datum_cache, logger)
+              for datum_id in datum_ids]
+    return call_handlers(datums, get_spec_handler)
+
+
+def call_handlers(datums, get_spec_handler):
+    """Call the handlers of many datums, grouped by resource
+
+    Handlers which have a ``bulk_call`` method are called once per resource,
+    with the list of the datum_kwargs, and return a sequence of values (e.g. a
+    stacked array). Other handlers are called once per datum.
+
+    Parameters
+    ----------
+    datums : list
+        Dicts with (at least) the keys 'resource' and 'datum_kwargs'
+    get_spec_handler : callable
+        Returns the handler given a resource uid
+
+    Returns
+    -------
+    values : list
+        The values, in the order of `datums`
+    """
+    indices_by_resource = {}
+    for i, datum in enumerate(datums):
+        indices_by_resource.setdefault(datum['resource'], []).append(i)
+
+    values = [None] * len(datums)
+    for resource, indices in indices_by_resource.items():
+        handler = get_spec_handler(resource)
+        datum_kwargs_list = [datums[i]['datum_kwargs'] for i in indices]
+        bulk_call = getattr(handler, 'bulk_call', None)
+        if bulk_call is not None:
+            results = bulk_call(datum_kwargs_list)
+        else:
+            results = [handler(**kwargs) for kwargs in datum_kwargs_list]
+        for i, result in zip(indices, results):
+            values[i] = result
+    return values
+
+
 def resource_given_datum_id(col, datum_id, datum_cache, logger):
     datum_id = doc_or_uid_to_uid(datum_id)
     datum = _get_datum_from_datum_id(col, datum_id, datum_cache, logger)
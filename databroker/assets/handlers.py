@@ -444,6 +444,10 @@ class NpyFrameWise(HandlerBase):
     def __call__(self, frame_no):
         return self._data[frame_no]
 
+    def bulk_call(self, datum_kwargs_list):
+        # Read many frames at once, as one stacked array.
+        return self._data[[kwargs['frame_no'] for kwargs in datum_kwargs_list]]
+
     def get_file_list(self, datum_kwarg_gen):
         return [self._fpath]
 
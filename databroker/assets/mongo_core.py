@@ -5,8 +5,10 @@ from bson.errors import InvalidId
 import six
 import pymongo
 from collections import deque
-from .core import (DatumNotFound, _get_datum_from_datum_id, retrieve,
-                   resource_given_datum_id, insert_datum, insert_resource,
+# Re-exported: this module is the API of mongo.Registry (see its _API_MAP),
+# whose methods look these functions up on it, e.g. Registry.bulk_retrieve.
+from .core import (DatumNotFound, _get_datum_from_datum_id, retrieve,  # noqa
+                   bulk_retrieve, resource_given_datum_id, insert_datum, insert_resource,
                    update_resource, get_datum_by_res_gen, get_file_list,
                    bulk_register_datum_table, register_datum)
 
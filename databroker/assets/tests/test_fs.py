@@ -8,7 +8,7 @@ import uuid
 import numpy as np
 from numpy.testing import assert_array_equal
 
-from .utils import insert_syn_data, insert_syn_data_bulk
+from .utils import SynHandlerMod, insert_syn_data, insert_syn_data_bulk
 
 
 @pytest.mark.parametrize('func', [insert_syn_data, insert_syn_data_bulk])
@@ -22,6 +22,52 @@ def test_insert_funcs(func, fs):
         assert_array_equal(data, known_data)
 
 
+class SynHandlerModBulk(SynHandlerMod):
+    "SynHandlerMod which also returns many frames at once, recording the calls."
+    calls = []
+
+    def bulk_call(self, datum_kwargs_list):
+        self.calls.append(len(datum_kwargs_list))
+        return np.stack([self(**kwargs) for kwargs in datum_kwargs_list])
+
+
+@pytest.mark.parametrize('handler', [SynHandlerMod, SynHandlerModBulk])
+def test_bulk_retrieve(handler, fs):
+    shape = (5, 6)
+    mod_ids = insert_syn_data(fs, 'syn-mod', shape, 4)
+    mod_ids += insert_syn_data_bulk(fs, 'syn-mod', shape, 3)
+    datum_ids = mod_ids[::-1]
+    SynHandlerModBulk.calls.clear()
+
+    with fs.handler_context({'syn-mod': handler}):
+        data = fs.bulk_retrieve(datum_ids)
+        assert len(data) == len(datum_ids)
+        for datum_id, frame in zip(datum_ids, data):
+            assert_array_equal(frame, fs.retrieve(datum_id))
+    if handler is SynHandlerModBulk:
+        # One call per resource
+        assert SynHandlerModBulk.calls == [3, 4]
+
+
+def test_mongo_api_bulk_retrieve():
+    # mongo.Registry looks its API functions up on the mongo_core module
+    from .. import core, mongo
+    assert mongo.Registry._API_MAP[1].bulk_retrieve is core.bulk_retrieve
+
+
+def test_cache_info(fs):
+    shape = (5, 6)
+    mod_ids = insert_syn_data(fs, 'syn-mod', shape, 3)
+    fs.clear_process_cache()
+    for datum_id in mod_ids:
+        fs.retrieve(datum_id)
+    info = fs.cache_info()
+    assert set(info) == {'datum', 'resource', 'handler'}
+    assert info['datum']['misses'] >= 1
+    assert info['handler']['size'] >= 1
+    assert info['handler']['nbytes'] == 0  # Handlers are not sized
+
+
 def test_non_exist(fs):
 
     with pytest.raises(fs.DatumNotFound):
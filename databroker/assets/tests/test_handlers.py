@@ -131,6 +131,12 @@ class Test_np_FW(_with_file):
                 known_data = i * np.ones((9, 8))
                 assert_array_equal(data, known_data)
 
+    def test_bulk_retrieval(self):
+        with self.fs.handler_context({'npy_FRAMEWISE': NpyFrameWise}):
+            data = self.fs.bulk_retrieve(self.datum_ids[::-2])
+            for i, frame in zip(range(14, -1, -2), data):
+                assert_array_equal(frame, i * np.ones((9, 8)))
+
 
 class Test_AD_hdf5_files(_with_file):
     # test the HDF5 product emitted by the hdf5 plugin to area detector
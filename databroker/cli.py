@@ -128,6 +128,87 @@ def shape_fix(
                 progress.update(task, advance=1)
 
 
+@admin_app.command("migrate-to-tiled")
+def migrate_to_tiled(
+    uri: str,
+    target_uri: str,
+    asset_registry_uri: Optional[str] = None,
+    api_key: Optional[str] = typer.Option(
+        None, envvar="TILED_API_KEY", help="API key for the target Tiled server"
+    ),
+    query: List[str] = [],
+    workers: int = typer.Option(4, help="Number of runs migrated concurrently"),
+    checkpoint: str = typer.Option(
+        "migrate-to-tiled.sqlite",
+        help="SQLite file recording the progress; completed runs are skipped on restart",
+    ),
+    page_size: int = typer.Option(1000, help="Maximum number of Events per EventPage"),
+    batch_size: int = typer.Option(10000, help="Number of rows written to Tiled at once"),
+    limit: Optional[int] = None,
+    strict: bool = False,
+):
+    """
+    Copy Bluesky runs from a MongoDB-backed catalog into a Tiled-native catalog.
+    """
+    # Imports are here to avoid making CLI slow.
+    import time
+
+    import databroker.queries
+    from databroker.mongo_normalized import MongoAdapter
+
+    from .tiled_migration import DONE, MigrationCheckpoint, migrate
+
+    adapter = MongoAdapter.from_uri(uri, asset_registry_uri=asset_registry_uri)
+    for q in query:
+        parsed_query = eval(q, vars(databroker.queries))
+        adapter = adapter.search(parsed_query)
+    client = tiled.client.from_uri(target_uri, api_key=api_key)
+    checkpoint_db = MigrationCheckpoint(checkpoint)
+    typer.echo(f"Migrating {adapter} to {target_uri}; previous progress: {checkpoint_db.counts()}")
+
+    # Runs recorded as done in the checkpoint are skipped without being reported.
+    # Estimate their number from the checkpoint rather than listing the catalog again.
+    total = max(len(adapter) - checkpoint_db.counts().get(DONE, 0), 0)
+    if limit is not None:
+        total = min(limit, total)
+    t0 = time.monotonic()
+    num_runs = num_documents = 0
+    with Progress() as progress:
+        task = progress.add_task("Migrating...", total=total)
+
+        def report(uid, docs, error):
+            nonlocal num_runs, num_documents
+            if error is not None:
+                progress.console.print(f"Failed: {uid} {error!r} (Use --strict for more.)")
+            num_runs += 1
+            num_documents += docs
+            elapsed = time.monotonic() - t0
+            progress.update(
+                task,
+                advance=1,
+                description=f"{num_runs / elapsed:.2f} runs/s, {num_documents / elapsed:.0f} docs/s",
+            )
+
+        try:
+            summary = migrate(
+                adapter,
+                client,
+                checkpoint_db,
+                workers=workers,
+                page_size=page_size,
+                batch_size=batch_size,
+                limit=limit,
+                strict=strict,
+                callback=report,
+            )
+        finally:
+            checkpoint_db.close()
+    typer.echo(
+        f"Migrated {summary['migrated']} runs ({summary['documents']} documents) "
+        f"in {summary['elapsed']:.1f} s; skipped {summary['skipped']}, failed {summary['failed']}."
+    )
+
+
 main = cli_app
 
 
@@ -241,7 +241,9 @@ class EventSourceShim(object):
              all_extra_ts, discard_fields) = _extract_extra_data(
                 start, stop, d, fields, comp_re, no_fields_filter)
 
-            payload = self.mds.get_events_table(d)
+            # Only decode the fields which are kept.
+            payload = self.mds.get_events_table(
+                d, fields=[k for k in d['data_keys'] if k not in discard_fields])
             _, data, seq_nums, times, uids, timestamps = payload
             df = pd.DataFrame(index=seq_nums)
             # if converting to datetime64 (in utc or 'local' tz)
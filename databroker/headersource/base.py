@@ -1,20 +1,44 @@
 from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 from . import core
+from ..utils import BoundedCache
 import numpy as np
 
 
 class MDSROTemplate(object):
     _API_MAP = {1: core}
+    # Default bounds of each of the document caches, which can be overridden
+    # by the 'cache_size' (in entries) and 'cache_bytes' configuration keys.
+    # Documents are cached under both their uid and their database id.
+    CACHE_SIZE = 10000
+    CACHE_BYTES = 64 * 1024**2
 
     def __init__(self, config):
-        self._RUNSTART_CACHE = {}
-        self._RUNSTOP_CACHE = {}
-        self._DESCRIPTOR_CACHE = {}
         self.config = config
+        self._make_caches()
         self._api = None
         self.version = config.get('version', 1)
 
+    def _make_caches(self):
+        max_size = self.config.get('cache_size', self.CACHE_SIZE)
+        max_bytes = self.config.get('cache_bytes', self.CACHE_BYTES)
+        self._RUNSTART_CACHE = BoundedCache(max_size, max_bytes)
+        self._RUNSTOP_CACHE = BoundedCache(max_size, max_bytes)
+        self._DESCRIPTOR_CACHE = BoundedCache(max_size, max_bytes)
+
+    def cache_info(self):
+        """Return the statistics of the document caches
+
+        Returns
+        -------
+        info : dict
+            Maps 'run_start', 'run_stop' and 'descriptor' to the hits,
+            misses, evictions and size of the corresponding cache.
+        """
+        return {'run_start': self._RUNSTART_CACHE.cache_info(),
+                'run_stop': self._RUNSTOP_CACHE.cache_info(),
+                'descriptor': self._DESCRIPTOR_CACHE.cache_info()}
+
     def reset_caches(self):
         self._RUNSTART_CACHE.clear()
         self._RUNSTOP_CACHE.clear()
@@ -24,11 +48,9 @@ class MDSROTemplate(object):
         return self.version, self.config
 
     def __setstate__(self, state):
-        self._RUNSTART_CACHE = {}
-        self._RUNSTOP_CACHE = {}
-        self._DESCRIPTOR_CACHE = {}
         self._api = None
         self.version, self.config = state
+        self._make_caches()
 
     @property
     def version(self):
@@ -193,7 +215,7 @@ class MDSROTemplate(object):
         for ev in evs:
             yield ev
 
-    def get_events_table(self, descriptor):
+    def get_events_table(self, descriptor, fields=None):
         """All event data as tables
 
         Parameters
@@ -201,6 +223,9 @@ class MDSROTemplate(object):
         descriptor : dict or str
             The EventDescriptor to get the Events for.  Can be either
             a Document/dict with a 'uid' key or a uid string
+        fields : iterable of str, optional
+            Only return the data and timestamps of these keys; by default,
+            all the data keys of the descriptor.
 
         Returns
         -------
@@ -223,7 +248,8 @@ class MDSROTemplate(object):
                                           self._descriptor_col,
                                           self._DESCRIPTOR_CACHE,
                                           self._runstart_col,
-                                          self._RUNSTART_CACHE)
+                                          self._RUNSTART_CACHE,
+                                          fields=fields)
 
     def find_run_starts(self, **kwargs):
         """Given search criteria, locate RunStart Documents.
@@ -525,8 +551,39 @@ class MDSTemplate(MDSROTemplate):
                                             events=events,
                                             validate=validate)
 
+    def insert_event_page(self, event_page, validate=False,
+                          batch_size=core.EVENT_BATCH_SIZE):
+        """Insert the events of an EventPage
+
+        This is the fast path for inserting many events: each column of the
+        page is sanitized once, rather than value by value, and the events are
+        inserted in batches.
+
+        Parameters
+        ----------
+        event_page : dict
+            dict matching the bs.EventPage schema
+        validate : boolean
+            Check that data and timestamps have the same keys and that all
+            the columns have the same length.
+        batch_size : int, optional
+            Maximum number of events inserted at once
+
+        Returns
+        -------
+        num_events : int
+            The number of events inserted
+        """
+        return self._api.insert_event_page(self._event_col,
+                                           descriptor=event_page['descriptor'],
+                                           event_page=event_page,
+                                           validate=validate,
+                                           batch_size=batch_size)
+
     def insert(self, name, doc):
-        if name != 'bulk_events':
+        if name == 'event_page':
+            self.insert_event_page(doc)
+        elif name != 'bulk_events':
             getattr(self, self._INS_METHODS[name])(**doc)
         else:
             for desc_uid, events in doc.items():
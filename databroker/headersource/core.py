@@ -2,12 +2,13 @@ from __future__ import (absolute_import, division, print_function,
                         unicode_literals)
 
 import copy
+import itertools
 import six
 import warnings
 import logging
 import numpy as np
 from ..utils import (apply_to_dict_recursively, sanitize_np,
-                     format_time as _format_time, transpose as _transpose)
+                     format_time as _format_time)
 from event_model import MismatchedDataKeys
 
 logger = logging.getLogger(__name__)
@@ -370,16 +371,8 @@ def get_events_generator(descriptor, event_col, descriptor_col,
         for k, v in ev['data'].items():
             try:
                 _dk = data_keys[k]
-            except KeyError as err:
-                raise MismatchedDataKeys(
-                    "The documents are not valid.  Either because they "
-                    "were recorded incorrectly in the first place, "
-                    "corrupted since, or exercising a yet-undiscovered "
-                    "bug in a reader. event['data'].keys() "
-                    "must equal descriptor['data_keys'].keys(). "
-                    f"event['data'].keys(): {ev['data'].keys()}, "
-                    "descriptor['data_keys'].keys(): "
-                    f"{descriptor['data_keys'].keys()}") from err
+            except KeyError:
+                _raise_mismatched_data_keys(ev['data'], data_keys)
             # convert any arrays stored directly in mds into ndarray
             if convert_arrays:
                 if _dk['dtype'] == 'array' and not _dk.get('external', False):
@@ -392,7 +385,8 @@ def get_events_generator(descriptor, event_col, descriptor_col,
 
 
 def get_events_table(descriptor, event_col, descriptor_col,
-                     descriptor_cache, run_start_col, run_start_cache):
+                     descriptor_cache, run_start_col, run_start_cache,
+                     fields=None):
     """All event data as tables
 
     Parameters
@@ -410,8 +404,9 @@ def get_events_table(descriptor, event_col, descriptor_col,
     descriptor_cache : dict
         Dict[str, Document]
 
-    convert_arrays: boolean, optional
-        convert 'array' type to numpy.ndarray; True by default
+    fields : iterable of str, optional
+        Only return the data and timestamps of these keys; by default, all
+        the data keys of the descriptor.
 
 
     Returns
@@ -433,34 +428,62 @@ def get_events_table(descriptor, event_col, descriptor_col,
     desc_uid = doc_or_uid_to_uid(descriptor)
     descriptor = descriptor_given_uid(desc_uid, descriptor_col,
                                       descriptor_cache)
-    # this will get more complicated once transpose caching layer is in place
-    all_events = list(get_events_generator(desc_uid, event_col,
-                                           descriptor_col,
-                                           descriptor_cache,
-                                           run_start_col,
-                                           run_start_cache))
-
-    # get event sequence numbers
-    seq_nums = [ev['seq_num'] for ev in all_events]
-
-    # get event times
-    times = [ev['time'] for ev in all_events]
-
-    # get uids
-    uids = [ev['uid'] for ev in all_events]
-
-    keys = list(descriptor['data_keys'])
-
-    # get data values
-    data_table = _transpose(all_events, keys, 'data')
-
-    # get timestamps
-    timestamps_table = _transpose(all_events, keys, 'timestamps')
+    data_keys = descriptor['data_keys']
+    keys = list(data_keys)
+    if fields is not None:
+        fields = set(fields)
+        keys = [k for k in keys if k in fields]
+
+    seq_nums = []
+    times = []
+    uids = []
+    data_table = {k: [] for k in keys}
+    timestamps_table = {k: [] for k in keys}
+    # convert any arrays stored directly in mds into ndarray
+    columns = [(k, data_table[k].append, timestamps_table[k].append,
+                (data_keys[k]['dtype'] == 'array' and
+                 not data_keys[k].get('external', False)))
+               for k in keys]
+
+    # Decode the events directly into the columns, one at a time, rather
+    # than collecting all the events first and transposing them.
+    ev_cur = event_col.find({'descriptor': desc_uid},
+                            sort=[('time', ASCENDING)])
+    for ev in ev_cur:
+        data = ev['data']
+        timestamps = ev['timestamps']
+        # All the keys are looked up below unless `fields` is given, in which
+        # case equal lengths do not imply equal keys.
+        if len(data) != len(data_keys) or (
+                fields is not None and data.keys() != data_keys.keys()):
+            _raise_mismatched_data_keys(data, data_keys)
+        seq_nums.append(ev['seq_num'])
+        times.append(ev['time'])
+        uids.append(ev['uid'])
+        try:
+            for k, append_data, append_timestamp, is_array in columns:
+                value = data[k]
+                append_data(np.asarray(value) if is_array else value)
+                append_timestamp(timestamps[k])
+        except KeyError:
+            _raise_mismatched_data_keys(data, data_keys)
 
     # return the whole lot
     return descriptor, data_table, seq_nums, times, uids, timestamps_table
 
 
+def _raise_mismatched_data_keys(data, data_keys):
+    raise MismatchedDataKeys(
+        "The documents are not valid.  Either because they "
+        "were recorded incorrectly in the first place, "
+        "corrupted since, or exercising a yet-undiscovered "
+        "bug in a reader. event['data'].keys() "
+        "must equal descriptor['data_keys'].keys(). "
+        f"event['data'].keys(): {data.keys()}, "
+        "descriptor['data_keys'].keys(): "
+        f"{data_keys.keys()}")
+
+
 # database INSERTION ###################################################
 
 def insert_run_start(run_start_col, run_start_cache,
@@ -703,6 +726,9 @@ def insert_event(event_col, descriptor, time, seq_num, data, timestamps, uid,
 BAD_KEYS_FMT = """Event documents are malformed, the keys on 'data' and
 'timestamps do not match:\n data: {}\ntimestamps:{}"""
 
+# Maximum number of events inserted at once from an EventPage
+EVENT_BATCH_SIZE = 10000
+
 
 def bulk_insert_events(event_col, descriptor, events, validate):
     """Bulk insert many events
@@ -758,6 +784,100 @@ def bulk_insert_events(event_col, descriptor, events, validate):
     return event_col.insert_many(event_factory())
 
 
+def insert_event_page(event_col, descriptor, event_page, validate,
+                      batch_size=EVENT_BATCH_SIZE, insert_many_kwargs=None):
+    """Insert all the events of an EventPage
+
+    The columns of the page are sanitized (numpy to built-in Python types)
+    once each, rather than event by event, and the events are inserted in
+    batches.
+
+    Parameters
+    ----------
+    event_col
+         The collection to insert the Events into
+
+    descriptor : dict or str
+        The Descriptor to insert event for.  Can be either
+        a Document/dict with a 'uid' key or a uid string
+    event_page : dict
+       dict matching the bs.EventPage schema
+    validate : bool
+       If it should be checked that the data and timestamps have identical
+       keys and that all the columns have the same length. Pass False for
+       documents already validated upstream.
+    batch_size : int, optional
+       Maximum number of events inserted at once
+    insert_many_kwargs : dict, optional
+       Extra keyword arguments passed to ``event_col.insert_many``, e.g.
+       ``{'ordered': False}`` for a MongoDB collection
+
+    Returns
+    -------
+    num_events : int
+        The number of events inserted
+    """
+    if insert_many_kwargs is None:
+        insert_many_kwargs = {}
+    num_events = 0
+    events = _events_from_page(descriptor, event_page, validate)
+    for batch in _batches(events, batch_size):
+        event_col.insert_many(batch, **insert_many_kwargs)
+        num_events += len(batch)
+    return num_events
+
+
+def _events_from_page(descriptor, event_page, validate):
+    "Sanitize the columns of an EventPage and yield its Events in storage format."
+    descriptor_uid = str(doc_or_uid_to_uid(descriptor))
+    data = event_page['data']
+    timestamps = event_page['timestamps']
+    uids = event_page['uid']
+    if validate:
+        if data.keys() != timestamps.keys():
+            raise ValueError(
+                BAD_KEYS_FMT.format(data.keys(), timestamps.keys()))
+        for column in itertools.chain([event_page['time'],
+                                       event_page['seq_num']],
+                                      data.values(), timestamps.values()):
+            if len(column) != len(uids):
+                raise ValueError("EventPage is malformed, its columns do "
+                                 "not all have the same length.")
+
+    data = {k: _sanitize_column(v) for k, v in data.items()}
+    # Replace any filled data with the datum_id stashed in 'filled'.
+    for k, column in event_page.get('filled', {}).items():
+        data[k] = [v if v else value for value, v in zip(data[k], column)]
+    timestamps = {k: _sanitize_column(v) for k, v in timestamps.items()}
+    times = _sanitize_column(event_page['time'])
+    seq_nums = _sanitize_column(event_page['seq_num'])
+
+    for i, (uid, time, seq_num) in enumerate(zip(uids, times, seq_nums)):
+        yield dict(descriptor=descriptor_uid,
+                   uid=str(uid),
+                   data={k: column[i] for k, column in data.items()},
+                   timestamps={k: column[i]
+                               for k, column in timestamps.items()},
+                   time=time,
+                   seq_num=int(seq_num))
+
+
+def _sanitize_column(column):
+    "Convert a column of values, e.g. an array, into a list of built-in types."
+    if isinstance(column, np.ndarray):
+        return column.tolist()
+    return [sanitize_np(value) for value in column]
+
+
+def _batches(iterable, size):
+    iterator = iter(iterable)
+    while True:
+        batch = list(itertools.islice(iterator, size))
+        if not batch:
+            return
+        yield batch
+
+
 # DATABASE RETRIEVAL ##########################################################
 
 def find_run_starts(run_start_col, run_start_cache, tz, **kwargs):
@@ -26,12 +26,10 @@ class MDSRO(MDSROTemplate):
 
     def __setstate__(self, state):
         # TODO likely broken with auth?
-        self._RUNSTART_CACHE = {}
-        self._RUNSTOP_CACHE = {}
-        self._DESCRIPTOR_CACHE = {}
         self.reset_connection()
         self._api = None
         self.version, self.config = state
+        self._make_caches()
 
     def disconnect(self):
         self.__db = None
@@ -157,6 +155,11 @@ class MDS(MDSRO, MDSTemplate):
     def bulk_insert_events(self, descriptor, events, validate=False):
         return super().bulk_insert_events(descriptor, events, validate=validate)
 
+    def insert_event_page(self, event_page, validate=False,
+                          batch_size=mongo_core.EVENT_BATCH_SIZE):
+        return super().insert_event_page(event_page, validate=validate,
+                                         batch_size=batch_size)
+
     _INS_METHODS = {'start': 'insert_run_start',
                     'stop': 'insert_run_stop',
                     'descriptor': 'insert_descriptor',
@@ -18,7 +18,9 @@ from .core import (doc_or_uid_to_uid,   # noqa
                    run_start_given_uid, run_stop_given_uid,
                    descriptor_given_uid, stop_by_start, descriptors_by_start,
                    get_events_table, insert_run_start, insert_run_stop,
-                   insert_descriptor, insert_event, BAD_KEYS_FMT)
+                   insert_descriptor, insert_event, BAD_KEYS_FMT,
+                   EVENT_BATCH_SIZE,
+                   insert_event_page as _insert_event_page)
 from ..utils import sanitize_np, apply_to_dict_recursively
 from event_model import MismatchedDataKeys
 
@@ -134,6 +136,41 @@ def bulk_insert_events(event_col, descriptor, events, validate):
     bulk = [pymongo.InsertOne(ev) for ev in event_factory()]
     return event_col.bulk_write(bulk, ordered=True)
 
+
+def insert_event_page(event_col, descriptor, event_page, validate,
+                      batch_size=EVENT_BATCH_SIZE):
+    """Insert all the events of an EventPage
+
+    The columns of the page are sanitized once each, and the events are
+    inserted with unordered ``insert_many`` calls of at most `batch_size`
+    events, which lets the server apply each batch in parallel.
+
+    Parameters
+    ----------
+    event_col
+         The collection to insert the Events into
+    descriptor : dict or str
+        The Descriptor to insert event for.  Can be either
+        a dict with a 'uid' key or a uid string
+    event_page : dict
+       dict matching the bs.EventPage schema
+    validate : bool
+       If it should be checked that the data and timestamps have identical
+       keys and that all the columns have the same length. Pass False for
+       documents already validated upstream.
+    batch_size : int, optional
+       Maximum number of events inserted at once
+
+    Returns
+    -------
+    num_events : int
+        The number of events inserted
+    """
+    return _insert_event_page(event_col, descriptor, event_page, validate,
+                              batch_size=batch_size,
+                              insert_many_kwargs={'ordered': False})
+
+
 # DATABASE RETRIEVAL ##########################################################
 
 
@@ -1,5 +1,6 @@
 from __future__ import absolute_import
 
+import bisect
 import copy
 import os
 import json
@@ -10,22 +11,168 @@ from ..utils import ensure_path_exists
 
 
 class JSONCollection(object):
+    """A collection of documents stored in a file, one JSON document per line
+
+    The file is append-only: inserting documents appends lines to it rather
+    than rewriting it. Files in the original format, a single JSON list, are
+    read as they are, and converted only when documents are first inserted.
+
+    The documents are indexed in memory by the fields in ``HASH_INDEXES``
+    and, in a sorted index, by ``time``. Queries on these fields, by
+    equality (or ``$in``) and by time range respectively, only match the
+    documents found in the indexes rather than scanning all of them. The
+    documents returned are copies, made as they are consumed.
+    """
+    HASH_INDEXES = ('uid', 'run_start', 'descriptor')
+    _RANGE_OPERATORS = {'$gt', '$gte', '$lt', '$lte'}
+
     def __init__(self, fp):
         self._fp = fp
+        self._reset()
         self.refresh()
 
+    def _reset(self):
+        self._docs = []
+        self._offset = 0  # Bytes of the file already read
+        # Size and modification time of a file in the original format, if any
+        self._legacy = None
+        # field -> value -> positions of the docs in self._docs
+        self._hash_indexes = {field: {} for field in self.HASH_INDEXES}
+        # field -> positions of the docs which can not be hash-indexed, e.g.
+        # with a list value. These are candidates for every query.
+        self._unindexed = {field: [] for field in self.HASH_INDEXES}
+        # Sorted times, and the positions of the docs in the same order
+        self._times = []
+        self._time_positions = []
+        self._untimed = []
+
     def refresh(self):
-        if os.path.isfile(self._fp):
-            with open(self._fp, 'r') as f:
-                self._docs = json.load(f)
+        "Load the documents appended to the file since it was last read."
+        if not os.path.isfile(self._fp):
+            self._reset()
+            open(self._fp, 'w').close()
+            return
+        with open(self._fp, 'rb') as f:
+            stat = os.fstat(f.fileno())
+            if self._legacy is not None:
+                if self._legacy == (stat.st_size, stat.st_mtime_ns):
+                    return
+                # The file in the original format was rewritten; start again.
+                self._reset()
+            elif stat.st_size < self._offset:
+                # The file was replaced; start again.
+                self._reset()
+            f.seek(self._offset)
+            data = f.read()
+        if not self._offset and data.lstrip().startswith(b'['):
+            for doc in json.loads(data):
+                self._add(doc)
+            self._legacy = (stat.st_size, stat.st_mtime_ns)
+            return
+        # Leave any incomplete line, still being written, for the next time.
+        end = data.rfind(b'\n') + 1
+        for line in data[:end].splitlines():
+            if line.strip():
+                self._add(json.loads(line))
+        self._offset += end
+
+    def _convert(self):
+        # Rewrite a file in the original format, a JSON list, as JSON lines.
+        tmp = self._fp + '.tmp'
+        with open(tmp, 'wb') as f:
+            f.writelines((json.dumps(doc) + '\n').encode()
+                         for doc in self._docs)
+        os.replace(tmp, self._fp)
+        self._reset()
+        self.refresh()
+
+    def _add(self, doc):
+        position = len(self._docs)
+        self._docs.append(doc)
+        for field, index in self._hash_indexes.items():
+            if field not in doc:
+                continue
+            value = doc[field]
+            if isinstance(value, (list, dict)):
+                self._unindexed[field].append(position)
+            else:
+                index.setdefault(value, []).append(position)
+        time = doc.get('time')
+        if (isinstance(time, (int, float)) and not isinstance(time, bool) and
+                time == time):  # Not NaN
+            i = bisect.bisect_right(self._times, time)
+            self._times.insert(i, time)
+            self._time_positions.insert(i, position)
         else:
-            self._docs = []
-            with open(self._fp, 'w') as f:
-                json.dump([], f)
+            self._untimed.append(position)
 
-    def find(self, query, sort=None):
+    def _candidates(self, query):
+        """Return the positions of the documents which may match the query
+
+        The positions are in insertion order, or None if the query can not
+        be answered from the indexes.
+        """
+        candidates = None
+        for field, value in query.items():
+            if field in self._hash_indexes:
+                positions = self._hash_candidates(field, value)
+            elif field == 'time':
+                positions = self._time_candidates(value)
+            else:
+                continue
+            if positions is None:
+                continue
+            if candidates is None:
+                candidates = positions
+            else:
+                candidates &= positions
+        if candidates is None:
+            return None
+        return sorted(candidates)
+
+    def _hash_candidates(self, field, value):
+        if isinstance(value, dict):
+            if set(value) != {'$in'}:
+                return None
+            values = value['$in']
+        else:
+            values = [value]
+        if any(v is None or isinstance(v, (list, dict)) for v in values):
+            return None
+        index = self._hash_indexes[field]
+        positions = set(self._unindexed[field])
+        for v in values:
+            positions.update(index.get(v, ()))
+        return positions
+
+    def _time_candidates(self, value):
+        if not (isinstance(value, dict) and value and
+                set(value) <= self._RANGE_OPERATORS):
+            return None
+        lo, hi = 0, len(self._times)
+        for op, bound in value.items():
+            if not isinstance(bound, (int, float)):
+                return None
+            if op == '$gt':
+                lo = max(lo, bisect.bisect_right(self._times, bound))
+            elif op == '$gte':
+                lo = max(lo, bisect.bisect_left(self._times, bound))
+            elif op == '$lt':
+                hi = min(hi, bisect.bisect_left(self._times, bound))
+            else:
+                hi = min(hi, bisect.bisect_right(self._times, bound))
+        return set(self._time_positions[lo:hi]).union(self._untimed)
+
+    def _match(self, query):
         match = Query(query).match
-        result = filter(match, self._docs)
+        candidates = self._candidates(query)
+        if candidates is None:
+            return filter(match, self._docs)
+        docs = self._docs
+        return (docs[i] for i in candidates if match(docs[i]))
+
+    def find(self, query, sort=None):
+        result = self._match(query)
         if sort is None:
             return (copy.deepcopy(elem) for elem in result)
         elif len(sort) > 2:
@@ -40,10 +187,8 @@ class JSONCollection(object):
             return (copy.deepcopy(elem) for elem in sorted_result)
 
     def find_one(self, query):
-        match = Query(query).match
-        for doc in self._docs:
-            if match(doc):
-                return copy.deepcopy(doc)
+        for doc in self._match(query):
+            return copy.deepcopy(doc)
         return None
 
     def insert_one(self, doc, fk=None):
@@ -51,15 +196,30 @@ class JSONCollection(object):
         if fk is not None:
             if self.find_one({fk: doc[fk]}) is not None:
                 raise RuntimeError('Duplicate {}: {}'.format(fk, doc[fk]))
-        self._docs.append(doc)
-        with open(self._fp, 'w') as f:
-            json.dump(self._docs, f)
+        self._append([doc])
 
     def insert(self, docs):
         self.refresh()
-        self._docs.extend(docs)
-        with open(self._fp, 'w') as f:
-            json.dump(self._docs, f)
+        self._append(docs)
+
+    insert_many = insert
+
+    def _append(self, docs):
+        if self._legacy is not None:
+            self._convert()
+        lines = [(json.dumps(doc) + '\n').encode() for doc in docs]
+        with open(self._fp, 'ab') as f:
+            caught_up = f.seek(0, os.SEEK_END) == self._offset
+            f.writelines(lines)
+        if not caught_up:
+            # Another writer appended in the meantime; read it all back.
+            self.refresh()
+            return
+        # Index what was written, so that the documents in memory are the
+        # same as those loaded from the file.
+        for line in lines:
+            self._add(json.loads(line))
+            self._offset += len(line)
 
 
 class _CollectionMixin(object):
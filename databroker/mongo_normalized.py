@@ -41,6 +41,7 @@ from tiled.utils import UNCHANGED, IndexersMixin, OneShotCachedMap, import_objec
 
 from .query_impl import (
     BlueskyMapAdapter,
+    EqAll,
     _PartialUID,
     _ScanID,
     ScanIDRange,
@@ -48,6 +49,7 @@ from .query_impl import (
     contains,
     comparison,
     eq,
+    eq_all,
     _in,
     not_eq,
     not_in,
@@ -1847,6 +1849,7 @@ MongoAdapter.register_query(ScanIDRange, scan_id_range)
 MongoAdapter.register_query(Comparison, comparison)
 MongoAdapter.register_query(Contains, contains)
 MongoAdapter.register_query(Eq, eq)
+MongoAdapter.register_query(EqAll, eq_all)
 MongoAdapter.register_query(FullText, full_text_search)
 MongoAdapter.register_query(In, _in)
 MongoAdapter.register_query(NotEq, not_eq)
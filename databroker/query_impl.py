@@ -14,6 +14,7 @@ from tiled.queries import (
     Regex,
 )
 from bluesky_tiled_plugins.queries import (
+    EqAll,
     _PartialUID,
     _ScanID,
     ScanIDRange,
@@ -155,6 +156,13 @@ def eq(query, catalog):
     return catalog.apply_mongo_query({key: query.value})
 
 
+def eq_all(query, catalog):
+    # A document with several keys is a conjunction in MongoDB, so all the
+    # items are applied as one query.
+    mongo_query = {key.removeprefix("start."): value for key, value in query.values.items()}
+    return catalog.apply_mongo_query(mongo_query)
+
+
 def contains(query, catalog):
     # In MongoDB, checking that an item is in an array looks
     # just like equality.
@@ -206,6 +214,7 @@ BlueskyMapAdapter.register_query(FullText, full_text_search)
 BlueskyMapAdapter.register_query(Contains, contains)
 BlueskyMapAdapter.register_query(Comparison, comparison)
 BlueskyMapAdapter.register_query(Eq, eq)
+BlueskyMapAdapter.register_query(EqAll, eq_all)
 BlueskyMapAdapter.register_query(FullText, full_text_search)
 BlueskyMapAdapter.register_query(In, _in)
 BlueskyMapAdapter.register_query(NotEq, not_eq)
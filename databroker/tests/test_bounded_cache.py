@@ -0,0 +1,56 @@
+import pickle
+
+import numpy as np
+import pytest
+
+from ..utils import BoundedCache
+
+
+def test_bounded_cache_entries():
+    cache = BoundedCache(max_size=2)
+    cache['a'] = 1
+    cache['b'] = 2
+    assert cache['a'] == 1  # 'a' is now the most recently used
+    cache['c'] = 3
+    assert set(cache) == {'a', 'c'}
+    with pytest.raises(KeyError):
+        cache['b']
+    info = cache.cache_info()
+    assert (info['hits'], info['misses'], info['evictions']) == (1, 1, 1)
+    assert info['size'] == 2
+
+
+def test_bounded_cache_bytes():
+    cache = BoundedCache(max_size=None, max_bytes=2500)
+    for i in range(5):
+        cache[i] = np.zeros(100)  # 800 bytes each
+    assert list(cache) == [2, 3, 4]
+    assert cache.cache_info()['nbytes'] == 2400
+    assert cache.cache_info()['evictions'] == 2
+
+    # The latest item is always kept, even when it is too large.
+    cache['big'] = np.zeros(1000)
+    assert list(cache) == ['big']
+    del cache['big']
+    assert cache.cache_info()['nbytes'] == 0
+
+
+def test_bounded_cache_on_miss():
+    cache = BoundedCache(on_miss=lambda key: key * 2)
+    assert cache[3] == 6
+    assert cache[3] == 6
+    assert cache.cache_info()['hits'] == 1
+    assert cache.cache_info()['misses'] == 1
+    # pop does not fetch missing items.
+    assert cache.pop(4, None) is None
+    assert cache.pop(3) == 6
+    assert 3 not in cache
+
+
+def test_bounded_cache_pickle():
+    cache = BoundedCache(max_size=5, max_bytes=100)
+    cache['a'] = 1
+    cache2 = pickle.loads(pickle.dumps(cache))
+    assert len(cache2) == 0
+    assert cache2.max_size == 5
+    assert cache2.max_bytes == 100
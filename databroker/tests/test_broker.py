@@ -13,6 +13,7 @@ import uuid
 from contextlib import nullcontext as does_not_raise
 from datetime import date, timedelta
 import itertools
+import json
 from databroker import (wrap_in_doct, wrap_in_deprecated_doct,
                         DeprecatedDoct, Broker, temp, ALL)
 from .test_config import EXAMPLE
@@ -31,7 +32,7 @@ from databroker.tests.utils import get_uids
 from tiled.client import from_uri
 
 from bluesky import __version__ as bluesky_version
-from bluesky.plans import count
+from bluesky.plans import count, scan
 from bluesky.plan_stubs import trigger_and_read, configure, one_shot
 import bluesky.plan_stubs as bps
 from bluesky.preprocessors import (monitor_during_wrapper,
@@ -192,6 +193,58 @@ def test_table_index_name(db, RE, hw):
     assert name == 'seq_num'
 
 
+def test_get_table_stack_arrays(db_empty, RE, hw):
+    db = db_empty
+    if not hasattr(db, "v2"):
+        raise pytest.skip("v0 does not support stack_arrays")
+    if getattr(db.v2, "is_sql", False):
+        raise pytest.xfail("ADBC/SQL does not support storing ndarrays")
+    RE.subscribe(db.insert)
+
+    class Waveform:
+        name = 'wf'
+        parent = None
+        reads = 0
+
+        def read(self):
+            Waveform.reads += 1  # Different values in each row
+            return {'wf': {'value': np.arange(5.0) + Waveform.reads, 'timestamp': ttime.time()}}
+
+        def describe(self):
+            return {'wf': {'shape': [5], 'dtype': 'array', 'source': 'test'}}
+
+        def describe_configuration(self):
+            return {}
+
+        def read_configuration(self):
+            return {}
+
+    uids = get_uids(RE(pchain(*(count([hw.det, Waveform()], num=3) for _ in range(3)))))
+    headers = db[uids]
+
+    # Headers are read concurrently, and concatenated in order
+    table = db.get_table(headers, max_workers=2)
+    assert len(table) == 9
+    assert list(table.index) == [1, 2, 3] * 3
+    assert table['wf'].iloc[0].shape == (5,)
+
+    stacked, arrays = db.get_table(headers, stack_arrays=True, max_workers=2)
+    assert 'wf' not in stacked.columns
+    assert not stacked.attrs
+    assert list(stacked['det']) == list(table['det'])
+    assert arrays['wf'].shape == (9, 5)
+    assert np.array_equal(arrays['wf'], np.stack(table['wf']))
+
+    # The arrays line up with the rows of the table, filtered by the same mask
+    mask = (stacked['time'] > stacked['time'].iloc[2]).to_numpy()
+    mask[5] = False
+    filtered = stacked[mask]
+    assert len(filtered) == 5
+    assert np.array_equal(arrays['wf'][mask], np.stack(table['wf'][mask]))
+    assert list(filtered['time']) == list(table['time'][mask])
+    assert [row[0] for row in arrays['wf'][mask]] == [4, 5, 7, 8, 9]
+
+
 def test_get_events_filtering_field(db, RE, hw):
     RE.subscribe(db.insert)
     uid, = get_uids(RE(count([hw.det], num=7)))
@@ -517,6 +570,61 @@ def test_process(db, RE, hw):
     assert next(c) == len(list(db.restream(db[uid])))
 
 
+class DocumentNames:
+    "Callback recording the names of the documents it receives; it is picklable."
+
+    def __init__(self):
+        self.names = []
+
+    def __call__(self, name, doc):
+        self.names.append(name)
+
+
+def test_process_workers(db, RE, hw, monkeypatch):
+    if not hasattr(db, "v2"):
+        raise pytest.skip("v0 does not support workers")
+    monkeypatch.setattr("databroker.v1.DOCUMENT_PAGE_SIZE", 2)  # Several pages per header
+    RE.subscribe(db.insert)
+    uids = get_uids(RE(count([hw.det], 3))) + get_uids(RE(count([hw.det], 5))) + get_uids(RE(count([hw.det])))
+    headers = [db[uid] for uid in uids]
+
+    callbacks = db.process(headers, DocumentNames, workers=2)
+    assert [cb.names.count('event') for cb in callbacks] == [3, 5, 1]
+    for header, cb in zip(headers, callbacks):
+        assert cb.names == [name for name, doc in db.restream(header)]
+
+    # restream reads headers concurrently but yields their documents in order.
+    expected = list(db.restream(headers))
+    assert list(db.restream(headers, workers=2)) == expected
+
+
+def test_restream_workers_reads_ahead_in_pages(db, RE, hw, monkeypatch):
+    if not hasattr(db, "v2"):
+        raise pytest.skip("v0 does not support workers")
+    monkeypatch.setattr("databroker.v1.DOCUMENT_PAGE_SIZE", 2)
+    monkeypatch.setattr("databroker.v1.MAX_PENDING_PAGES", 1)
+    RE.subscribe(db.insert)
+    uid, = get_uids(RE(count([hw.det], 20)))
+    header = db[uid]
+    expected = list(db.restream(header))
+
+    read = []
+    get_documents = db.get_documents
+
+    def recording_get_documents(*args, **kwargs):
+        for payload in get_documents(*args, **kwargs):
+            read.append(payload)
+            yield payload
+
+    monkeypatch.setattr(db, "get_documents", recording_get_documents)
+    documents = db.restream(header, workers=1)
+    assert next(documents) == expected[0]
+    ttime.sleep(0.5)
+    # The page being consumed, one queued page and the page being filled
+    assert len(read) <= 6 < len(expected)
+    assert [expected[0]] + list(documents) == expected
+
+
 def test_get_fields(db, RE, hw):
     RE.subscribe(db.insert)
     uid, = get_uids(RE(count([hw.det1, hw.det2])))
@@ -740,6 +848,28 @@ def test_export_size_smoke(broker_factory, RE, tmpdir):
     assert size > 0.
 
 
+def test_export_hdf5(db_empty, RE, hw, tmpdir):
+    h5py = pytest.importorskip('h5py')
+    db = db_empty
+    if not hasattr(db, "v2"):
+        raise pytest.skip("v0 does not support exporting to HDF5")
+    RE.subscribe(db.insert)
+    uid, = get_uids(RE(count([hw.det, hw.img], num=3)))
+    filename = str(tmpdir.join('export.h5'))
+    assert db.export(db[uid], filename) == []
+
+    table = db.get_table(db[uid], fill=True)
+    with h5py.File(filename, 'r') as f:
+        assert list(f) == [uid]
+        assert json.loads(f[uid].attrs['start'])['uid'] == uid
+        stream = f[uid]['primary']
+        assert json.loads(stream.attrs['descriptor'])['name'] == 'primary'
+        assert {'det', 'img'} <= set(stream['data'])
+        assert list(stream['data/det']) == list(table['det'])
+        assert stream['data/img'].shape == (3, *np.shape(table['img'].iloc[0]))
+        assert len(stream['time']) == 3
+
+
 def test_results_multiple_iters(db, RE, hw):
     RE.subscribe(db.insert)
     RE(count([hw.det]))
@@ -1007,6 +1137,40 @@ def test_data_method(db, RE, hw):
     assert actual == expected
 
 
+@pytest.mark.parametrize('block_size', [None, 1, 2, 10])
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_data_method_blocks(db, RE, hw, block_size, prefetch):
+    RE.subscribe(db.insert)
+    uid, = get_uids(RE(scan([hw.det], hw.motor, -1, 1, 7)))
+    h = db[uid]
+    if not hasattr(h, "v2"):
+        raise pytest.skip("v0 does not read the data in blocks")
+
+    expected = list(h.table()['motor'])
+    actual = list(h.data('motor', block_size=block_size, prefetch=prefetch))
+    assert actual == expected
+
+    # Values are yielded as blocks arrive; stopping early is fine.
+    values = h.data('motor', block_size=block_size, prefetch=prefetch)
+    assert next(values) == expected[0]
+    values.close()
+
+
+@pytest.mark.parametrize('prefetch', [True, False])
+def test_data_method_empty_stream(db, prefetch):
+    if not hasattr(db, "v2"):
+        raise pytest.skip("v0 does not read the data in blocks")
+    run_bundle = event_model.compose_run()
+    data_keys = {'x': {'source': '', 'dtype': 'number', 'shape': []}}
+    descriptor_bundle = run_bundle.compose_descriptor(
+        name='primary', data_keys=data_keys)
+    db.insert('start', run_bundle.start_doc)
+    db.insert('descriptor', descriptor_bundle.descriptor_doc)
+    db.insert('stop', run_bundle.compose_stop())
+    h = db[run_bundle.start_doc['uid']]
+    assert list(h.data('x', prefetch=prefetch)) == []
+
+
 def test_sanitize_does_not_modify_array_data_in_place(db_empty):
     db = db_empty
     if getattr(getattr(db, "v2", None), "is_sql", False):
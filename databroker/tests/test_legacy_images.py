@@ -0,0 +1,103 @@
+import threading
+
+import numpy as np
+import pytest
+
+da = pytest.importorskip("dask.array")
+pytest.importorskip("pims")
+xarray = pytest.importorskip("xarray")
+
+from .._legacy_images import Images  # noqa: E402
+
+
+class CountingSource:
+    "Array-like object recording the slices read from it."
+
+    def __init__(self, array):
+        self.array = array
+        self.shape = array.shape
+        self.dtype = array.dtype
+        self.ndim = array.ndim
+        self.reads = []
+        self.failures = []  # Slices whose next read raises an error
+        self._lock = threading.Lock()
+
+    def __getitem__(self, key):
+        result = self.array[key]
+        if result.size:  # Ignore the empty reads done by dask to probe the array
+            with self._lock:
+                if key[0] in self.failures:
+                    self.failures.remove(key[0])
+                    raise OSError(f"Cannot read {key[0]}")
+                self.reads.append(key[0])
+        return result
+
+
+def make_images(num_frames, chunk_size, offset=0):
+    array = np.arange(num_frames * 2 * 3).reshape(num_frames, 2, 3) + offset
+    source = CountingSource(array)
+    data = da.from_array(source, chunks=(chunk_size, 2, 3))
+    return source, xarray.DataArray(data, dims=("time", "dim_0", "dim_1"))
+
+
+def test_frames_are_read_by_chunk():
+    source, data_array = make_images(10, 4)
+    images = Images(data_array, prefetch=0)
+    assert len(images) == 10
+    assert images.frame_shape == (2, 3)
+    for i, frame in enumerate(images):
+        assert np.array_equal(frame, source.array[i])
+        assert frame.frame_no == i
+    assert len(source.reads) == 3  # One read per chunk
+    assert images.cache_info()["chunks"] == 3
+
+
+def test_prefetch():
+    source, data_array = make_images(10, 2)
+    images = Images(data_array, prefetch=2)
+    images.get_frame(0)
+    # The next two chunks are read in the background
+    for future in list(images._pending.values()):
+        future.result()
+    assert images.cache_info() == {"chunks": 3, "nbytes": 3 * 2 * 6 * 8, "pending": 0}
+    images.get_frame(2)  # From a prefetched chunk
+    assert [key.start for key in source.reads[:3]] == [0, 2, 4]
+    assert source.reads.count(slice(2, 4)) == 1
+    assert [np.array_equal(images[i], source.array[i]) for i in range(10)] == [True] * 10
+    images.close()
+
+
+def test_failed_prefetch_is_read_again():
+    source, data_array = make_images(6, 2)
+    source.failures.append(slice(2, 4))  # The first read of the second chunk, which is prefetched, fails
+    images = Images(data_array, prefetch=1)
+    images.get_frame(0)
+    for future in list(images._pending.values()):
+        assert isinstance(future.exception(), OSError)
+    assert images.cache_info()["pending"] == 0  # The failed prefetch is not kept
+    assert np.array_equal(images.get_frame(2), source.array[2])
+    assert source.reads.count(slice(2, 4)) == 1
+    images.close()
+
+
+def test_cache_is_bounded():
+    source, data_array = make_images(12, 2)
+    chunk_nbytes = 2 * 6 * 8
+    images = Images(data_array, prefetch=0, cache_size=2 * chunk_nbytes)
+    for i in range(12):
+        images.get_frame(i)
+    assert images.cache_info()["chunks"] == 2
+    assert images.cache_info()["nbytes"] == 2 * chunk_nbytes
+    images.get_frame(0)  # Evicted; read again
+    assert len(source.reads) == 7
+
+
+def test_multiple_arrays_are_concatenated():
+    source1, data_array1 = make_images(3, 2)
+    source2, data_array2 = make_images(4, 3, offset=1000)
+    images = Images([data_array1, data_array2])
+    assert len(images) == 7
+    assert np.array_equal(images[2], source1.array[2])
+    assert np.array_equal(images[3], source2.array[0])
+    assert np.array_equal(images[6], source2.array[3])
+    images.close()
@@ -1,4 +1,5 @@
 from collections import deque
+import json
 import pickle
 import time as ttime
 import uuid
@@ -7,8 +8,11 @@ import pytest
 import warnings
 
 import numpy as np
+from event_model import MismatchedDataKeys
 from types import GeneratorType
 
+from ..headersource.mongoquery import JSONCollection, MDSRO
+
 
 def check_for_id(document):
     """Make sure that our documents do not have an id field
@@ -372,6 +376,101 @@ def test_bulk_table(mds_all):
         assert all(s == v for s, v in zip(seq_nums, vals))
 
 
+def test_bulk_table_fields(mds_all):
+    mdsc = mds_all
+    num = 5
+    rs, e_desc, data_keys = setup_syn(mdsc)
+    all_data = syn_data(data_keys, num)
+
+    mdsc.bulk_insert_events(e_desc, all_data, validate=False)
+    mdsc.insert_run_stop(rs, ttime.time(), uid=str(uuid.uuid4()))
+    full = mdsc.get_events_table(e_desc)
+    ret = mdsc.get_events_table(e_desc, fields=['B', 'A', 'not_a_key'])
+    descriptor, data_table, seq_nums, times, uids, timestamps_table = ret
+    assert list(data_table) == ['A', 'B']  # In the order of the data keys
+    assert list(timestamps_table) == ['A', 'B']
+    assert data_table['A'] == full[1]['A'] == [float(i) for i in range(num)]
+    assert timestamps_table['B'] == full[5]['B']
+    assert (seq_nums, times, uids) == tuple(full[2:5])
+
+
+def test_bulk_table_mismatched_keys():
+    mongomock = pytest.importorskip('mongomock')
+    from ..headersource import core
+
+    data_keys = {k: {'source': k, 'dtype': 'number', 'shape': []}
+                 for k in 'ABL'}
+    descriptor = {'uid': str(uuid.uuid4()), 'data_keys': data_keys}
+    event_col = mongomock.MongoClient().db.event
+    for d in syn_data(data_keys, 3):
+        # Same number of keys as the descriptor, but not the same keys
+        for col in (d['data'], d['timestamps']):
+            col['M'] = col.pop('L')
+        event_col.insert_one(dict(d, descriptor=descriptor['uid']))
+
+    cache = {descriptor['uid']: descriptor}
+    args = (descriptor, event_col, None, cache, None, {})
+    with pytest.raises(MismatchedDataKeys):
+        core.get_events_table(*args)
+    with pytest.raises(MismatchedDataKeys):
+        core.get_events_table(*args, fields=['A'])
+    with pytest.raises(MismatchedDataKeys):
+        list(core.get_events_generator(*args))
+
+
+def make_event_page(e_desc, all_data):
+    # Numpy columns, as produced when packing events from a detector
+    keys = list(all_data[0]['data'])
+    return {'descriptor': e_desc,
+            'uid': [d['uid'] for d in all_data],
+            'time': np.array([d['time'] for d in all_data]),
+            'seq_num': np.array([d['seq_num'] for d in all_data]),
+            'data': {k: np.array([d['data'][k] for d in all_data])
+                     for k in keys},
+            'timestamps': {k: np.array([d['timestamps'][k]
+                                        for d in all_data])
+                           for k in keys},
+            'filled': {}}
+
+
+def test_insert_event_page(mds_all):
+    mdsc = mds_all
+    num = 25
+    rs, e_desc, data_keys = setup_syn(mdsc)
+    all_data = syn_data(data_keys, num)
+
+    event_page = make_event_page(e_desc, all_data)
+    assert mdsc.insert_event_page(event_page, validate=True,
+                                  batch_size=10) == num
+    mdsc.insert_run_stop(rs, ttime.time(), uid=str(uuid.uuid4()))
+
+    ev_gen = mdsc.get_events_generator(e_desc)
+    rets = list(ev_gen)
+    assert len(rets) == num
+    for ret, expt in zip(rets, all_data):
+        assert ret['descriptor'] == e_desc
+        for k in ['data', 'timestamps', 'time', 'uid', 'seq_num']:
+            assert ret[k] == expt[k]
+        assert ret['filled'] == {'Z': False}
+
+
+def test_bad_insert_event_page(mds_all):
+    mdsc = mds_all
+    num = 5
+    rs, e_desc, data_keys = setup_syn(mdsc)
+    all_data = syn_data(data_keys, num)
+
+    event_page = make_event_page(e_desc, all_data)
+    del event_page['timestamps']['F']
+    with pytest.raises(ValueError):
+        mdsc.insert_event_page(event_page, validate=True)
+
+    event_page = make_event_page(e_desc, all_data)
+    event_page['data']['A'] = event_page['data']['A'][:-1]
+    with pytest.raises(ValueError):
+        mdsc.insert_event_page(event_page, validate=True)
+
+
 def test_cache_clear_lookups(mds_all):
     mdsc = mds_all
     run_start_uid, e_desc_uid, data_keys = setup_syn(mdsc)
@@ -397,6 +496,19 @@ def test_cache_clear_lookups(mds_all):
     assert ev_desc == ev_desc3
 
 
+def test_cache_info(mds_all):
+    mdsc = mds_all
+    run_start_uid, e_desc_uid, data_keys = setup_syn(mdsc)
+    mdsc.clear_process_cache()
+    mdsc.descriptor_given_uid(e_desc_uid)
+    mdsc.descriptor_given_uid(e_desc_uid)
+    info = mdsc.cache_info()
+    assert set(info) == {'run_start', 'run_stop', 'descriptor'}
+    assert info['descriptor']['hits'] >= 1
+    assert info['descriptor']['misses'] >= 1
+    assert 0 < info['descriptor']['nbytes'] <= mdsc.CACHE_BYTES
+
+
 def test_run_stop_by_run_start(mds_all):
     mdsc = mds_all
     run_start_uid, e_desc_uid, data_keys = setup_syn(mdsc)
@@ -551,3 +663,81 @@ def test_reload(mds_portable):
         for k in ['data', 'timestamps', 'time', 'uid', 'seq_num']:
             assert ret[k] == expt[k]
             assert ret_n[k] == expt[k]
+
+
+def test_json_collection(tmp_path):
+    fp = str(tmp_path / 'docs.json')
+    col = JSONCollection(fp)
+    docs = [{'uid': str(i), 'descriptor': 'd{}'.format(i % 2),
+             'time': float(10 - i)} for i in range(10)]
+    col.insert_one(docs[0], fk='uid')
+    col.insert_many(docs[1:])
+    with pytest.raises(RuntimeError):
+        col.insert_one(docs[0], fk='uid')
+
+    # The file is appended to, one document per line.
+    with open(fp) as f:
+        assert [json.loads(line) for line in f] == docs
+
+    def uids(result):
+        return [doc['uid'] for doc in result]
+
+    assert uids(col.find({'descriptor': 'd1'})) == ['1', '3', '5', '7', '9']
+    assert uids(col.find({'uid': {'$in': ['4', '2', 'x']}})) == ['2', '4']
+    assert uids(col.find({'time': {'$gte': 3, '$lt': 6}})) == ['5', '6', '7']
+    assert uids(col.find({'descriptor': 'd0', 'time': {'$gt': 5}},
+                         sort=[('time', 1)])) == ['4', '2', '0']
+    assert uids(col.find({'descriptor': 'd0', 'uid': '1'})) == []
+    assert col.find_one({'uid': '3'}) == docs[3]
+    # Queries which are not answered from the indexes
+    assert uids(col.find({'time': {'$ne': 10.0}})) == uids(docs[1:])
+
+    # Returned documents are copies.
+    col.find_one({'uid': '3'})['time'] = 0
+    assert col.find_one({'uid': '3'}) == docs[3]
+
+    # Writes from another instance are picked up on refresh.
+    other = JSONCollection(fp)
+    other.insert_one({'uid': 'new', 'time': 0.5})
+    col.refresh()
+    assert uids(col.find({'time': {'$lt': 1}})) == ['new']
+    col.insert_one({'uid': 'newer'})
+    assert JSONCollection(fp).find_one({'uid': 'newer'}) == {'uid': 'newer'}
+
+
+def test_json_collection_legacy_format(tmp_path):
+    # Files written as a single JSON list are read as they are, and
+    # converted to JSON lines on the first insert.
+    fp = str(tmp_path / 'docs.json')
+    docs = [{'uid': 'a', 'time': 1.0}, {'uid': 'b', 'time': 2.0}]
+    with open(fp, 'w') as f:
+        json.dump(docs, f)
+    with open(fp, 'rb') as f:
+        original = f.read()
+    col = JSONCollection(fp)
+    assert list(col.find({})) == docs
+    assert col.find_one({'uid': 'b'}) == docs[1]
+    assert list(col.find({'time': {'$gt': 1.5}})) == [docs[1]]
+    col.refresh()
+    with open(fp, 'rb') as f:
+        assert f.read() == original
+
+    # A read-only source does not write to the files either.
+    starts_fp = str(tmp_path / 'run_starts.json')
+    with open(starts_fp, 'w') as f:
+        json.dump([{'uid': 'start', 'time': 1.0}], f)
+    mdsro = MDSRO({'directory': str(tmp_path)})
+    assert mdsro._runstart_col.find_one({'uid': 'start'})['time'] == 1.0
+    with open(starts_fp) as f:
+        assert json.load(f) == [{'uid': 'start', 'time': 1.0}]
+
+    # A file in the original format rewritten by another program is reloaded.
+    docs.append({'uid': 'c', 'time': 3.0})
+    with open(fp, 'w') as f:
+        json.dump(docs, f, indent=1)
+    col.refresh()
+    assert [doc['uid'] for doc in col.find({})] == ['a', 'b', 'c']
+
+    col.insert_one({'uid': 'd', 'time': 4.0})
+    with open(fp) as f:
+        assert [json.loads(line)['uid'] for line in f] == ['a', 'b', 'c', 'd']
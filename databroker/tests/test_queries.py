@@ -12,10 +12,12 @@ from tiled.queries import (
     Regex,
 )
 from databroker.queries import (
+    EqAll,
     ScanID,
     ScanIDRange,
     TimeRange,
 )
+from ..mongo_normalized import MongoAdapter
 from ..tests.utils import get_uids
 
 
@@ -72,6 +74,44 @@ def test_eq(c, RE, hw):
         assert should_not_match not in results
 
 
+def test_eq_all(c, RE, hw):
+    RE.subscribe(c.v1.insert)
+
+    (should_match,) = get_uids(RE(count([hw.det]), foo="a", bar=1))
+    (should_not_match1,) = get_uids(RE(count([hw.det]), foo="a", bar=2))
+    (should_not_match2,) = get_uids(RE(count([hw.det]), foo="b", bar=1))
+
+    for values in [{"foo": "a", "bar": 1}, {"start.foo": "a", "bar": 1}]:
+        results = c.search(EqAll(values))
+        assert list(results) == [should_match]
+
+    # Broker.__call__ compiles its keywords into one EqAll query.
+    assert [header.start["uid"] for header in c.v1(foo="a", bar=1)] == [should_match]
+
+
+def test_eq_all_fallback(c, RE, hw, monkeypatch):
+    # Servers which do not register EqAll are searched with one Eq per keyword.
+    RE.subscribe(c.v1.insert)
+
+    (should_match,) = get_uids(RE(count([hw.det]), foo="a", bar=1))
+    (should_not_match,) = get_uids(RE(count([hw.det]), foo="a", bar=2))
+
+    queries = [name for name in c.context.server_info.queries if name != "eq_all"]
+    monkeypatch.setattr(c.context.server_info, "queries", queries)
+
+    def no_eq_all(values):
+        raise AssertionError("EqAll is not supported by the server")
+
+    monkeypatch.setattr("databroker.v1.EqAll", no_eq_all)
+    assert [header.start["uid"] for header in c.v1(foo="a", bar=1)] == [should_match]
+
+
+def test_eq_all_is_one_mongo_query():
+    adapter = MongoAdapter.from_mongomock()
+    results = adapter.search(EqAll({"start.foo": "a", "bar": 1}))
+    assert results.queries == [{"foo": "a", "bar": 1}]
+
+
 def test_not_eq(c, RE, hw):
     RE.subscribe(c.v1.insert)
 
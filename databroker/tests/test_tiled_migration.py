@@ -0,0 +1,116 @@
+import threading
+
+import bluesky.plans as bp
+import pytest
+from bluesky_tiled_plugins import TiledWriter
+from ophyd.sim import det, motor
+from tiled.catalog import in_memory
+from tiled.client import Context, from_context
+from tiled.server.app import build_app
+
+from ..mongo_normalized import MongoAdapter
+from .. import tiled_migration
+from ..tiled_migration import DONE, FAILED, MigrationCheckpoint, migrate
+
+
+@pytest.fixture
+def source(RE):
+    suitcase_mongo = pytest.importorskip("suitcase.mongo_normalized")
+    adapter = MongoAdapter.from_mongomock()
+    serializer = suitcase_mongo.Serializer(adapter._metadatastore_db, adapter._asset_registry_db)
+    uids = []
+    RE.subscribe(lambda name, doc: uids.append(doc["uid"]) if name == "start" else None)
+    RE(bp.scan([det], motor, -1, 1, 7), serializer)
+    RE(bp.count([det], 3), serializer)
+    return adapter, uids
+
+
+@pytest.fixture
+def target(tmp_path):
+    catalog = in_memory(writable_storage={"filesystem": str(tmp_path), "sql": f"duckdb:///{tmp_path}/t.db"})
+    with Context.from_app(build_app(catalog)) as context:
+        yield from_context(context)
+
+
+def test_migrate_to_tiled(source, target, tmp_path):
+    adapter, uids = source
+    checkpoint = MigrationCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+
+    # A partially written run (e.g. from an interrupted migration) is replaced
+    TiledWriter(target)("start", adapter[uids[0]].metadata()["start"])
+    assert "stop" not in target[uids[0]].metadata
+
+    # The in-memory test catalog does not support concurrent writes; use a single worker
+    summary = migrate(adapter, target, checkpoint, workers=1, page_size=3)
+    assert summary["migrated"] == 2
+    assert summary["failed"] == 0
+    assert checkpoint.counts() == {DONE: 2}
+    assert set(target) == set(uids)
+    assert "stop" in target[uids[0]].metadata
+    assert list(target[uids[0]]["primary"].read()["det"].values) == list(
+        adapter[uids[0]]["primary"]["data"]["det"].read()
+    )
+
+    # Runs recorded in the checkpoint are skipped when the migration is resumed
+    summary = migrate(adapter, target, checkpoint, workers=1)
+    assert summary["migrated"] == 0
+    assert summary["skipped"] == 2
+
+
+def test_migrate_to_tiled_failures(source, target, tmp_path, monkeypatch):
+    adapter, uids = source
+    checkpoint = MigrationCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+
+    def fail(*args, **kwargs):
+        raise RuntimeError("Server unavailable")
+
+    monkeypatch.setattr("databroker.tiled_migration.migrate_run", fail)
+    errors = []
+    summary = migrate(adapter, target, checkpoint, callback=lambda uid, num, err: errors.append(err))
+    assert summary["failed"] == 2
+    assert checkpoint.counts() == {FAILED: 2}
+    assert all(isinstance(err, RuntimeError) for err in errors)
+    with pytest.raises(RuntimeError):
+        migrate(adapter, target, checkpoint, strict=True)
+
+    # Failed runs are retried
+    monkeypatch.undo()
+    summary = migrate(adapter, target, checkpoint, workers=1, limit=1)
+    assert summary["migrated"] == 1
+    assert checkpoint.counts() == {DONE: 1, FAILED: 1}
+
+
+def test_migrate_to_tiled_resume_concurrent(source, target, tmp_path, monkeypatch):
+    adapter, uids = source
+    checkpoint = MigrationCheckpoint(str(tmp_path / "checkpoint.sqlite"))
+    event_hooks = {key: list(hooks) for key, hooks in target.context.http_client.event_hooks.items()}
+
+    # The in-memory test catalog does not support concurrent writes; serialize them, but not the workers
+    lock = threading.Lock()
+    threads = set()
+    migrate_run = tiled_migration.migrate_run
+
+    def serialized_migrate_run(*args, **kwargs):
+        threads.add(threading.current_thread().name)
+        with lock:
+            return migrate_run(*args, **kwargs)
+
+    monkeypatch.setattr("databroker.tiled_migration.migrate_run", serialized_migrate_run)
+    summary = migrate(adapter, target, checkpoint, workers=2, limit=1)
+    assert summary["migrated"] == 1
+    assert checkpoint.remaining(adapter.keys()) == 1
+
+    # Resume from the checkpoint: only the remaining run is migrated
+    migrated = []
+    summary = migrate(adapter, target, checkpoint, workers=2, callback=lambda uid, num, err: migrated.append(uid))
+    assert summary["migrated"] == 1
+    assert summary["skipped"] == 1
+    assert len(migrated) == 1
+    assert checkpoint.counts() == {DONE: 2}
+    assert checkpoint.remaining(adapter.keys()) == 0
+    assert set(target) == set(uids)
+    assert all(name.startswith("migrate-to-tiled") for name in threads)
+
+    # The writers of all the runs and worker threads share a single pair of HTTP hooks on the client
+    for key, hooks in target.context.http_client.event_hooks.items():
+        assert len(hooks) == len(event_hooks[key]) + 1
@@ -0,0 +1,200 @@
+"""
+Copy Bluesky runs from a (MongoDB-backed) databroker catalog into a Tiled-native
+catalog, in parallel and with a resumable checkpoint of the progress.
+"""
+
+import sqlite3
+import time
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+
+# Statuses of runs recorded in the checkpoint
+DONE = "done"
+FAILED = "failed"
+
+
+class MigrationCheckpoint:
+    """
+    Record of the progress of a migration, per run, in a local SQLite database.
+
+    Runs recorded as done are skipped when the migration is restarted.
+
+    Parameters
+    ----------
+    path : str
+        Path to the SQLite database file; it is created if it does not exist.
+    """
+
+    def __init__(self, path):
+        self.path = path
+        self._conn = sqlite3.connect(path)
+        self._conn.execute(
+            "CREATE TABLE IF NOT EXISTS runs ("
+            "uid TEXT PRIMARY KEY, status TEXT NOT NULL, num_documents INTEGER, "
+            "elapsed REAL, error TEXT, updated REAL)"
+        )
+        self._conn.commit()
+
+    def done(self):
+        "Return the set of uids of the runs that have been migrated."
+        cursor = self._conn.execute("SELECT uid FROM runs WHERE status = ?", (DONE,))
+        return {uid for (uid,) in cursor}
+
+    def remaining(self, uids):
+        "Return the number of runs among ``uids`` that have not been migrated."
+        done = self.done()
+        return sum(1 for uid in uids if uid not in done)
+
+    def record(self, uid, status, num_documents=0, elapsed=0.0, error=None):
+        "Record the outcome of migrating one run."
+        self._conn.execute(
+            "INSERT OR REPLACE INTO runs VALUES (?, ?, ?, ?, ?, ?)",
+            (uid, status, num_documents, elapsed, error, time.time()),
+        )
+        self._conn.commit()
+
+    def counts(self):
+        "Return the number of runs by status."
+        cursor = self._conn.execute("SELECT status, COUNT(*) FROM runs GROUP BY status")
+        return dict(cursor)
+
+    def close(self):
+        self._conn.close()
+
+
+def migrate_run(run, client, *, page_size=1000, batch_size=10000):
+    """
+    Write all the documents of one run into Tiled.
+
+    A partially written copy of the run (without a Stop document) in the target
+    catalog, e.g. from an interrupted migration, is deleted first; a complete
+    copy is left untouched.
+
+    Parameters
+    ----------
+    run : BlueskyRun adapter
+        The source run; it must provide ``documents(fill, size)``.
+    client : tiled.client.container.Container
+        The target catalog.
+    page_size : int
+        Maximum number of rows in the EventPage and DatumPage documents.
+    batch_size : int
+        Number of rows written to Tiled at once by TiledWriter.
+
+    Returns
+    -------
+    num_documents : int
+        The number of (paged) documents written.
+    """
+    from bluesky_tiled_plugins import TiledWriter
+
+    uid = run.metadata()["start"]["uid"]
+    if uid in client:
+        if "stop" in client[uid].metadata:
+            return 0
+        client.delete_contents(uid, recursive=True, external_only=False)
+
+    writer = TiledWriter(client, batch_size=batch_size)
+    num_documents = 0
+    try:
+        for name, doc in run.documents(fill=False, size=page_size):
+            writer(name, doc)
+            num_documents += 1
+    finally:
+        writer.close()
+    return num_documents
+
+
+def migrate(
+    adapter,
+    client,
+    checkpoint,
+    *,
+    workers=4,
+    page_size=1000,
+    batch_size=10000,
+    limit=None,
+    strict=False,
+    callback=None,
+):
+    """
+    Migrate the runs in ``adapter`` to ``client`` using a pool of worker threads.
+
+    Runs already recorded as done in the checkpoint are skipped; runs that fail
+    are recorded as failed and retried on the next invocation.
+
+    Parameters
+    ----------
+    adapter : MongoAdapter
+        The source catalog, possibly filtered by a search.
+    client : tiled.client.container.Container
+        The target catalog.
+    checkpoint : MigrationCheckpoint
+    workers : int
+        Number of runs migrated concurrently.
+    page_size, batch_size : int
+        Passed to :func:`migrate_run`.
+    limit : int, optional
+        Maximum number of runs to migrate in this invocation.
+    strict : bool
+        If True, stop at the first failure and raise its exception.
+    callback : callable, optional
+        Called as ``callback(uid, num_documents, error)`` after each run.
+
+    Returns
+    -------
+    summary : dict
+        Numbers of runs migrated, skipped, and failed, number of documents, and
+        the elapsed time in seconds.
+    """
+    done = checkpoint.done()
+    summary = {"migrated": 0, "skipped": 0, "failed": 0, "documents": 0}
+    t0 = time.monotonic()
+
+    def _migrate(uid):
+        t_run = time.monotonic()
+        num_documents = migrate_run(adapter[uid], client, page_size=page_size, batch_size=batch_size)
+        return num_documents, time.monotonic() - t_run
+
+    def _collect(futures):
+        for future in futures:
+            uid = pending.pop(future)
+            try:
+                num_documents, elapsed = future.result()
+            except Exception as err:
+                checkpoint.record(uid, FAILED, error=repr(err))
+                summary["failed"] += 1
+                if callback is not None:
+                    callback(uid, 0, err)
+                if strict:
+                    raise
+            else:
+                checkpoint.record(uid, DONE, num_documents, elapsed)
+                summary["migrated"] += 1
+                summary["documents"] += num_documents
+                if callback is not None:
+                    callback(uid, num_documents, None)
+
+    pending = {}
+    with ThreadPoolExecutor(max_workers=workers, thread_name_prefix="migrate-to-tiled") as executor:
+        try:
+            num_submitted = 0
+            for uid in adapter.keys():
+                if uid in done:
+                    summary["skipped"] += 1
+                    continue
+                if limit is not None and num_submitted >= limit:
+                    break
+                # Bound the number of runs in flight rather than enumerating the whole catalog up front.
+                if len(pending) >= 2 * workers:
+                    finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    _collect(finished)
+                pending[executor.submit(_migrate, uid)] = uid
+                num_submitted += 1
+            _collect(list(pending))
+        except BaseException:
+            for future in pending:
+                future.cancel()
+            raise
+
+    summary["elapsed"] = time.monotonic() - t0
+    return summary
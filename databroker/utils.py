@@ -433,3 +433,138 @@ class LazyMap(collections.abc.Mapping):
     def __setstate__(self, mapping):
         self.__mapping = mapping
         self.__lock = threading.Lock()
+
+
+def approximate_size(obj):
+    "Estimate the memory footprint in bytes of a document or array."
+    if isinstance(obj, np.ndarray):
+        return obj.nbytes
+    if hasattr(obj, 'memory_usage'):  # pandas objects
+        return int(np.sum(obj.memory_usage(deep=True)))
+    size = sys.getsizeof(obj)
+    if isinstance(obj, dict):
+        size += sum(approximate_size(k) + approximate_size(v)
+                    for k, v in obj.items())
+    elif isinstance(obj, (list, tuple)):
+        size += sum(approximate_size(v) for v in obj)
+    return size
+
+
+class BoundedCache(collections.abc.MutableMapping):
+    """A thread-safe least-recently-used cache of bounded size
+
+    Items are evicted, least recently used first, when there are more than
+    `max_size` of them or, if `max_bytes` is given, when their estimated
+    total size exceeds `max_bytes`. The most recent item is always kept.
+
+    Parameters
+    ----------
+    max_size : int or None, optional
+        Maximum number of items. None means no limit.
+    max_bytes : int or None, optional
+        Maximum estimated total size of the values in bytes. None means no
+        limit, and the size of the values is then not estimated.
+    on_miss : callable, optional
+        Called with the missing key on lookup; the returned value is cached.
+    sizeof : callable, optional
+        Estimates the size of a value in bytes. Defaults to
+        :func:`approximate_size`.
+    """
+    def __init__(self, max_size=128, max_bytes=None, on_miss=None,
+                 sizeof=approximate_size):
+        self.max_size = max_size
+        self.max_bytes = max_bytes
+        self.on_miss = on_miss
+        self.sizeof = sizeof
+        self._lock = threading.RLock()
+        self._data = collections.OrderedDict()  # key -> (value, nbytes)
+        self._nbytes = 0
+        self.hits = self.misses = self.evictions = 0
+
+    def __getitem__(self, key):
+        with self._lock:
+            try:
+                value, _ = self._data[key]
+            except KeyError:
+                self.misses += 1
+                if self.on_miss is None:
+                    raise
+            else:
+                self.hits += 1
+                self._data.move_to_end(key)
+                return value
+        # Do not hold the lock while fetching the missing value.
+        value = self.on_miss(key)
+        self[key] = value
+        return value
+
+    def __setitem__(self, key, value):
+        nbytes = self.sizeof(value) if self.max_bytes is not None else 0
+        with self._lock:
+            if key in self._data:
+                self._nbytes -= self._data.pop(key)[1]
+            self._data[key] = (value, nbytes)
+            self._nbytes += nbytes
+            self._evict()
+
+    def __delitem__(self, key):
+        with self._lock:
+            self._nbytes -= self._data.pop(key)[1]
+
+    _marker = object()
+
+    def pop(self, key, default=_marker):
+        # Unlike lookups, this does not call on_miss.
+        with self._lock:
+            if key in self._data:
+                value, nbytes = self._data.pop(key)
+                self._nbytes -= nbytes
+                return value
+        if default is self._marker:
+            raise KeyError(key)
+        return default
+
+    def __contains__(self, key):
+        # Membership tests do not count as hits or misses.
+        return key in self._data
+
+    def __iter__(self):
+        with self._lock:
+            return iter(list(self._data))
+
+    def __len__(self):
+        return len(self._data)
+
+    def _evict(self):
+        while len(self._data) > 1 and (
+                (self.max_size is not None and
+                 len(self._data) > self.max_size) or
+                (self.max_bytes is not None and
+                 self._nbytes > self.max_bytes)):
+            _, (_, nbytes) = self._data.popitem(last=False)
+            self._nbytes -= nbytes
+            self.evictions += 1
+
+    def clear(self):
+        "Remove all the items; the statistics are kept."
+        with self._lock:
+            self._data.clear()
+            self._nbytes = 0
+
+    def cache_info(self):
+        "Return the hit, miss and eviction counts and the current size."
+        with self._lock:
+            return {'hits': self.hits,
+                    'misses': self.misses,
+                    'evictions': self.evictions,
+                    'size': len(self._data),
+                    'max_size': self.max_size,
+                    'nbytes': self._nbytes,
+                    'max_bytes': self.max_bytes}
+
+    def __getstate__(self):
+        # The cached items are not pickled, only the configuration.
+        return self.max_size, self.max_bytes, self.on_miss, self.sizeof
+
+    def __setstate__(self, state):
+        self.__init__(*state)
@@ -1,5 +1,6 @@
 import functools
-from collections import defaultdict
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
 from datetime import datetime
 import pandas
 import re
@@ -7,11 +8,13 @@ import warnings
 import time
 import humanize
 import jinja2
+import multiprocessing
 import os
+import queue
+import threading
 from types import SimpleNamespace
 import numpy as np
 
-import xarray
 import event_model
 
 # Toolz and CyToolz have identical APIs -- same test suite, docstrings.
@@ -24,7 +27,7 @@ from tiled.client import from_profile
 from tiled.client.utils import ClientError
 from tiled.queries import FullText, Key
 
-from bluesky_tiled_plugins.queries import TimeRange
+from bluesky_tiled_plugins.queries import EqAll, TimeRange
 from .utils import ALL, get_fields, wrap_in_deprecated_doct
 
 
@@ -32,6 +35,11 @@ from .utils import ALL, get_fields, wrap_in_deprecated_doct
 # (e.g. 'delayed') so it expects a string instead of a boolean.
 _FILL = {True: "yes", False: "no"}
 
+# Number of documents per page read ahead by restream and process with workers,
+# and the number of pages per header that may wait to be consumed.
+DOCUMENT_PAGE_SIZE = 1000
+MAX_PENDING_PAGES = 4
+
 
 def temp_config():
     raise NotImplementedError("Use temp() instead, which returns a v1.Broker.")
@@ -249,8 +257,16 @@ class Broker:
             )
         if "data_key" in kwargs:
             raise NotImplementedError("Search by data key is no longer implemented.")
-        for key, value in kwargs.items():
+        if len(kwargs) == 1:
+            ((key, value),) = kwargs.items()
             results_catalog = results_catalog.search(Key(key) == value)
+        elif kwargs and _supports_query(results_catalog, "eq_all"):
+            # Apply all the keywords as one query, rather than one search per keyword.
+            results_catalog = results_catalog.search(EqAll(kwargs))
+        else:
+            # The server does not know EqAll; chain one search per keyword.
+            for key, value in kwargs.items():
+                results_catalog = results_catalog.search(Key(key) == value)
         if text_search:
             results_catalog = results_catalog.search(FullText(text_search))
         self._patch_state(results_catalog)
@@ -462,6 +478,8 @@ class Broker:
         convert_times=True,
         timezone=None,
         localize_times=True,
+        max_workers=None,
+        stack_arrays=False,
     ):
         """
         Load the data from one or more runs as a table (``pandas.DataFrame``).
@@ -520,9 +538,27 @@ class Broker:
 
             Defaults to True to preserve back-compatibility.
 
+        max_workers : int, optional
+            Maximum number of headers read concurrently, in a pool of threads.
+            By default, this is chosen by ``concurrent.futures``.
+
+        stack_arrays : bool, optional
+            If True, multidimensional fields (e.g. waveforms) are not stored in
+            the table as columns of per-row arrays. Instead, each is stacked
+            into a single NumPy array, with one row per row of the table, and
+            the arrays are returned alongside the table. Fields with different
+            shapes (or missing) in some of the headers are still stored as
+            columns. False by default.
+
         Returns
         -------
         table : pandas.DataFrame
+        arrays : dict
+            Only if ``stack_arrays`` is True, in which case ``(table, arrays)``
+            is returned. Maps the names of the stacked fields to their arrays.
+            Row ``i`` of each array is positional row ``i`` of the table, so
+            the table and the arrays are filtered with the same mask, e.g.
+            ``table[mask]`` and ``arrays[name][mask.to_numpy()]``.
         """
 
         if handler_registry is not None:
@@ -534,8 +570,8 @@ class Broker:
 
         headers = _ensure_list(headers)
         fields = set(fields or [])
-        dfs = []
-        for header in headers:
+
+        def _read(header):
             descriptors = [
                 d for d in header.descriptors if d.get("name") == stream_name
             ]
@@ -556,12 +592,20 @@ class Broker:
             dataset = run[stream_name].read(variables=(applicable_fields or None))
             dataset.load()
             dict_of_arrays = {}
+            arrays = {}  # Multidimensional fields, if stack_arrays
             for var_name in dataset:
                 column = dataset[var_name][:].data
                 if column.ndim > 1:
+                    if stack_arrays:
+                        arrays[var_name] = column
+                        continue
                     column = list(column)  # data must be 1-dimensional
                 dict_of_arrays[var_name] = column
-            df = pandas.DataFrame(dict_of_arrays)
+            index = None
+            if arrays and not dict_of_arrays:
+                # Only multidimensional fields were read; the table has no columns but has rows
+                index = pandas.RangeIndex(len(next(iter(arrays.values()))))
+            df = pandas.DataFrame(dict_of_arrays, index=index)
             # if converting to datetime64 (in utc or 'local' tz)
             if len(dataset):
                 times = dataset["time"][:].data
@@ -581,15 +625,27 @@ class Broker:
                 )
 
             df["time"] = times
-            dfs.append(df)
+            return df, arrays
+
+        # Read the headers concurrently; the network round-trips dominate.
+        if len(headers) > 1:
+            with ThreadPoolExecutor(max_workers=max_workers) as executor:
+                results = list(executor.map(_read, headers))
+        else:
+            results = [_read(header) for header in headers]
+        dfs = [df for df, _ in results]
         if dfs:
             result = pandas.concat(dfs)
         else:
             # edge case: no data
             result = pandas.DataFrame()
+        if stack_arrays:
+            arrays = _stack_arrays(result, results)
         result.index.name = "seq_num"
         # seq_num starts at 1, not 0
         result.index = 1 + result.index
+        if stack_arrays:
+            return result, arrays
         return result
 
     def get_images(
@@ -598,12 +654,18 @@ class Broker:
         name,
         stream_name="primary",
         handler_registry=None,
+        prefetch=None,
+        cache_size=None,
     ):
         """
         This method is deprecated. Use Broker.get_documents instead.
 
         Load image data from one or more runs into a lazy array-like object.
 
+        The frames are read one chunk at a time; while iterating, the next
+        chunks are read ahead in the background and the decoded chunks are
+        kept in a cache of bounded size.
+
         Parameters
         ----------
         headers : Header or list of Headers
@@ -611,6 +673,12 @@ class Broker:
             field name (data key) of a detector
         handler_registry : dict, optional
             mapping spec names (strings) to handlers (callable classes)
+        prefetch : int, optional
+            number of chunks read ahead; 0 disables prefetching. By default,
+            ``databroker._legacy_images.PREFETCH_CHUNKS``.
+        cache_size : int, optional
+            maximum size in bytes of the cached chunks. By default,
+            ``databroker._legacy_images.CACHE_SIZE``.
 
         Examples
         --------
@@ -620,20 +688,24 @@ class Broker:
                 # do something
         """
         # Defer this import so that pims is an optional dependency.
-        from ._legacy_images import Images
+        from ._legacy_images import Images, CACHE_SIZE, PREFETCH_CHUNKS
 
         headers = _ensure_list(headers)
-        datasets = [header.xarray_dask(stream_name=stream_name) for header in headers]
         if handler_registry is not None:
             raise NotImplementedError(
                 "The handler_registry parameter is no longer supported "
                 "and must be None."
             )
-        dataset = xarray.merge(datasets)
-        data_array = dataset[name]
-        return Images(data_array=data_array)
+        # Concatenate the (lazy) arrays of the headers, keeping their chunks,
+        # rather than merging the datasets.
+        data_arrays = [header.xarray_dask(stream_name=stream_name)[name] for header in headers]
+        return Images(
+            data_array=data_arrays,
+            prefetch=PREFETCH_CHUNKS if prefetch is None else prefetch,
+            cache_size=CACHE_SIZE if cache_size is None else cache_size,
+        )
 
-    def restream(self, headers, fields=None, fill=False):
+    def restream(self, headers, fields=None, fill=False, workers=None):
         """
         Get all Documents from given run(s).
 
@@ -649,6 +721,10 @@ class Broker:
         fill : bool, optional
             Whether externally-stored data should be filled in. Defaults to
             False.
+        workers : int, optional
+            If given, read the documents of up to this many headers ahead,
+            concurrently, in worker threads. The documents are still yielded
+            header by header, in order.
 
         Yields
         ------
@@ -669,12 +745,75 @@ class Broker:
         --------
         :meth:`Broker.process`
         """
-        for payload in self.get_documents(headers, fields=fields, fill=fill):
-            yield payload
+        if workers is None:
+            for payload in self.get_documents(headers, fields=fields, fill=fill):
+                yield payload
+        else:
+            for pages in self._read_documents(headers, fields, fill, workers):
+                for page in pages:
+                    yield from page
 
     stream = restream  # compat
 
-    def process(self, headers, func, fields=None, fill=False):
+    def _read_documents(self, headers, fields, fill, workers):
+        """
+        Yield the documents of each header as an iterator of pages, reading up
+        to `workers` headers ahead.
+
+        Each header is read in a worker thread into a bounded queue of pages,
+        so the documents held in memory do not grow with the size of the runs.
+        """
+        stopped = threading.Event()
+
+        def put(pages, item):
+            while not stopped.is_set():
+                try:
+                    pages.put(item, timeout=0.1)
+                    return True
+                except queue.Full:
+                    pass
+            return False
+
+        def read(header, pages):
+            try:
+                page = []
+                for payload in self.get_documents(header, fields=fields, fill=fill):
+                    page.append(payload)
+                    if len(page) >= DOCUMENT_PAGE_SIZE:
+                        if not put(pages, ("page", page)):
+                            return
+                        page = []
+                if page and not put(pages, ("page", page)):
+                    return
+                put(pages, ("done", None))
+            except Exception as error:
+                put(pages, ("error", error))
+
+        def consume(pages):
+            while True:
+                kind, item = pages.get()
+                if kind == "done":
+                    return
+                if kind == "error":
+                    raise item
+                yield item
+
+        readers = deque()
+        with ThreadPoolExecutor(max_workers=workers) as executor:
+            try:
+                for header in _ensure_list(headers):
+                    if len(readers) >= workers:
+                        yield consume(readers.popleft())
+                    pages = queue.Queue(maxsize=MAX_PENDING_PAGES)
+                    executor.submit(read, header, pages)
+                    readers.append(pages)
+                while readers:
+                    yield consume(readers.popleft())
+            finally:
+                # Release the readers blocked on a full queue.
+                stopped.set()
+
+    def process(self, headers, func, fields=None, fill=False, workers=None):
         """
         Pass all the documents from one or more runs into a callback.
 
@@ -688,11 +827,25 @@ class Broker:
         func : callable
             function with the signature `f(name, doc)`
             where `name` is a string and `doc` is a dict
+
+            If `workers` is given, a callback factory instead: a picklable
+            callable, taking no arguments, that returns such a function.
         fields : list, optional
             whitelist of field names of interest; if None, all are returned
         fill : bool, optional
             Whether externally-stored data should be filled in. Defaults to
             False.
+        workers : int, optional
+            If given, process the headers in parallel in a pool of this many
+            worker processes. In each worker, a new callback, made by calling
+            `func()`, receives all the documents of one header. The documents
+            are read in this process and sent to the workers in pages.
+
+        Returns
+        -------
+        callbacks : list or None
+            If `workers` is given, the callbacks (which must be picklable), in
+            the order of the headers, with whatever results they accumulated.
 
         Examples
         --------
@@ -702,12 +855,45 @@ class Broker:
         >>> h = db[-1]  # most recent header
         >>> process(h, f)
 
+        Process many headers in 8 processes, counting the events of each one.
+
+        >>> class CountEvents:
+        ...     def __init__(self):
+        ...         self.count = 0
+        ...     def __call__(self, name, doc):
+        ...         if name == 'event':
+        ...             self.count += 1
+        ...
+        >>> counts = [cb.count for cb in process(db(plan_name='scan'), CountEvents, workers=8)]
+
         See Also
         --------
         :meth:`Broker.restream`
         """
-        for name, doc in self.get_documents(headers, fields=fields, fill=fill):
-            func(name, doc)
+        if workers is None:
+            for name, doc in self.get_documents(headers, fields=fields, fill=fill):
+                func(name, doc)
+            return
+        results = []
+        pending = deque()
+        # Forking a process that runs client threads is unsafe, so start fresh interpreters.
+        mp_context = multiprocessing.get_context("spawn")
+        with mp_context.Manager() as manager, \
+                ProcessPoolExecutor(max_workers=workers, mp_context=mp_context) as executor:
+            # Bound the number of headers in flight rather than reading them all up front.
+            for pages in self._read_documents(headers, fields, fill, workers):
+                if len(pending) >= 2 * workers:
+                    results.append(pending.popleft().result())
+                # Stream the documents to the worker through a bounded queue of pages.
+                page_queue = manager.Queue(maxsize=MAX_PENDING_PAGES)
+                pending.append(executor.submit(_process_documents, func, page_queue))
+                try:
+                    for page in pages:
+                        page_queue.put(page)
+                finally:
+                    page_queue.put(None)
+            results.extend(future.result() for future in pending)
+        return results
 
     def export(self, headers, db, new_root=None, copy_kwargs=None):
         """
@@ -717,13 +903,16 @@ class Broker:
         this new location, and the corresponding resource document will be
         updated with the new_root.
 
+        If db is a file path, the data of the runs are written to an HDF5 file
+        instead; see :meth:`Broker.export_hdf5`.
+
         Parameters
         ----------
         headers : databroker.header
             one or more run headers that are going to be exported
-        db : databroker.Broker
+        db : databroker.Broker or str
             an instance of databroker.Broker class that will be the target to
-            export info
+            export info, or the path of an HDF5 file
         new_root : str
             optional. root directory of files that are going to
             be exported
@@ -737,6 +926,10 @@ class Broker:
             list of (old_file_path, new_file_path) pairs generated by
             ``copy_files`` method on Registry.
         """
+        if isinstance(db, (str, os.PathLike)):
+            self.export_hdf5(headers, db)
+            return []
+
         if copy_kwargs is None:
             copy_kwargs = {}
 
@@ -760,6 +953,58 @@ class Broker:
                     db.insert(name, doc)
         return file_pairs
 
+    def export_hdf5(self, headers, filename, stream_names=None):
+        """
+        Write the data of a list of runs to an HDF5 file.
+
+        Each run is a group named by its uid, with a group per stream holding
+        the columns (data, timestamps and time) as chunked, compressed
+        datasets; the documents are stored as JSON attributes. See
+        ``bluesky_tiled_plugins.exporters.HDF5RunWriter`` for the layout, which
+        is the same as that of the HDF5 export of the server.
+
+        The columns are read in slabs of whole chunks, so externally stored
+        data (e.g. detector images) are copied with bounded memory and without
+        reading them frame by frame.
+
+        Parameters
+        ----------
+        headers : Header or iterable of Headers
+            The runs to export
+        filename : str
+            Path of the HDF5 file; it is overwritten if it exists
+        stream_names : list, optional
+            Names of the streams to export; all by default
+        """
+        import h5py
+        from bluesky_tiled_plugins.exporters import HDF5RunWriter
+
+        headers = _ensure_list(headers)
+        with h5py.File(filename, "w") as h5file:
+            writer = HDF5RunWriter(h5file)
+            for header in headers:
+                run = self._catalog[header.start["uid"]]
+                writer.write_run(header.start, header.stop)
+                for stream_name in stream_names or list(run):
+                    descriptors = [d for d in header.descriptors if d.get("name") == stream_name]
+                    if not descriptors:
+                        continue
+                    updates = [
+                        {"uid": d["uid"], "time": d["time"], "configuration": d.get("configuration", {})}
+                        for d in descriptors[1:]
+                    ]
+                    writer.write_stream(stream_name, dict(descriptors[0]), updates)
+                    stream = run[stream_name]
+                    for container_name in ("data", "timestamps"):
+                        container = stream[container_name]
+                        for key in container:
+                            array = container[key]
+                            if container_name == "timestamps" and key != "time" and not key.startswith("ts_"):
+                                key = f"ts_{key}"
+                            chunk_rows = array.chunks[0][0] if array.chunks and array.chunks[0] else 1
+                            for start, stop in writer.slabs(array.shape, array.dtype, chunk_rows):
+                                writer.write(stream_name, key, np.asarray(array[start:stop]), start)
+
     def export_size(self, headers):
         """
         Get the size of files associated with a list of headers.
@@ -818,6 +1063,39 @@ class Broker:
         return self.v2.stats()
 
 
+def _process_documents(factory, pages):
+    "Pass the pages of documents of one header, until None, into a new callback; this runs in a worker process."
+    callback = factory()
+    for page in iter(pages.get, None):
+        for name, doc in page:
+            callback(name, doc)
+    return callback
+
+
+def _stack_arrays(table, results):
+    """
+    Stack the multidimensional fields read by get_table, and return them by name.
+
+    The arrays are returned rather than stored in ``table.attrs``, which pandas
+    copies along with the table on most operations. Fields that cannot be
+    stacked (they are missing or have different shapes in some headers) are
+    added to the table as columns of per-row arrays instead.
+    """
+    stacked = {}
+    names = {name: None for _, arrays in results for name in arrays}
+    for name in names:
+        parts = [arrays.get(name) for _, arrays in results]
+        if all(part is not None for part in parts) and len({part.shape[1:] for part in parts}) == 1:
+            stacked[name] = np.concatenate(parts)
+        else:
+            table[name] = [
+                row
+                for (df, _), part in zip(results, parts)
+                for row in (list(part) if part is not None else [None] * len(df))
+            ]
+    return stacked
+
+
 class Header:
     """
     This supports the original Header API but implemplemented on new code..
@@ -1030,10 +1308,14 @@ class Header:
         for payload in gen:
             yield payload
 
-    def data(self, field, stream_name="primary", fill=True):
+    def data(self, field, stream_name="primary", fill=True, block_size=None, prefetch=True):
         """
         Extract data for one field. This is convenient for loading image data.
 
+        The data are read in blocks of rows, and the values of each block are
+        yielded as soon as it arrives, so the memory used is proportional to
+        the block size rather than to the length of the stream.
+
         Parameters
         ----------
         field : string
@@ -1045,14 +1327,53 @@ class Header:
         fill : bool, optional
              If the data should be filled.
 
+        block_size : int, optional
+            Number of rows read at once. By default, the size of the chunks
+            of the data along the first dimension.
+
+        prefetch : bool, optional
+            If True (default), read the next block in a background thread
+            while the values of the current one are consumed.
+
         Yields
         ------
         data
         """
         if not fill:
             raise ValueError("Only fill=True is now supported by the data(...) method.")
-        for item in self._run[stream_name]["data"][field][:]:
-            yield item
+        stream = self._run[stream_name]
+        try:
+            array = stream["data"][field]
+        except KeyError:
+            # Streams without events may have no column for their fields.
+            if any(field in d["data_keys"] for d in stream.descriptors):
+                return
+            raise
+        num_rows = array.shape[0]
+        if block_size is None:
+            chunks = getattr(array, "chunks", None)
+            block_size = chunks[0][0] if chunks and chunks[0] and chunks[0][0] else num_rows
+        block_size = max(1, block_size)
+        blocks = [(start, min(start + block_size, num_rows)) for start in range(0, num_rows, block_size)]
+
+        def read(block):
+            start, stop = block
+            return array[start:stop]
+
+        if not blocks:
+            return
+        if not prefetch:
+            for block in blocks:
+                yield from read(block)
+            return
+        # At most two blocks are in memory: the current one and the next one,
+        # being read in the background.
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            future = executor.submit(read, blocks[0])
+            for next_block in blocks[1:] + [None]:
+                values = future.result()
+                future = executor.submit(read, next_block) if next_block is not None else None
+                yield from values
 
     def stream(self, *args, **kwargs):
         warnings.warn(
@@ -1261,6 +1582,12 @@ class Results:
             yield Header(run, self._broker)
 
 
+def _supports_query(catalog, name):
+    "Whether the server of the catalog has a query registered under the given name"
+    server_info = getattr(getattr(catalog, "context", None), "server_info", None)
+    return name in (getattr(server_info, "queries", None) or ())
+
+
 def _ensure_list(headers):
     try:
         headers.items()